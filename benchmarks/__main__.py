@@ -0,0 +1,37 @@
+"""
+Runs the benchmark suites and writes the results as JSON.
+
+Usage:
+    python -m benchmarks [output.json] [--quick]
+"""
+
+import sys
+
+from engine import LogLevel, set_level
+from . import bench_midi, bench_render, bench_tracks, bench_wav
+from .harness import write_results
+
+SUITES = [bench_render, bench_wav, bench_tracks, bench_midi]
+
+
+def main(*args):
+    # Benchmark the hot paths the way they run in production.
+    set_level(LogLevel.WARN)
+
+    quick = "--quick" in args
+    args = [arg for arg in args if not arg.startswith("--")]
+
+    filename = "bench_output.json"
+    if len(args) > 0:
+        filename = args[0]
+
+    results = []
+    for suite in SUITES:
+        for result in suite.run(quick):
+            print(result)
+            results.append(result)
+
+    write_results(results, filename)
+    print(f"Wrote {len(results)} results to {filename}")
+
+main(*sys.argv[1:])
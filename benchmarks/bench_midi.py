@@ -0,0 +1,64 @@
+"""
+Benchmarks for importing MIDI files.
+"""
+
+from .harness import Result, measure
+
+from engine.tracks import read_midi
+
+import numpy as np
+import os
+import struct
+import tempfile
+
+SAMPLE_RATE = 22050
+
+
+def make_midi(filename: str, num_tracks: int, notes_per_track: int):
+    """
+    Writes a MIDI file of random sixteenth notes, with running status and a
+    tempo change every bar.
+    """
+    rng = np.random.default_rng(0)
+    with open(filename, "wb") as f:
+        f.write(b"MThd" + struct.pack(">IHHH", 6, 1, num_tracks + 1, 480))
+
+        # A bar of sixteenths is 1920 ticks, which is 0x8f 0x00 as a
+        # variable-length quantity.
+        conductor = bytearray()
+        for i in range(notes_per_track // 16):
+            tempo = 500000 + 1000 * (i % 50)
+            conductor += b"\x8f\x00\xff\x51\x03" + tempo.to_bytes(3, "big")
+        conductor += b"\x00\xff\x2f\x00"
+        f.write(b"MTrk" + struct.pack(">I", len(conductor)) + conductor)
+
+        for _ in range(num_tracks):
+            keys = rng.integers(36, 96, notes_per_track)
+            events = bytearray(b"\x00\x90")
+            for key in keys.tolist():
+                # On, then off with a zero velocity a sixteenth later.
+                events += bytes((key, 100, 0x78, key, 0, 0))
+            events += b"\xff\x2f\x00"
+            f.write(b"MTrk" + struct.pack(">I", len(events)) + events)
+
+
+def bench_import(filename: str, num_events: int) -> Result:
+    """
+    Imports a MIDI file into CustomNotesTracks.
+    """
+    return Result("midi",
+                  "import",
+                  {"events": num_events},
+                  measure(lambda: read_midi(filename, SAMPLE_RATE)),
+                  0,
+                  SAMPLE_RATE)
+
+
+def run(quick: bool) -> list:
+    num_tracks = 4
+    notes_per_track = 2500 if quick else 12500
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "song.mid")
+        make_midi(filename, num_tracks, notes_per_track)
+        return [bench_import(filename, 2 * num_tracks * notes_per_track)]
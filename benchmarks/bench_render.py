@@ -0,0 +1,225 @@
+"""
+Benchmarks for the mixer and Note synthesis.
+"""
+
+from .harness import Result, measure
+
+from engine.player import Limiter
+from engine.player.player import MIXER_FLOAT, MIXER_NUMPY, MIXER_PYTHON, \
+    WaveCollapser
+from engine.tracks import Track
+from engine.waves import NOTE_CACHE, Note, SampledInstrument, WavWriter, \
+    sine_bank
+from engine.waves.notes import NOTES
+
+import numpy as np
+import os
+import random
+import tempfile
+
+SAMPLE_RATE = 22050
+NOTE_DURATION = 0.25
+VOLUME = 0.3
+
+
+def make_track(num_notes: int, polyphony: int, seed=0) -> Track:
+    """
+    Creates a track of random notes, polyphony notes at a time.
+    """
+    rng = random.Random(seed)
+    pitches = [note for note in NOTES if note != "REST"]
+
+    track = Track("bench", sample_rate=SAMPLE_RATE)
+    for i in range(num_notes):
+        track.add_waveform((i // polyphony) * NOTE_DURATION,
+                           Note(rng.choice(pitches), NOTE_DURATION, SAMPLE_RATE))
+    return track
+
+
+def bench_collapse(num_notes: int,
+                   polyphony: int,
+                   sample_width: int,
+                   seconds: int,
+                   mixer=MIXER_NUMPY,
+                   limiter=None) -> Result:
+    """
+    Renders a window of 1 second chunks from the middle of a random track.
+    """
+    track = make_track(num_notes, polyphony)
+    wave_collapser = WaveCollapser(list(track.waveforms),
+                                   SAMPLE_RATE,
+                                   sample_width,
+                                   mixer=mixer,
+                                   limiter=limiter)
+
+    duration = wave_collapser.end_time
+    t0 = float(int(max(0.0, duration / 2 - seconds / 2)))
+    seconds = min(seconds, int(duration))
+
+    def render():
+        for i in range(seconds):
+            wave_collapser.collapse(t0 + i, 1.0, VOLUME)
+
+    return Result("render",
+                  "collapse",
+                  {
+                      "notes": num_notes,
+                      "polyphony": polyphony,
+                      "sample_width": sample_width,
+                      "mixer": mixer,
+                      "limiter": limiter is not None,
+                  },
+                  measure(render),
+                  seconds * SAMPLE_RATE,
+                  SAMPLE_RATE)
+
+
+def bench_index(num_notes: int) -> Result:
+    """
+    Builds the active-wave index of a WaveCollapser.
+    """
+    waveforms = list(make_track(num_notes, 4).waveforms)
+
+    def build():
+        WaveCollapser(waveforms, SAMPLE_RATE, 16)
+
+    return Result("render",
+                  "index",
+                  {"notes": num_notes},
+                  measure(build),
+                  0,
+                  SAMPLE_RATE)
+
+
+def bench_note_frames(num_notes: int, warm: bool) -> Result:
+    """
+    Gets the frames of whole notes, with a cold or a warm Note cache.
+    """
+    notes = make_track(num_notes, 1).waveforms
+    notes = [wave.waveform for wave in notes]
+
+    def get_frames():
+        if not warm:
+            NOTE_CACHE.clear()
+        for note in notes:
+            note.get_frames(0, note.num_samples, 16, VOLUME)
+
+    return Result("render",
+                  "note_frames",
+                  {"notes": num_notes, "cache": "warm" if warm else "cold"},
+                  measure(get_frames),
+                  sum(note.num_samples for note in notes),
+                  SAMPLE_RATE)
+
+
+def bench_sine_bank(voices: int, voice_length: int, bank: bool) -> Result:
+    """
+    Synthesizes a chunk of sine voices, together on the oscillator bank or one
+    voice at a time.
+    """
+    rng = random.Random(0)
+    freqs = [rng.uniform(50.0, 2000.0) for _ in range(voices)]
+    interval_starts = [rng.randrange(SAMPLE_RATE - voice_length + 1)
+                       for _ in range(voices)]
+    wave_starts = [rng.randrange(SAMPLE_RATE) for _ in range(voices)]
+    wave_ends = [start + voice_length for start in wave_starts]
+
+    def synthesize():
+        if bank:
+            sine_bank(freqs, interval_starts, wave_starts, wave_ends,
+                      SAMPLE_RATE, SAMPLE_RATE)
+            return
+
+        for i in range(voices):
+            sine_bank(freqs[i:i + 1], interval_starts[i:i + 1],
+                      wave_starts[i:i + 1], wave_ends[i:i + 1],
+                      SAMPLE_RATE, SAMPLE_RATE)
+
+    return Result("render",
+                  "sine_bank",
+                  {"voices": voices, "length": voice_length, "bank": bank},
+                  measure(synthesize),
+                  voices * voice_length,
+                  SAMPLE_RATE)
+
+
+def bench_sampled_notes(num_notes: int, sampled: bool, warm: bool) -> Result:
+    """
+    Gets the float samples of random notes, played by a sampled instrument
+    with a one second recording, or by sine notes.
+    """
+    rng = random.Random(0)
+    pitches = [note for note in NOTES if note != "REST"]
+    pitches = [rng.choice(pitches) for _ in range(num_notes)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        filename = os.path.join(tmp, "root.wav")
+        t = np.arange(SAMPLE_RATE) / SAMPLE_RATE
+        samples = np.sin(2 * np.pi * 440 * t) * np.exp(-3 * t) * 16384
+        with WavWriter(filename, SAMPLE_RATE, 16) as writer:
+            writer.write(samples.astype("<i2").tobytes())
+
+        class Instrument(SampledInstrument):
+            roots = {"A4": filename}
+
+        if sampled:
+            notes = [Instrument(pitch, NOTE_DURATION, SAMPLE_RATE)
+                     for pitch in pitches]
+        else:
+            notes = [Note(pitch, NOTE_DURATION, SAMPLE_RATE)
+                     for pitch in pitches]
+
+        def get_samples():
+            if not warm:
+                NOTE_CACHE.clear()
+            for note in notes:
+                note.get_samples(0, note.num_samples)
+
+        seconds = measure(get_samples)
+
+    return Result("render",
+                  "note_samples",
+                  {
+                      "notes": num_notes,
+                      "instrument": "sampled" if sampled else "sine",
+                      "cache": "warm" if warm else "cold",
+                  },
+                  seconds,
+                  sum(note.num_samples for note in notes),
+                  SAMPLE_RATE)
+
+
+def run(quick: bool) -> list:
+    if quick:
+        note_counts, polyphonies, widths, seconds = \
+            (1000, 10000), (1, 16), (16,), 2
+    else:
+        note_counts, polyphonies, widths, seconds = \
+            (1000, 10000, 100000), (1, 4, 16, 64), (8, 16, 24), 10
+
+    results = []
+    for num_notes in note_counts:
+        results.append(bench_collapse(num_notes, 4, 16, seconds))
+        results.append(bench_index(num_notes))
+    for polyphony in polyphonies:
+        results.append(bench_collapse(10000, polyphony, 16, seconds))
+        results.append(bench_collapse(10000, polyphony, 16, seconds,
+                                      mixer=MIXER_FLOAT))
+    results.append(bench_collapse(10000, 16, 16, seconds,
+                                  mixer=MIXER_FLOAT, limiter=Limiter()))
+    for sample_width in widths:
+        results.append(bench_collapse(10000, 4, sample_width, seconds))
+
+    # The reference mixer is slow, so only compare at a small scale.
+    results.append(bench_collapse(1000, 4, 16, 1, mixer=MIXER_PYTHON))
+
+    for warm in (False, True):
+        results.append(bench_note_frames(1000, warm))
+        for sampled in (False, True):
+            results.append(bench_sampled_notes(1000, sampled, warm))
+
+    for voices, voice_length in ((4, SAMPLE_RATE), (64, 500)):
+        for bank in (False, True):
+            results.append(bench_sine_bank(voices, voice_length, bank))
+
+    return results
@@ -0,0 +1,99 @@
+"""
+Benchmarks for building tracks.
+"""
+
+from .harness import Result, measure
+
+from engine.tracks import EventTrack, MergedTimeline, Track
+from engine.waves import Note
+
+import numpy as np
+
+SAMPLE_RATE = 22050
+
+
+def make_tracks(num_tracks: int, notes_per_track: int) -> list:
+    tracks = []
+    for i in range(num_tracks):
+        track = Track(str(i), sample_rate=SAMPLE_RATE)
+        for j in range(notes_per_track):
+            track.add_waveform(j * 0.25, Note("A4", 0.25, SAMPLE_RATE))
+        tracks.append(track)
+    return tracks
+
+
+def bench_add(num_tracks: int, notes_per_track: int) -> Result:
+    """
+    Sums num_tracks tracks together with Track.__add__.
+    """
+    return Result("tracks",
+                  "add",
+                  {"tracks": num_tracks, "notes_per_track": notes_per_track},
+                  measure(sum,
+                          setup=lambda: make_tracks(num_tracks,
+                                                    notes_per_track)),
+                  0,
+                  SAMPLE_RATE)
+
+
+def bench_merge(num_tracks: int, notes_per_track: int) -> Result:
+    """
+    Merges num_tracks tracks into a timeline, the same way Player does.
+    """
+    tracks = make_tracks(num_tracks, notes_per_track)
+
+    def merge():
+        for wave in MergedTimeline(tracks):
+            pass
+
+    return Result("tracks",
+                  "merge",
+                  {"tracks": num_tracks, "notes_per_track": notes_per_track},
+                  measure(merge),
+                  0,
+                  SAMPLE_RATE)
+
+
+def bench_build(num_notes: int, store: str) -> Result:
+    """
+    Builds a track of num_notes notes. store is "track" for a Note per event
+    in a Track, "events" for one add_note() per event in an EventTrack, or
+    "bulk" for a single add_notes() call.
+    """
+    def build():
+        if store == "track":
+            track = Track("", sample_rate=SAMPLE_RATE)
+            for i in range(num_notes):
+                track.add_waveform(i * 0.25, Note("A4", 0.25, SAMPLE_RATE))
+        elif store == "events":
+            track = EventTrack("", sample_rate=SAMPLE_RATE)
+            for i in range(num_notes):
+                track.add_note(i * 0.25, 0.25, 440.0)
+        else:
+            track = EventTrack("", sample_rate=SAMPLE_RATE)
+            length = SAMPLE_RATE // 4
+            track.add_notes(np.arange(num_notes) * length,
+                            np.full(num_notes, length),
+                            np.full(num_notes, 440.0))
+        return track
+
+    return Result("tracks",
+                  "build",
+                  {"notes": num_notes, "store": store},
+                  measure(build),
+                  0,
+                  SAMPLE_RATE)
+
+
+def run(quick: bool) -> list:
+    sizes = ((4, 1000), (16, 1000)) if quick else \
+        ((4, 1000), (16, 10000), (64, 10000))
+
+    results = []
+    for num_tracks, notes in sizes:
+        results.append(bench_add(num_tracks, notes))
+        results.append(bench_merge(num_tracks, notes))
+
+    for store in ("track", "events", "bulk"):
+        results.append(bench_build(10000 if quick else 100000, store))
+    return results
@@ -0,0 +1,212 @@
+"""
+Benchmarks for importing .wav files.
+"""
+
+from .harness import Result, measure
+
+from engine.tracks import ImportedAudioTrack
+from engine.waves import AssetRegistry, SampleLibrary, WavFile, WavReader, \
+    WavWriter, resample
+from engine.waves.resample import get_resampler
+
+import numpy as np
+import os
+import tempfile
+
+SAMPLE_RATE = 22050
+
+
+def make_wav(filename: str, seconds: int, bit_width: int):
+    """
+    Writes a .wav file of noise, one second at a time.
+    """
+    rng = np.random.default_rng(0)
+    byte_width = bit_width // 8
+    with WavWriter(filename, SAMPLE_RATE, bit_width) as writer:
+        for _ in range(seconds):
+            writer.write(
+                rng.integers(0, 256, SAMPLE_RATE * byte_width,
+                             dtype=np.uint8).tobytes())
+
+
+def bench_get_frames(filename: str, bit_width: int, memory_map: bool) -> Result:
+    """
+    Reads every full second of a long .wav file.
+    """
+    wav = WavFile(filename, memory_map=memory_map)
+
+    seconds = int(wav.duration)
+
+    def read():
+        for i in range(seconds):
+            wav.get_frames(i * SAMPLE_RATE,
+                           (i + 1) * SAMPLE_RATE,
+                           bit_width,
+                           1.0)
+
+    return Result("wav",
+                  "get_frames",
+                  {
+                      "seconds": seconds,
+                      "bit_width": bit_width,
+                      "memory_map": memory_map,
+                  },
+                  measure(read),
+                  seconds * SAMPLE_RATE,
+                  SAMPLE_RATE)
+
+
+def bench_stream(filename: str, bit_width: int) -> Result:
+    """
+    Streams a long .wav file as float samples, the way a pipe is imported.
+    """
+    def stream():
+        with WavReader(filename) as reader:
+            for samples in reader.samples():
+                pass
+
+    seconds = int(WavFile(filename).duration)
+    return Result("wav",
+                  "stream",
+                  {"seconds": seconds, "bit_width": bit_width},
+                  measure(stream),
+                  seconds * SAMPLE_RATE,
+                  SAMPLE_RATE)
+
+
+def bench_header(filename: str, count: int) -> Result:
+    """
+    Opens and parses the header of a .wav file count times.
+    """
+    def parse():
+        for _ in range(count):
+            WavFile(filename)
+
+    return Result("wav",
+                  "header",
+                  {"files": count},
+                  measure(parse),
+                  0,
+                  SAMPLE_RATE)
+
+
+def bench_triggers(filename: str, count: int, shared: bool) -> Result:
+    """
+    Adds the same .wav file to a track count times, like a drum pattern, and
+    reads every trigger back as float samples.
+    """
+    def trigger():
+        assets = AssetRegistry(1 << 30) if shared else None
+        track = ImportedAudioTrack("", sample_rate=SAMPLE_RATE, assets=assets)
+        for i in range(count):
+            track.add_wav_file(i * 0.5, filename)
+        for wave in track.waveforms:
+            wave.waveform.get_samples(0, SAMPLE_RATE)
+
+    return Result("wav",
+                  "triggers",
+                  {"triggers": count, "shared": shared},
+                  measure(trigger),
+                  count * SAMPLE_RATE,
+                  SAMPLE_RATE)
+
+
+def bench_resample(filename: str, to_rate: int, block_size: int) -> Result:
+    """
+    Converts a long .wav file to another sample rate, either all at once like
+    an import, or a block at a time like the output stage.
+    """
+    wav = WavFile(filename)
+    samples = wav.get_samples(0, wav.num_samples)
+    resampler = get_resampler(SAMPLE_RATE, to_rate)
+
+    # Blocks read the inputs around them, which are zeros past either end.
+    padding = np.zeros(resampler.half_width + 1, dtype=np.float32)
+    padded = np.concatenate((padding, samples, padding))
+    num_outputs = resampler.num_outputs(len(samples))
+
+    def convert():
+        if block_size is None:
+            resample(samples, SAMPLE_RATE, to_rate)
+            return
+
+        for start_output in range(0, num_outputs, block_size):
+            count = min(block_size, num_outputs - start_output)
+            first_input, end_input = resampler.input_range(start_output, count)
+            resampler.process(padded[first_input + len(padding):
+                                     end_input + len(padding)],
+                              first_input,
+                              start_output,
+                              count)
+
+    return Result("wav",
+                  "resample",
+                  {
+                      "seconds": int(wav.duration),
+                      "to_rate": to_rate,
+                      "block_size": block_size,
+                  },
+                  measure(convert),
+                  len(samples),
+                  SAMPLE_RATE)
+
+
+def bench_library(directory: str, count: int, rescan: bool) -> Result:
+    """
+    Indexes a library of count short .wav files, either from scratch or by
+    rescanning an up to date index.
+    """
+    library_dir = os.path.join(directory, "library")
+    for i in range(count):
+        subdirectory = os.path.join(library_dir, str(i % 100))
+        os.makedirs(subdirectory, exist_ok=True)
+        with WavWriter(os.path.join(subdirectory, f"{i}.wav"),
+                       SAMPLE_RATE,
+                       16) as writer:
+            writer.write(b"\x00" * 64)
+
+    index_file = os.path.join(directory, "library.json")
+    if rescan:
+        SampleLibrary(index_file).scan([library_dir])
+
+    def scan():
+        if not rescan and os.path.exists(index_file):
+            os.remove(index_file)
+        SampleLibrary(index_file).scan([library_dir])
+
+    return Result("wav",
+                  "library",
+                  {"files": count, "rescan": rescan},
+                  measure(scan),
+                  0,
+                  SAMPLE_RATE)
+
+
+def run(quick: bool) -> list:
+    seconds = 60 if quick else 600
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for bit_width in (16, 24):
+            filename = os.path.join(tmp, f"long_{bit_width}.wav")
+            make_wav(filename, seconds, bit_width)
+            for memory_map in (False, True):
+                results.append(
+                    bench_get_frames(filename, bit_width, memory_map))
+            results.append(bench_stream(filename, bit_width))
+
+        results.append(bench_header(filename, 100 if quick else 1000))
+
+        for to_rate in (44100, 48000):
+            for block_size in (None, 512, 48000):
+                results.append(bench_resample(filename, to_rate, block_size))
+
+        for shared in (False, True):
+            results.append(
+                bench_triggers(filename, 200 if quick else 2000, shared))
+
+        for rescan in (False, True):
+            results.append(
+                bench_library(tmp, 1000 if quick else 10000, rescan))
+
+    return results
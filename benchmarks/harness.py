@@ -0,0 +1,107 @@
+"""
+Minimal benchmark harness. Each benchmark records its wall time along with the
+amount of audio it processed, from which samples/sec and the real-time factor
+are derived.
+"""
+
+import json
+import platform
+import time
+
+
+class Result(object):
+    """
+    The outcome of a single benchmark.
+    """
+
+    def __init__(self,
+                 suite: str,
+                 name: str,
+                 params: dict,
+                 seconds: float,
+                 num_samples: int,
+                 sample_rate: int):
+        """
+        Args:
+            suite: The suite the benchmark belongs to.
+            name: The name of the benchmark.
+            params: The workload parameters.
+            seconds: The best wall time, in seconds.
+            num_samples: The number of samples processed.
+            sample_rate: The sample rate of the processed audio.
+        """
+        self.suite = suite
+        self.name = name
+        self.params = params
+        self.seconds = seconds
+        self.num_samples = num_samples
+        self.sample_rate = sample_rate
+
+    @property
+    def samples_per_sec(self) -> float:
+        return self.num_samples / self.seconds if self.seconds > 0 else 0.0
+
+    @property
+    def real_time_factor(self) -> float:
+        """
+        Seconds of audio processed per second of wall time. Above 1.0 is
+        faster than real time.
+        """
+        return self.samples_per_sec / self.sample_rate
+
+    def to_dict(self) -> dict:
+        return {
+            "suite": self.suite,
+            "name": self.name,
+            "params": self.params,
+            "seconds": self.seconds,
+            "samples": self.num_samples,
+            "samples_per_sec": self.samples_per_sec,
+            "real_time_factor": self.real_time_factor,
+        }
+
+    def __str__(self):
+        params = ", ".join(f"{k}={v}" for k, v in self.params.items())
+        line = f"{self.suite}.{self.name}({params}): " + \
+            f"{self.seconds * 1000:.2f}ms"
+        if self.num_samples > 0:
+            line += f", {self.samples_per_sec:,.0f} samples/sec, " + \
+                f"{self.real_time_factor:.1f}x real time"
+        return line
+
+
+def measure(func, repeat=3, setup=None) -> float:
+    """
+    Calls func repeat times and returns the best wall time, in seconds.
+
+    Args:
+        func: The function to time.
+        repeat: The number of times to call func.
+        setup: If set, called before each untimed call and its result is
+               passed to func.
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        args = () if setup is None else (setup(),)
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def write_results(results: list, filename: str):
+    """
+    Writes results as JSON so that runs can be compared between releases.
+
+    Args:
+        results: A list of Results.
+        filename: The JSON file to write.
+    """
+    report = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "timestamp": time.time(),
+        "results": [result.to_dict() for result in results],
+    }
+    with open(filename, "w") as f:
+        json.dump(report, f, indent=2)
@@ -4,5 +4,9 @@ from .debug import (
     debug,
     info,
     warn,
-    error
+    error,
+    is_enabled,
+    set_level,
+    get_level,
+    configure_from_args
 )
\ No newline at end of file
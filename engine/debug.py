@@ -1,10 +1,10 @@
 """
-Debug/logging interface. This file will automatically parse command line
-elements when loaded into a module to determine the correct log level.
+Debug/logging interface. Messages are formatted lazily, so logging below the
+current log level costs next to nothing. The log level may be set
+programmatically with set_level() or from command line arguments with
+configure_from_args().
 """
 
-import sys
-
 from datetime import datetime
 from enum import IntEnum
 
@@ -19,68 +19,121 @@ class LogLevel(IntEnum):
 
 LOG_LEVEL = LogLevel.DEBUG
 """
-The log level. Defaults to DEBUG unless the log level is provided as a command
-line argument.
+The log level. Defaults to DEBUG unless configured with set_level() or
+configure_from_args().
 """
 
-def log(level: LogLevel, msg: str):
+def set_level(level: LogLevel):
     """
-    Log a message at the specified log level (engine.LogLevel).
+    Set the log level.
+
+    Args:
+        level: Messages below this level will not be printed.
+    """
+    global LOG_LEVEL
+    LOG_LEVEL = level
+
+def get_level() -> LogLevel:
+    """
+    Returns the current log level.
+    """
+    return LOG_LEVEL
+
+def is_enabled(level: LogLevel) -> bool:
+    """
+    Whether messages at the given level will be printed. Use this to guard
+    logging in hot loops, so that not even the arguments get evaluated:
+
+        >>> if is_enabled(LogLevel.DEBUG):
+        ...     debug("Playing wave: {}", describe(wave))
 
     Args:
         level: The log level.
-        msg: The message to log.
+    """
+    return level >= LOG_LEVEL
+
+def _format(msg, args: tuple) -> str:
+    """
+    Formats a message. msg may either be a string, which is formatted with
+    str.format(*args), or a callable which returns the message.
+    """
+    if callable(msg):
+        return msg()
+    elif len(args) > 0:
+        return msg.format(*args)
+    return msg
+
+def log(level: LogLevel, msg, *args):
+    """
+    Log a message at the specified log level (engine.LogLevel). The message is
+    only formatted if it will be printed.
+
+    Args:
+        level: The log level.
+        msg: The message to log. Either a string, formatted with
+             str.format(*args), or a callable which returns the message.
+        args: Arguments to format the message with.
     """
     if level >= LOG_LEVEL:
         now = datetime.now()
-        print(f"{now.isoformat()} [{repr(level)}]: " + msg)
+        print(f"{now.isoformat()} [{repr(level)}]: " + _format(msg, args))
 
-def debug(msg: str):
+def debug(msg, *args):
     """
     Log a message at the debug level. Will not print if LOG_LEVEL > DEBUG.
 
     Args:
-        msg: The message to log.
+        msg: The message to log. See log().
+        args: Arguments to format the message with.
     """
-    log(LogLevel.DEBUG, msg)
+    log(LogLevel.DEBUG, msg, *args)
 
-def info(msg: str):
+def info(msg, *args):
     """
     Log a message at the info level. Will not print if LOG_LEVEL > INFO.
 
     Args:
-        msg: The message to log.
+        msg: The message to log. See log().
+        args: Arguments to format the message with.
     """
-    log(LogLevel.INFO, msg)
+    log(LogLevel.INFO, msg, *args)
 
-def warn(msg: str):
+def warn(msg, *args):
     """
     Log a message at the warn level. Will not print if LOG_LEVEL > WARN.
 
     Args:
-        msg: The message to log.
+        msg: The message to log. See log().
+        args: Arguments to format the message with.
     """
-    log(LogLevel.WARN, msg)
+    log(LogLevel.WARN, msg, *args)
 
-def error(msg: str):
+def error(msg, *args):
     """
     Always print errors.
 
     Args:
-        msg: The message to log.
-    """
-    print(msg)
-
-# Pick the log level from command line arguments. If multiple are specified,
-# this will choose the last one specified.
-for arg in sys.argv:
-    if arg == "--debug":
-        LOG_LEVEL = LogLevel.DEBUG
-    elif arg == "--info":
-        LOG_LEVEL = LogLevel.INFO
-    elif arg == "--warn":
-        LOG_LEVEL = LogLevel.WARN
-    elif arg == "--error":
-        LOG_LEVEL = LogLevel.ERROR
-
-info(f"Logging at: {str(LOG_LEVEL)}")
\ No newline at end of file
+        msg: The message to log. See log().
+        args: Arguments to format the message with.
+    """
+    print(_format(msg, args))
+
+def configure_from_args(argv: list):
+    """
+    Pick the log level from command line arguments. If multiple are
+    specified, this will choose the last one specified.
+
+    Args:
+        argv: The command line arguments, e.g. sys.argv.
+    """
+    for arg in argv:
+        if arg == "--debug":
+            set_level(LogLevel.DEBUG)
+        elif arg == "--info":
+            set_level(LogLevel.INFO)
+        elif arg == "--warn":
+            set_level(LogLevel.WARN)
+        elif arg == "--error":
+            set_level(LogLevel.ERROR)
+
+    info("Logging at: {}", LOG_LEVEL)
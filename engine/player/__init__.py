@@ -1 +1,12 @@
 from .player import Player
+from .freeze import FrozenWave, TrackCache
+from .limiter import Limiter
+from .sinks import (
+    Sink,
+    PyAudioSink,
+    NullSink,
+    MemorySink,
+    PipeSink,
+    WavSink,
+    TeeSink
+)
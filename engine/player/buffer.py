@@ -0,0 +1,161 @@
+"""
+Render-ahead buffering. A background worker renders chunks into a bounded ring
+buffer while the audio thread drains it, so that rendering and device I/O
+overlap.
+"""
+
+from engine import debug
+
+from threading import Condition, Thread
+
+class RingBuffer(object):
+    """
+    Bounded, thread-safe FIFO of rendered chunks with a fixed number of slots.
+
+    Counts underruns (the consumer had to wait for a chunk) and overruns (the
+    producer had to wait for a free slot). Waiting for the very first chunk
+    isn't an underrun, since nothing is playing yet.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        Create an empty ring buffer.
+
+        Args:
+            capacity: The number of chunks the buffer can hold.
+        """
+        if capacity < 1:
+            raise ValueError(f"capacity must be positive, but was: {capacity}")
+
+        self.capacity = capacity
+        self.underruns = 0
+        self.overruns = 0
+        self.closed = False
+
+        self._slots = [None] * capacity
+        self._read_idx = 0
+        self._count = 0
+        self._started = False
+        self._cond = Condition()
+
+    def __len__(self):
+        return self._count
+
+    def put(self, item) -> bool:
+        """
+        Add an item to the buffer, waiting for a free slot if it's full.
+
+        Args:
+            item: The item to add.
+
+        Returns:
+            False if the buffer was closed before the item could be added.
+        """
+        with self._cond:
+            if self._count == self.capacity and not self.closed:
+                self.overruns += 1
+            while self._count == self.capacity and not self.closed:
+                self._cond.wait()
+
+            if self.closed:
+                return False
+
+            write_idx = (self._read_idx + self._count) % self.capacity
+            self._slots[write_idx] = item
+            self._count += 1
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """
+        Remove the oldest item from the buffer, waiting for one if it's empty.
+
+        Args:
+            timeout: The maximum number of seconds to wait, or None to wait
+                     forever.
+
+        Returns:
+            The item, or None if the buffer was closed or the wait timed out.
+        """
+        with self._cond:
+            if self._count == 0 and self._started and not self.closed:
+                self.underruns += 1
+            if not self._cond.wait_for(
+                    lambda: self._count > 0 or self.closed, timeout):
+                return None
+
+            if self._count == 0:
+                return None
+
+            item = self._slots[self._read_idx]
+            self._slots[self._read_idx] = None
+            self._read_idx = (self._read_idx + 1) % self.capacity
+            self._count -= 1
+            self._started = True
+            self._cond.notify_all()
+            return item
+
+    def close(self):
+        """
+        Close the buffer. Wakes up any waiting producer or consumer.
+        """
+        with self._cond:
+            self.closed = True
+            self._cond.notify_all()
+
+
+class RenderWorker(Thread):
+    """
+    Background thread which renders consecutive chunks from a WaveCollapser
+    into a RingBuffer. Puts None into the buffer once there is nothing left to
+    render.
+    """
+
+    def __init__(self,
+                 wave_collapser,
+                 ring_buffer: RingBuffer,
+                 chunk_size: float,
+                 get_volume):
+        """
+        Create a render worker. Call start() to begin rendering.
+
+        Args:
+            wave_collapser: The WaveCollapser to render.
+            ring_buffer: The buffer to fill with rendered chunks.
+            chunk_size: The duration of each chunk, in seconds.
+            get_volume: Returns the volume to render the next chunk at. Called
+                        once per chunk.
+        """
+        super().__init__(name="RenderWorker", daemon=True)
+
+        self.wave_collapser = wave_collapser
+        self.ring_buffer = ring_buffer
+        self.chunk_size = chunk_size
+        self.get_volume = get_volume
+        self.error = None
+
+    def run(self):
+        t = 0.0
+        try:
+            while not self.ring_buffer.closed:
+                samples = self.wave_collapser.collapse(t,
+                                                      self.chunk_size,
+                                                      self.get_volume())
+                if len(samples) == 0:
+                    break
+
+                if not self.ring_buffer.put(samples):
+                    return
+                t += self.chunk_size
+        except Exception as e:
+            self.error = e
+
+        debug("Render worker finished.")
+        self.ring_buffer.put(None)
+
+    def stop(self):
+        """
+        Stop rendering and wait for the worker to exit.
+        """
+        self.ring_buffer.close()
+        self.join()
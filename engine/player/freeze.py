@@ -0,0 +1,377 @@
+"""
+Track freezing. A frozen track is rendered once into a PCM file in a cache
+directory, keyed by a hash of its events, waveform parameters and sample
+format, and memory mapped on later runs. Mixing a frozen track is a plain
+buffer add.
+"""
+
+from engine import debug, info
+from engine.tracks import EventStore, MergedTimeline, Track
+from engine.waves import Waveform
+from engine.waves.waveform import VOLUME_BUCKETS
+from .player import CHUNK_SIZE, MIXER_FLOAT, MIXER_NUMPY, WaveCollapser
+
+import hashlib
+import numpy as np
+import os
+
+FROZEN_INT_DTYPE = "<i4"
+"""
+Tracks frozen for the integer mixers are stored as the unpacked sum of their
+frames, which fits in 32 bits for every supported width.
+"""
+
+FROZEN_FLOAT_DTYPE = "<f4"
+"""
+Tracks frozen for the float mixer are stored as the float mix bus at full
+volume, so the same render can be played at any volume and bit width.
+"""
+
+FREEZE_VERSION = 3
+"""
+Part of every cache key. Bump this whenever the rendering changes, so that
+stale renders are never used.
+"""
+
+
+class FrozenWave(Waveform):
+    """
+    The pre-mixed frames of a whole track, memory mapped from a cache file.
+    """
+
+    def __init__(self,
+                 filename: str,
+                 duration: float,
+                 sample_rate: int,
+                 mixer: str,
+                 sample_width: int,
+                 volume_bucket: int,
+                 track: Track):
+        """
+        Load a frozen track.
+
+        Args:
+            filename: The cache file.
+            duration: The duration of the original track.
+            sample_rate: The sample rate.
+            mixer: The mixer the track was rendered with.
+            sample_width: The bit width the track was rendered at.
+            volume_bucket: The volume bucket the track was rendered at.
+            track: The original track, used to render the track in other
+                   formats.
+        """
+        super().__init__(duration, sample_rate=sample_rate)
+
+        self.filename = filename
+        self.mixer = mixer
+        self.sample_width = sample_width
+        self.volume_bucket = volume_bucket
+        self.track = track
+        self._collapsers = {}
+        self._load()
+
+    def __getstate__(self):
+        # Reload the memory map on the other end instead of copying it.
+        state = self.__dict__.copy()
+        del state["samples"]
+        state["_collapsers"] = {}
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._load()
+
+    def _load(self):
+        if self.mixer == MIXER_FLOAT:
+            dtype = FROZEN_FLOAT_DTYPE
+        else:
+            dtype = FROZEN_INT_DTYPE
+
+        if os.path.getsize(self.filename) == 0:
+            self.samples = np.zeros(0, dtype=dtype)
+        else:
+            self.samples = np.memmap(self.filename, dtype=dtype, mode="r")
+
+    @property
+    def num_samples(self) -> int:
+        # The render is padded with silence up to a whole chunk.
+        return len(self.samples)
+
+    def fingerprint(self) -> tuple:
+        return ("FrozenWave", os.path.basename(self.filename))
+
+    def get_samples(self, start_sample: int, end_sample: int) -> np.ndarray:
+        """
+        Get the pre-mixed float samples of the track. If the track wasn't
+        frozen for the float mixer, the original track is rendered instead.
+
+        Args:
+            start_sample: The first sample (inclusive).
+            end_sample: The end sample (exclusive).
+
+        Return:
+            Numpy array of float samples.
+        """
+        if self.mixer == MIXER_FLOAT:
+            return self.samples[start_sample:end_sample]
+
+        return self._render(start_sample,
+                            end_sample,
+                            MIXER_FLOAT,
+                            self.sample_width,
+                            1.0)
+
+    def get_frames(self,
+                   start_sample: int,
+                   end_sample: int,
+                   bit_width: int,
+                   master_volume: float) -> np.ndarray:
+        """
+        Get the pre-mixed frames of the track. If the bit width or volume
+        differ from the ones the track was frozen at, the original track is
+        rendered instead.
+
+        Args:
+            start_sample: The first sample (inclusive).
+            end_sample: The end sample (exclusive).
+            bit_width: The bit width of each sample.
+            master_volume: The master volume to scale the wave by.
+
+        Return:
+            Numpy array of frames.
+        """
+        if self.mixer != MIXER_FLOAT and bit_width == self.sample_width and \
+                round(master_volume * VOLUME_BUCKETS) == self.volume_bucket:
+            return self.samples[start_sample:end_sample]
+
+        return self._render(start_sample,
+                            end_sample,
+                            MIXER_NUMPY,
+                            bit_width,
+                            master_volume)
+
+    def _render(self,
+                start_sample: int,
+                end_sample: int,
+                mixer: str,
+                bit_width: int,
+                volume: float) -> np.ndarray:
+        """
+        Mixes the original track from [start_sample, end_sample). The
+        WaveCollapser of each format is built once and reused for every chunk.
+        """
+        wave_collapser = self._collapsers.get((mixer, bit_width))
+        if wave_collapser is None:
+            debug("Rendering frozen track {} unfrozen.", self.track.name)
+            wave_collapser = WaveCollapser(MergedTimeline([self.track]),
+                                           self.sample_rate,
+                                           bit_width,
+                                           mixer=mixer)
+            self._collapsers[(mixer, bit_width)] = wave_collapser
+
+        samples = wave_collapser.mix_samples(start_sample,
+                                             end_sample - start_sample,
+                                             volume)
+        if samples is None:
+            return np.zeros(end_sample - start_sample, dtype=np.int64)
+        return samples
+
+
+class TrackCache(object):
+    """
+    Content-addressed on-disk cache of frozen tracks, with a size cap. When
+    the cap is exceeded, the least recently used renders are deleted.
+    """
+
+    def __init__(self, directory: str, max_bytes=1024 * 1024 * 1024):
+        """
+        Open a cache directory, creating it if necessary.
+
+        Args:
+            directory: The cache directory.
+            max_bytes: The maximum total size of the cached renders. Defaults
+                       to 1GB.
+        """
+        os.makedirs(directory, exist_ok=True)
+
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def key(self,
+            track: Track,
+            sample_width: int,
+            volume: float,
+            mixer=MIXER_FLOAT) -> str:
+        """
+        Hashes everything that affects the frames of a track.
+
+        Args:
+            track: The track.
+            sample_width: The bit width to render at.
+            volume: The volume to render at.
+            mixer: The mixer to render with.
+
+        Returns:
+            A hex digest.
+        """
+        # Float renders don't depend on the bit width or volume, and the
+        # integer mixers all produce the same frames.
+        if mixer == MIXER_FLOAT:
+            render_format = (FROZEN_FLOAT_DTYPE,)
+        else:
+            render_format = (FROZEN_INT_DTYPE,
+                             sample_width,
+                             round(volume * VOLUME_BUCKETS))
+
+        h = hashlib.sha256()
+        h.update(repr((FREEZE_VERSION,
+                       CHUNK_SIZE,
+                       track.sample_rate) + render_format).encode())
+        if isinstance(track.waveforms, EventStore):
+            h.update(track.waveforms.digest())
+        else:
+            for wave in track.waveforms:
+                h.update(
+                    repr((wave.time, wave.waveform.fingerprint())).encode())
+        return h.hexdigest()
+
+    def freeze(self,
+               track: Track,
+               sample_width: int,
+               volume: float,
+               mixer=MIXER_FLOAT) -> Track:
+        """
+        Freeze a track, rendering it only if it isn't already cached.
+
+        Args:
+            track: The track to freeze.
+            sample_width: The bit width to render at.
+            volume: The volume to render at.
+            mixer: The mixer to render with.
+
+        Returns:
+            A Track with the same name and sample rate, containing a single
+            FrozenWave.
+        """
+        return self.freeze_tracks([track], sample_width, volume, mixer)[0]
+
+    def freeze_tracks(self,
+                      tracks: list,
+                      sample_width: int,
+                      volume: float,
+                      mixer=MIXER_FLOAT) -> list:
+        """
+        Freeze several tracks that are played together. The cache is only
+        trimmed once all of them are frozen, and never evicts any of their
+        renders.
+
+        Args:
+            tracks: The tracks to freeze.
+            sample_width: The bit width to render at.
+            volume: The volume to render at.
+            mixer: The mixer to render with.
+
+        Returns:
+            A frozen Track for each track. See freeze().
+        """
+        frozen_tracks = []
+        filenames = set()
+        rendered = False
+        for track in tracks:
+            try:
+                key = self.key(track, sample_width, volume, mixer)
+            except NotImplementedError:
+                raise ValueError(f"Track {track.name} can't be frozen.")
+
+            filename = os.path.join(self.directory, key + ".pcm")
+            filenames.add(filename)
+            if os.path.exists(filename):
+                # Touch the file so that it's the most recently used.
+                os.utime(filename)
+                self.hits += 1
+            else:
+                self.misses += 1
+                self._render(track, sample_width, volume, mixer, filename)
+                rendered = True
+
+            frozen = Track(track.name, sample_rate=track.sample_rate)
+            if len(track.waveforms) > 0:
+                if isinstance(track.waveforms, EventStore):
+                    duration = track.waveforms.end_time
+                else:
+                    duration = max(wave.time + wave.waveform.duration
+                                   for wave in track.waveforms)
+                frozen.add_waveform(0.0, FrozenWave(
+                    filename,
+                    duration,
+                    track.sample_rate,
+                    mixer,
+                    sample_width,
+                    round(volume * VOLUME_BUCKETS),
+                    track))
+            frozen_tracks.append(frozen)
+
+        if rendered:
+            self._cleanup(filenames)
+        return frozen_tracks
+
+    def _render(self,
+                track: Track,
+                sample_width: int,
+                volume: float,
+                mixer: str,
+                filename: str):
+        """
+        Renders a track into a cache file, one chunk at a time.
+        """
+        info("Freezing track {}...", track.name)
+        if mixer == MIXER_FLOAT:
+            dtype = FROZEN_FLOAT_DTYPE
+            volume = 1.0
+        else:
+            dtype = FROZEN_INT_DTYPE
+            mixer = MIXER_NUMPY
+
+        wave_collapser = WaveCollapser(MergedTimeline([track]),
+                                       track.sample_rate,
+                                       sample_width,
+                                       mixer=mixer)
+
+        # Render to a temporary file first, so that a partial render is never
+        # mistaken for a complete one.
+        tmp_filename = filename + ".tmp"
+        with open(tmp_filename, "wb") as f:
+            t = 0.0
+            samples = wave_collapser.mix(t, CHUNK_SIZE, volume)
+            while samples is not None:
+                f.write(samples.astype(dtype).tobytes())
+                t += CHUNK_SIZE
+                samples = wave_collapser.mix(t, CHUNK_SIZE, volume)
+
+        os.replace(tmp_filename, filename)
+
+    def _cleanup(self, keep: set):
+        """
+        Deletes the least recently used renders until the cache fits in
+        max_bytes. Never deletes the renders in keep.
+        """
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".pcm"):
+                continue
+            filename = os.path.join(self.directory, name)
+            stat = os.stat(filename)
+            entries.append((stat.st_mtime_ns, stat.st_size, filename))
+
+        total = sum(entry[1] for entry in entries)
+        for _, size, filename in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if filename in keep:
+                continue
+
+            debug("Evicting frozen track {}", filename)
+            os.remove(filename)
+            total -= size
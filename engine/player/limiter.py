@@ -0,0 +1,117 @@
+"""
+Output limiting for the float mix bus. Keeps loud passages under full scale so
+that quantizing them doesn't hard clip.
+"""
+
+from numpy.lib.stride_tricks import sliding_window_view
+
+import numpy as np
+
+
+def soft_clip(samples: np.ndarray, threshold: float) -> np.ndarray:
+    """
+    Smoothly compresses samples above a threshold into the headroom between
+    the threshold and full scale, so that they never exceed full scale.
+    Samples below the threshold are unchanged.
+
+    Args:
+        samples: A numpy array of float samples.
+        threshold: The magnitude where compression starts, in (0.0, 1.0].
+
+    Returns:
+        The clipped samples.
+    """
+    magnitude = np.abs(samples)
+    over = magnitude > threshold
+    if not over.any():
+        return samples
+
+    # tanh has a slope of 1 at 0, so the curve joins the linear region
+    # smoothly, and approaches full scale asymptotically.
+    knee = 1.0 - threshold
+    clipped = np.array(samples)
+    if knee == 0.0:
+        clipped[over] = np.sign(samples[over])
+    else:
+        clipped[over] = np.sign(samples[over]) * (
+            threshold + knee * np.tanh((magnitude[over] - threshold) / knee))
+    return clipped
+
+
+class Limiter(object):
+    """
+    Vectorized lookahead peak limiter for the float mix bus.
+
+    The gain needed to keep each sample under the ceiling is computed for the
+    whole chunk at once. Each peak's gain is reached ahead of the peak by
+    taking a running minimum over the lookahead window, then smoothed with a
+    moving average so that the gain ramps instead of stepping. Whatever gets
+    past the limiter is soft clipped.
+
+    The limiter keeps no state between chunks. Instead, each chunk is
+    rendered with padding() samples of context on either side, so the output
+    doesn't depend on how the song is split into chunks.
+
+    With no lookahead, the limiter is a plain soft clipper.
+    """
+
+    def __init__(self, ceiling=0.9, lookahead=0.002):
+        """
+        Create a limiter.
+
+        Args:
+            ceiling: The peak output level, in (0.0, 1.0].
+            lookahead: How far ahead of a peak to start reducing the gain, in
+                       seconds.
+        """
+        if not 0.0 < ceiling <= 1.0:
+            raise ValueError(
+                f"ceiling must be in the range (0.0, 1.0], but was: {ceiling}")
+
+        if lookahead < 0:
+            raise ValueError(
+                f"lookahead must be non-negative, but was: {lookahead}")
+
+        self.ceiling = ceiling
+        self.lookahead = lookahead
+
+    def padding(self, sample_rate: int) -> int:
+        """
+        The number of samples of context needed on either side of a chunk.
+
+        Args:
+            sample_rate: The sample rate.
+        """
+        return int(self.lookahead * sample_rate)
+
+    def process(self, samples: np.ndarray, padding: int) -> np.ndarray:
+        """
+        Limits a chunk of samples.
+
+        Args:
+            samples: A numpy array of float samples, including padding samples
+                     of context on either side of the chunk.
+            padding: The number of samples of context on either side.
+
+        Returns:
+            The limited chunk, without the context.
+        """
+        num_samples = len(samples) - 2 * padding
+        if padding > 0:
+            # The gain that brings each sample down to exactly the ceiling.
+            gain = np.minimum(
+                1.0,
+                self.ceiling / np.maximum(np.abs(samples), self.ceiling))
+
+            # ahead[j] is the lowest gain in [j, j + padding). Averaging it over
+            # the padding samples before each sample includes that sample in
+            # every window, so the smoothed gain is never above its own.
+            ahead = sliding_window_view(gain, padding).min(axis=1)
+            totals = np.concatenate(
+                ([0.0], np.cumsum(ahead, dtype=np.float64)))
+            smoothed = (totals[padding + 1:padding + 1 + num_samples] -
+                        totals[1:1 + num_samples]) / padding
+
+            samples = samples[padding:padding + num_samples] * smoothed
+
+        return soft_clip(samples, self.ceiling).astype(np.float32)
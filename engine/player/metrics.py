@@ -0,0 +1,178 @@
+"""
+Render performance metrics. Records per-chunk timings while playing so that
+stutters can be diagnosed after the fact.
+"""
+
+from collections import deque
+from itertools import islice
+
+import json
+import math
+
+class ChunkMetrics(object):
+    """
+    Measurements for a single rendered chunk.
+    """
+
+    __slots__ = ("t0", "duration", "render_time", "voices", "samples_mixed",
+                 "bytes_emitted", "write_time")
+
+    def __init__(self,
+                 t0: float,
+                 duration: float,
+                 render_time: float,
+                 voices: int,
+                 samples_mixed: int,
+                 bytes_emitted: int):
+        """
+        Args:
+            t0: The start time of the chunk, in seconds.
+            duration: The duration of the chunk, in seconds.
+            render_time: The time spent rendering the chunk, in seconds.
+            voices: The number of waves active during the chunk.
+            samples_mixed: The number of wave samples summed into the chunk.
+            bytes_emitted: The size of the rendered frames.
+        """
+        self.t0 = t0
+        self.duration = duration
+        self.render_time = render_time
+        self.voices = voices
+        self.samples_mixed = samples_mixed
+        self.bytes_emitted = bytes_emitted
+        self.write_time = None
+        """
+        The time spent blocked writing the chunk to the output, in seconds.
+        None until the chunk is written.
+        """
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def percentile(values: list, p: float) -> float:
+    """
+    Nearest-rank percentile of a list of values.
+
+    Args:
+        values: The values. Need not be sorted.
+        p: The percentile, in the range [0, 100].
+
+    Returns:
+        The percentile, or 0.0 if there are no values.
+    """
+    if len(values) == 0:
+        return 0.0
+
+    ordered = sorted(values)
+    rank = max(1, math.ceil(p / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class RenderMetrics(object):
+    """
+    Collects ChunkMetrics. Recording a chunk only appends to a bounded deque,
+    and the rolling statistics are computed when they are read.
+
+    Chunks may be rendered on one thread and written on another. Writes are
+    matched up with renders in order.
+    """
+
+    def __init__(self, window=100, history=10000):
+        """
+        Args:
+            window: The number of most recent chunks that the rolling
+                    statistics are computed over.
+            history: The number of most recent chunks to keep.
+        """
+        self.window = window
+        self.chunks = deque(maxlen=history)
+
+        self.num_chunks = 0
+        self.total_render_time = 0.0
+        self.total_write_time = 0.0
+        self.total_duration = 0.0
+        self.total_bytes = 0
+
+        self._unwritten = deque(maxlen=history)
+
+    def record_render(self, chunk: ChunkMetrics):
+        """
+        Record a rendered chunk.
+        """
+        self.chunks.append(chunk)
+        self._unwritten.append(chunk)
+
+        self.num_chunks += 1
+        self.total_render_time += chunk.render_time
+        self.total_duration += chunk.duration
+        self.total_bytes += chunk.bytes_emitted
+
+    def record_write(self, write_time: float):
+        """
+        Record the time spent writing the oldest unwritten chunk.
+        """
+        if len(self._unwritten) == 0:
+            return
+
+        self._unwritten.popleft().write_time = write_time
+        self.total_write_time += write_time
+
+    def _recent(self) -> list:
+        return list(islice(reversed(self.chunks), self.window))
+
+    @property
+    def real_time_factor(self) -> float:
+        """
+        Rolling seconds of audio rendered per second of render time. Below 1.0,
+        rendering can't keep up with playback.
+        """
+        recent = self._recent()
+        render_time = sum(chunk.render_time for chunk in recent)
+        if render_time == 0.0:
+            return 0.0
+        return sum(chunk.duration for chunk in recent) / render_time
+
+    @property
+    def p50_latency(self) -> float:
+        """
+        Rolling median chunk render time, in seconds.
+        """
+        return percentile([chunk.render_time for chunk in self._recent()], 50)
+
+    @property
+    def p99_latency(self) -> float:
+        """
+        Rolling 99th percentile chunk render time, in seconds.
+        """
+        return percentile([chunk.render_time for chunk in self._recent()], 99)
+
+    def summary(self) -> dict:
+        """
+        Returns the totals and rolling statistics.
+        """
+        return {
+            "chunks": self.num_chunks,
+            "duration": self.total_duration,
+            "bytes": self.total_bytes,
+            "render_time": self.total_render_time,
+            "write_time": self.total_write_time,
+            "real_time_factor": self.real_time_factor,
+            "p50_latency": self.p50_latency,
+            "p99_latency": self.p99_latency,
+        }
+
+    def to_dict(self) -> dict:
+        """
+        Returns the summary and every kept chunk.
+        """
+        return {
+            "summary": self.summary(),
+            "chunks": [chunk.to_dict() for chunk in self.chunks],
+        }
+
+    def dump(self, filename: str):
+        """
+        Write the metrics to a JSON file.
+        """
+        with open(filename, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
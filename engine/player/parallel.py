@@ -0,0 +1,107 @@
+"""
+Parallel offline rendering. A chunk only depends on its start time, so ranges
+of chunks can be rendered independently on a pool of worker processes and
+written back in order.
+"""
+
+from engine import debug
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+_wave_collapser = None
+"""
+The WaveCollapser of this worker process. Shipped once per worker when the
+pool starts rather than once per task.
+"""
+
+
+def _init_worker(wave_collapser):
+    global _wave_collapser
+    _wave_collapser = wave_collapser
+
+
+def _render_chunks(first_chunk: int,
+                   num_chunks: int,
+                   chunk_size: float,
+                   volume: float) -> list:
+    """
+    Renders a range of consecutive chunks in a worker process. Stops early at
+    the end of the tracks.
+
+    Returns:
+        A list of frames for each chunk.
+    """
+    chunks = []
+    for i in range(first_chunk, first_chunk + num_chunks):
+        samples = _wave_collapser.collapse(i * chunk_size, chunk_size, volume)
+        if len(samples) == 0:
+            break
+        chunks.append(bytes(samples))
+
+    return chunks
+
+
+class ParallelRenderer(object):
+    """
+    Renders a WaveCollapser on a ProcessPoolExecutor.
+    """
+
+    def __init__(self, wave_collapser, workers: int, chunks_per_task=4):
+        """
+        Create a parallel renderer.
+
+        Args:
+            wave_collapser: The WaveCollapser to render. Must be picklable.
+            workers: The number of worker processes.
+            chunks_per_task: The number of consecutive chunks each task
+                             renders.
+        """
+        if workers < 1:
+            raise ValueError(f"workers must be positive, but was: {workers}")
+
+        self.wave_collapser = wave_collapser
+        self.workers = workers
+        self.chunks_per_task = chunks_per_task
+
+    def render(self, chunk_size: float, volume: float):
+        """
+        Generates consecutive chunks of frames until the end of the tracks, in
+        order. At most a few tasks per worker are in flight at once, so memory
+        use doesn't grow with the length of the song.
+
+        Args:
+            chunk_size: The duration of each chunk, in seconds.
+            volume: The volume to render at.
+        """
+        end_time = self.wave_collapser.end_time
+        next_chunk = 0
+        pending = deque()
+
+        with ProcessPoolExecutor(max_workers=self.workers,
+                                 initializer=_init_worker,
+                                 initargs=(self.wave_collapser,)) as executor:
+            while True:
+                # Keep every worker busy. Nothing past the end time needs to
+                # be rendered.
+                while len(pending) < 2 * self.workers and \
+                        next_chunk * chunk_size <= end_time:
+                    pending.append(executor.submit(_render_chunks,
+                                                   next_chunk,
+                                                   self.chunks_per_task,
+                                                   chunk_size,
+                                                   volume))
+                    next_chunk += self.chunks_per_task
+
+                if len(pending) == 0:
+                    break
+
+                chunks = pending.popleft().result()
+                debug("Rendered {} chunks in parallel.", len(chunks))
+                yield from chunks
+
+                if len(chunks) < self.chunks_per_task:
+                    break
+
+            for future in pending:
+                future.cancel()
@@ -2,18 +2,90 @@
 Plays one or more tracks.
 """
 
-from engine import debug, info
-from engine.tracks import Track
+from engine import LogLevel, debug, info, is_enabled
+from engine.tracks import EventStore, MergedTimeline, Track, WaveIndex
+from engine.waves import Note, sine_bank
+from engine.waves.resample import get_resampler
+from engine.waves.sample import get_sampler_from_width
+from .buffer import RingBuffer, RenderWorker
+from .metrics import ChunkMetrics, RenderMetrics
+from .parallel import ParallelRenderer
+from .sinks import PyAudioSink, WavSink
 
 from contextlib import contextmanager
-from pyaudio import PyAudio
 from sortedcontainers import SortedList
 
+import numpy as np
+import time
+
 CHUNK_SIZE = 1.0
 """
 Cache in 1 second increments.
 """
 
+MIN_BLOCK_SIZE = 64
+"""
+The smallest block size, in samples, supported in callback mode.
+"""
+
+MAX_BLOCK_SIZE = 4096
+"""
+The largest block size, in samples, supported in callback mode.
+"""
+
+MIXER_PYTHON = "python"
+"""
+Reference mixer. Sums and packs every sample in pure python.
+"""
+
+MIXER_NUMPY = "numpy"
+"""
+Vectorized mixer. Sums each wave into a preallocated numpy accumulator and
+packs the result with a single dtype cast. Produces the same frames as
+MIXER_PYTHON.
+"""
+
+MIXER_FLOAT = "float"
+"""
+Float mix bus. Sums each wave's float samples into a float32 accumulator, and
+quantizes the whole chunk to the bit width once at the end, clipping instead of
+wrapping around when the sum exceeds full scale. The only mixer which supports
+a Limiter and 32-bit float output.
+"""
+
+MIXERS = (MIXER_PYTHON, MIXER_NUMPY, MIXER_FLOAT)
+"""
+All supported mixers.
+"""
+
+
+def pack_frames(samples: np.ndarray, sample_width: int) -> bytes:
+    """
+    Packs samples into little-endian PCM frames. Integer samples which exceed
+    the bit width wrap around, the same as masking off the low bytes.
+
+    Args:
+        samples: A numpy array of samples. Integers for 8, 16 and 24-bit, and
+                 floats for 32-bit.
+        sample_width: The bit width of each sample. Supported widths include
+                      8-bit, 16-bit, 24-bit integer and 32-bit float.
+
+    Returns:
+        The packed frames.
+    """
+    if sample_width == 8:
+        return samples.astype("<u1").tobytes()
+    elif sample_width == 16:
+        return samples.astype("<i2").tobytes()
+    elif sample_width == 24:
+        # There is no 24-bit dtype. Cast to 32-bit and drop the high byte.
+        wide = samples.astype("<i4").view(np.uint8).reshape(-1, 4)
+        return wide[:, :3].tobytes()
+    elif sample_width == 32:
+        return samples.astype("<f4").tobytes()
+    else:
+        raise ValueError(f"Unsupported bit width: {sample_width}")
+
 
 class WaveCollapser(object):
     """
@@ -21,14 +93,31 @@ class WaveCollapser(object):
     N seconds of playtime.
     """
 
-    def __init__(self, waveforms: list, sample_rate: int, sample_width: int):
+    def __init__(self,
+                 waveforms: list,
+                 sample_rate: int,
+                 sample_width: int,
+                 mixer=MIXER_FLOAT,
+                 metrics=None,
+                 limiter=None,
+                 output_rate=None):
         """
         Initialize a wave collapser with the following attributes.
 
         Args:
-            waveforms: A list of waveforms that are to be played.
+            waveforms: A sorted list of TimedWaves that are to be played, or a
+                       MergedTimeline. The EventStores of a timeline's tracks
+                       are queried directly instead of being indexed.
             sample_rate: The sample rate.
             sample_width: The bit width of each sample.
+            mixer: The mixing implementation to use, one of MIXERS.
+            metrics: If set, a RenderMetrics to record each chunk into.
+            limiter: If set, a Limiter to apply to the float mix bus before it
+                     is quantized. Requires MIXER_FLOAT.
+            output_rate: If set, the sample rate of the frames. The waves are
+                         mixed at sample_rate, and the float mix bus is
+                         resampled to output_rate before it is quantized.
+                         Requires MIXER_FLOAT.
         """
 
         # Let's catch this as soon as possible.
@@ -36,9 +125,83 @@ class WaveCollapser(object):
             raise ValueError(
                 f"sample_width {sample_width} is not a multiple of 8.")
 
+        if mixer not in MIXERS:
+            raise ValueError(f"Unsupported mixer: {mixer}")
+
+        if mixer != MIXER_FLOAT and sample_width == 32:
+            raise ValueError(f"The {mixer} mixer doesn't support float output.")
+
+        if mixer != MIXER_FLOAT and limiter is not None:
+            raise ValueError(f"The {mixer} mixer doesn't support a limiter.")
+
+        if output_rate is None:
+            output_rate = sample_rate
+
+        if mixer != MIXER_FLOAT and output_rate != sample_rate:
+            raise ValueError(f"The {mixer} mixer doesn't support resampling.")
+
+        # Waves are placed at sample_rate, so any other rate plays them at
+        # the wrong speed.
+        if isinstance(waveforms, MergedTimeline) and \
+                waveforms.sample_rate not in (None, sample_rate):
+            raise ValueError(
+                f"The tracks are at {waveforms.sample_rate} Hz, not " +
+                f"{sample_rate} Hz. Use output_rate to play them at " +
+                "another rate.")
+
         self.waveforms = waveforms
+
+        # Event stores are already sorted arrays of samples, so they can be
+        # searched as they are.
+        self.stores = []
+        if isinstance(waveforms, MergedTimeline):
+            self.stores = [track.waveforms for track in waveforms.tracks
+                           if isinstance(track.waveforms, EventStore)]
+            waveforms = MergedTimeline([
+                track for track in waveforms.tracks
+                if not isinstance(track.waveforms, EventStore)
+            ])
+        for store in self.stores:
+            store.finalize()
+
+        self.index = WaveIndex(waveforms)
+        self.end_time = max([self.index.end_time] +
+                            [store.end_time for store in self.stores])
+        """
+        The time at which the last wave stops playing.
+        """
+
         self.sample_rate = sample_rate
         self.sample_width = sample_width
+        self.sampler = get_sampler_from_width(sample_width)
+        self.mixer = mixer
+        self.metrics = metrics
+        self.limiter = limiter
+        self.output_rate = output_rate
+        self.resampler = None
+        if output_rate != sample_rate:
+            self.resampler = get_resampler(sample_rate, output_rate)
+
+    def active_at(self, t0: float, t1: float) -> list:
+        """
+        Find every wave that is playing at some point in [t0, t1).
+
+        Args:
+            t0: The start of the interval (inclusive).
+            t1: The end of the interval (exclusive).
+
+        Returns:
+            A list of TimedWaves, sorted by time.
+        """
+        waves = self.index.active_at(t0, t1)
+        if len(self.stores) > 0:
+            start_sample = round(t0 * self.sample_rate)
+            num_samples = round(t1 * self.sample_rate) - start_sample
+            for store in self.stores:
+                waves.extend(placement[0] for placement in
+                             store.place(start_sample, num_samples))
+            waves.sort(key=lambda wave: wave.time)
+        return waves
 
     def collapse(self, t0: float, duration: float, volume: float) -> list:
         """
@@ -59,71 +222,386 @@ class WaveCollapser(object):
         Note that volume is passed in on each call to `collapse()`. This allows
         the user the flexibility to change the volume in the middle of playback.
         """
-        debug(f"Collapsing interval {t0}")
+        return self._collapse(t0,
+                              duration,
+                              int(self.output_rate * duration),
+                              volume)
+
+    def collapse_samples(self,
+                         start_sample: int,
+                         num_samples: int,
+                         volume: float) -> list:
+        """
+        Same as collapse(), but the interval is expressed in samples at the
+        output rate. Always returns exactly num_samples samples worth of
+        frames, unless playback is complete.
+
+        Args:
+            start_sample: The first sample of this collapse interval.
+            num_samples: The number of samples to collapse.
+            volume: The volume to play at. See collapse().
+
+        Returns:
+            A series of bytes that can be passed to pyaudio as frames.
+        """
+        return self._collapse(start_sample / self.output_rate,
+                              num_samples / self.output_rate,
+                              num_samples,
+                              volume)
 
-        # First, add all of the waves that are in this range.
-        waves = []
-        reached_end = True
-        for i in range(len(self.waveforms)):
-            reached_end = i == len(self.waveforms) - 1
+    def mix(self, t0: float, duration: float, volume: float) -> np.ndarray:
+        """
+        Same as collapse(), but returns the mix before it is packed. For the
+        integer mixers, this is the sum of the waves' frames, which may exceed
+        the bit width. For MIXER_FLOAT, it's the float mix bus, before it is
+        limited or quantized.
 
-            if self.waveforms[i].time + self.waveforms[i].waveform.duration < t0:
-                continue
-            elif self.waveforms[i].time < t0 + duration:
-                waves.append(self.waveforms[i])
-            else:
-                break
+        Args:
+            t0: The start time of this collapse interval.
+            duration: The chunk size to collapse.
+            volume: The volume to play at. See collapse().
+
+        Returns:
+            An int64 or float32 numpy array of samples, or None if t0 is beyond
+            the end of the waves.
+        """
+        return self._mix(t0, duration, int(self.sample_rate * duration), volume)
+
+    def mix_samples(self,
+                    start_sample: int,
+                    num_samples: int,
+                    volume: float) -> np.ndarray:
+        """
+        Same as mix(), but the interval is expressed in samples.
+
+        Args:
+            start_sample: The first sample of this collapse interval.
+            num_samples: The number of samples to collapse.
+            volume: The volume to play at. See collapse().
+
+        Returns:
+            An int64 or float32 numpy array of samples, or None if start_sample
+            is beyond the end of the waves.
+        """
+        return self._mix(start_sample / self.sample_rate,
+                         num_samples / self.sample_rate,
+                         num_samples,
+                         volume)
+
+    def _mix(self,
+             t0: float,
+             duration: float,
+             num_samples: int,
+             volume: float) -> np.ndarray:
+        """
+        Implementation of mix() and mix_samples().
+        """
+        placements = self._place(t0, duration, num_samples)
+        if placements is None:
+            return None
+        if self.mixer == MIXER_FLOAT:
+            return self._sum_float(placements, num_samples, volume)
+        return self._sum_numpy(placements, num_samples, volume)
+
+    def _collapse(self,
+                  t0: float,
+                  duration: float,
+                  num_samples: int,
+                  volume: float) -> list:
+        """
+        Implementation of collapse() and collapse_samples().
+        """
+        debug("Collapsing interval {}", t0)
+        start_time = time.perf_counter()
 
         ###################################
         # Main wave generation algorithm. #
         ###################################
 
-        # Step 1. If t0 is beyond the end of our samples, return an empty list.
-        # This is a signal to our caller that we are done playing music.
-        if len(waves) == 0 and reached_end:
+        # Step 1. Find the waves in this range and where each one lands. If t0
+        # is beyond the end of our samples, return an empty list. This is a
+        # signal to our caller that we are done playing music. The limiter
+        # needs to see a little past either end of the chunk.
+        padding = 0
+        if self.limiter is not None:
+            padding = self.limiter.padding(self.sample_rate)
+
+        # When resampling, the interval is in output samples. Mix the input
+        # samples that those depend on instead.
+        output_range = None
+        input_t0, input_duration, input_samples = t0, duration, num_samples
+        if self.resampler is not None:
+            output_range = (round(t0 * self.output_rate), num_samples)
+            first_input, end_input = self.resampler.input_range(*output_range)
+            input_t0 = first_input / self.sample_rate
+            input_samples = end_input - first_input
+            input_duration = input_samples / self.sample_rate
+
+        placements = self._place(input_t0,
+                                 input_duration,
+                                 input_samples,
+                                 padding)
+        if placements is None:
             return []
 
-        # Step 2. Initialize an empty sample array for each sample in the
+        # Step 2. Mix the waves into a buffer of samples and pack the samples
+        # into frames.
+        if self.mixer == MIXER_FLOAT:
+            frames = self._mix_float(placements,
+                                     input_samples,
+                                     volume,
+                                     padding,
+                                     output_range)
+        elif self.mixer == MIXER_NUMPY:
+            frames = self._mix_numpy(placements, num_samples, volume)
+        else:
+            frames = self._mix_python(placements, num_samples, volume)
+
+        if self.metrics is not None:
+            self.metrics.record_render(ChunkMetrics(
+                t0,
+                duration,
+                time.perf_counter() - start_time,
+                len(placements),
+                sum(p[3] - p[2] for p in placements),
+                len(frames)))
+
+        return frames
+
+    def _place(self,
+               t0: float,
+               duration: float,
+               num_samples: int,
+               padding=0) -> list:
+        """
+        Looks up the waves in [t0, t0 + duration) and calculates where each
+        one lands within the interval.
+
+        Args:
+            t0: The start time of the interval.
+            duration: The duration of the interval.
+            num_samples: The number of samples in the interval.
+            padding: The number of samples to widen the interval by on either
+                     side.
+
+        Returns:
+            A list of (wave, interval_start_idx, wave_start_idx, wave_end_idx)
+            tuples, or None if t0 is beyond the end of the waves.
+        """
+        # Every wave ends by end_time, so nothing is active past it.
+        if t0 > self.end_time:
+            return None
+
+        start_sample = round(t0 * self.sample_rate) - padding
+        t0 -= padding / self.sample_rate
+        duration += 2 * padding / self.sample_rate
+        num_samples += 2 * padding
+
+        placements = [
+            (wave,) + self._wave_bounds(wave, t0, num_samples)
+            for wave in self.index.active_at(t0, t0 + duration)
+        ]
+
+        # Events are timed in samples, so they are placed without any float
+        # math.
+        for store in self.stores:
+            placements.extend(store.place(start_sample, num_samples))
+        return placements
+
+    def _wave_bounds(self, wave, t0: float, num_samples: int) -> tuple:
+        """
+        Calculates the start point within the sample interval and the start and
+        end points within the waveform.
+
+        Args:
+            wave: The TimedWave to place within the interval.
+            t0: The start time of the interval.
+            num_samples: The number of samples in the interval.
+
+        Returns:
+            (interval_start_idx, wave_start_idx, wave_end_idx)
+        """
+        # Round to the nearest sample, so that float error in t0 can't shift a
+        # wave by a sample between chunks.
+        offset = round((wave.time - t0) * self.sample_rate)
+        interval_start_idx = max(0, offset)
+        wave_start_idx = max(0, -offset)
+        wave_end_idx = min(wave.waveform.num_samples,
+                           wave_start_idx + num_samples - interval_start_idx)
+
+        # This runs for every wave in every chunk, so skip it entirely unless
+        # it will be printed.
+        if is_enabled(LogLevel.DEBUG):
+            debug("Playing wave: {} t={}, wave sample: [{}, {}) " +
+                  "chunk offset: {}",
+                  wave.waveform,
+                  wave.time,
+                  wave_start_idx,
+                  wave_end_idx,
+                  interval_start_idx)
+
+        return interval_start_idx, wave_start_idx, wave_end_idx
+
+    def _mix_python(self,
+                    placements: list,
+                    num_samples: int,
+                    volume: float) -> bytearray:
+        """
+        Reference implementation of the mixer. See collapse().
+
+        Args:
+            placements: A list of (wave, interval_start_idx, wave_start_idx,
+                        wave_end_idx) tuples.
+            num_samples: The number of samples in the interval.
+            volume: The volume to play at.
+        """
+        # Step 2a. Initialize an empty sample array for each sample in the
         # duration.
-        samples = [0] * int(self.sample_rate * duration)
-
-        # Step 3. For each wave, sum up each sample against the existing samples.
-        # This is accomplished by calculating the start point within the sample
-        # interval and the start point within the waveform. Sum up samples until
-        # either the end of the interval or the end of the waveform.
-        for wave in waves:
-            interval_start_idx = max(0,
-                                     int((wave.time - t0) * self.sample_rate))
-            wave_start_idx = max(0,
-                                 int((t0 - wave.time) * self.sample_rate))
-            wave_end_idx = min(wave.waveform.num_samples,
-                               wave_start_idx + len(samples) - interval_start_idx)
-
-            debug(f"Playing wave: {wave.waveform} t={wave.time}, " +
-                  f"wave sample: [{wave_start_idx}, {wave_end_idx}) " +
-                  f"chunk offset: {interval_start_idx}")
+        samples = [0] * num_samples
 
+        # Step 2b. For each wave, sum up each sample against the existing
+        # samples. Sum up samples until either the end of the interval or the
+        # end of the waveform.
+        for wave, interval_start_idx, wave_start_idx, wave_end_idx in \
+                placements:
             # Add this sample to our array of samples.
             wave_samples = wave.waveform.get_frames(wave_start_idx,
                                                     wave_end_idx,
                                                     self.sample_width,
                                                     volume)
             for i in range(len(wave_samples)):
-                samples[i + interval_start_idx] += wave_samples[i]
+                samples[i + interval_start_idx] += int(wave_samples[i])
 
-        # Step 4. Initialize an empty array of "frames". Frames are one byte, so
-        # we need to create a list of size (bit_width * samples).
+        # Step 2c. Initialize an empty array of "frames". Frames are one byte,
+        # so we need to create a list of size (bit_width * samples).
         num_bytes = int(self.sample_width / 8)
         frames = bytearray(len(samples) * num_bytes)
 
-        # Step 5. For each sample, convert to a bytearray of frames.
+        # Step 2d. For each sample, convert to a bytearray of frames. Unsigned
+        # formats are offset once, after summing.
+        offset = self.sampler.offset
         for i in range(len(samples)):
             for j in range(num_bytes):
-                b = (samples[i] >> (8 * j)) & 0xFF
+                b = ((samples[i] + offset) >> (8 * j)) & 0xFF
                 frames[i * num_bytes + j] = b
 
         return frames
 
+    def _mix_numpy(self,
+                   placements: list,
+                   num_samples: int,
+                   volume: float) -> bytearray:
+        """
+        Vectorized implementation of the mixer. See _mix_python().
+        """
+        samples = self._sum_numpy(placements, num_samples, volume)
+        samples += self.sampler.offset
+
+        # Step 2c. Pack the samples. Integer casts wrap, which keeps the low
+        # bytes of each sample exactly like the reference shift-and-mask.
+        return bytearray(pack_frames(samples, self.sample_width))
+
+    def _sum_numpy(self,
+                   placements: list,
+                   num_samples: int,
+                   volume: float) -> np.ndarray:
+        """
+        Sums the frames of each wave. See _mix_python().
+        """
+        # Step 2a. Preallocate a single accumulator for the whole chunk. Use a
+        # wide integer type so that summing many voices can't overflow before
+        # we pack.
+        samples = np.zeros(num_samples, dtype=np.int64)
+
+        # Step 2b. Slice-add each wave into the accumulator.
+        for wave, interval_start_idx, wave_start_idx, wave_end_idx in \
+                placements:
+            wave_samples = np.asarray(
+                wave.waveform.get_frames(wave_start_idx,
+                                         wave_end_idx,
+                                         self.sample_width,
+                                         volume),
+                dtype=np.int64)
+            samples[interval_start_idx:
+                    interval_start_idx + len(wave_samples)] += wave_samples
+
+        return samples
+
+    def _mix_float(self,
+                   placements: list,
+                   num_samples: int,
+                   volume: float,
+                   padding: int,
+                   output_range=None) -> bytearray:
+        """
+        Float mix bus implementation of the mixer. See _mix_python().
+
+        Args:
+            placements: A list of (wave, interval_start_idx, wave_start_idx,
+                        wave_end_idx) tuples, placed within the chunk widened
+                        by padding samples on either side.
+            num_samples: The number of samples in the interval.
+            volume: The volume to play at.
+            padding: The number of samples of context for the limiter.
+            output_range: When resampling, the (start_sample, num_samples) of
+                          the interval at the output rate.
+        """
+        bus = self._sum_float(placements, num_samples + 2 * padding, volume)
+
+        # Step 2c. Limit, then quantize the whole chunk at once.
+        if self.limiter is not None:
+            bus = self.limiter.process(bus, padding)
+
+        # Step 2d. Convert to the output rate. Each output sample only depends
+        # on the mix around it, so chunks are converted independently.
+        if output_range is not None:
+            first_input, _ = self.resampler.input_range(*output_range)
+            bus = self.resampler.process(bus, first_input, *output_range)
+        return bytearray(pack_frames(self.sampler.quantize(bus),
+                                     self.sample_width))
+
+    def _sum_float(self,
+                   placements: list,
+                   num_samples: int,
+                   volume: float) -> np.ndarray:
+        """
+        Sums the float samples of each wave on a float32 mix bus. See
+        _mix_python().
+        """
+        # Step 2a. Synthesize every note that isn't already in the note cache
+        # together on an oscillator bank, straight into the mix bus, so chords
+        # cost one vectorized pass. Subclasses of Note may sound different, so
+        # they render themselves.
+        synthesized = []
+        sliced = []
+        for placement in placements:
+            waveform = placement[0].waveform
+            if type(waveform) is Note and not waveform.cached:
+                synthesized.append(placement)
+            else:
+                sliced.append(placement)
+
+        if len(synthesized) > 0:
+            bus = sine_bank([p[0].waveform.freq for p in synthesized],
+                            [p[1] for p in synthesized],
+                            [p[2] for p in synthesized],
+                            [p[3] for p in synthesized],
+                            self.sample_rate,
+                            num_samples)
+        else:
+            bus = np.zeros(num_samples, dtype=np.float32)
+
+        # Step 2b. Slice-add every other wave into the bus at full volume, and
+        # apply the volume once to the sum.
+        for wave, interval_start_idx, wave_start_idx, wave_end_idx in sliced:
+            wave_samples = wave.waveform.get_samples(wave_start_idx,
+                                                     wave_end_idx)
+            bus[interval_start_idx:
+                interval_start_idx + len(wave_samples)] += wave_samples
+
+        bus *= volume
+        return bus
+
 
 class Player(object):
     """
@@ -133,61 +611,241 @@ class Player(object):
                  tracks: list,
                  sample_rate: int,
                  volume=0.5,
-                 sample_width=16):
+                 sample_width=16,
+                 mixer=MIXER_FLOAT,
+                 limiter=None,
+                 lookahead=2,
+                 block_size=None,
+                 metrics_file=None,
+                 sink=None,
+                 freeze_cache=None,
+                 output_rate=None):
         """
         Initialize an audio player.
 
         Args:
             tracks: A list of Tracks to play.
-            sample_rate: The sample rate (samples per second).
+            sample_rate: The sample rate (samples per second) of the tracks.
             volume: Volume between [0.0, 1.0) at which to play the audio.
                     Combined audio will be truncated if it exceeds 1.0.
             sample_width: The bit width at which to play the tracks. Supported
-                          widths include 8-bit, 16-bit, 24-bit.
+                          widths include 8-bit, 16-bit, 24-bit, and 32-bit
+                          float with MIXER_FLOAT.
+            mixer: The mixing implementation to use, one of MIXERS.
+            limiter: If set, a Limiter to keep the mix under full scale.
+                     Requires MIXER_FLOAT.
+            lookahead: The number of chunks to render ahead of playback on a
+                       background thread. If 0, each chunk is rendered just
+                       before it is played.
+            block_size: If set, play in low-latency callback mode instead,
+                        rendering exactly block_size samples each time the
+                        sink needs more audio. Must be in the range
+                        [MIN_BLOCK_SIZE, MAX_BLOCK_SIZE].
+            metrics_file: If set, the RenderMetrics of each playback are
+                          dumped to this JSON file when it completes.
+            sink: The Sink to play to. Defaults to the PyAudio output device.
+            freeze_cache: If set, a TrackCache to freeze each track into before
+                          playing. Tracks that were frozen by an earlier run
+                          are loaded from the cache instead of re-rendered.
+            output_rate: If set, the sample rate to play at, when the sink
+                         needs a different rate than the tracks. The mix is
+                         resampled on its way to the sink. Requires
+                         MIXER_FLOAT.
         """
+        if lookahead < 0:
+            raise ValueError(
+                f"lookahead must be non-negative, but was: {lookahead}")
+
+        if block_size is not None and \
+                not MIN_BLOCK_SIZE <= block_size <= MAX_BLOCK_SIZE:
+            raise ValueError(
+                f"block_size {block_size} must be in the range " +
+                f"[{MIN_BLOCK_SIZE}, {MAX_BLOCK_SIZE}].")
+
+        for track in tracks:
+            if track.sample_rate != sample_rate:
+                raise ValueError(
+                    f"Track {track.name} is at {track.sample_rate} Hz, not " +
+                    f"{sample_rate} Hz. Use output_rate to play it at " +
+                    "another rate.")
+
         self.tracks = tracks
         self.sample_rate = sample_rate
-        self.audio = PyAudio()
+        self.output_rate = sample_rate if output_rate is None else output_rate
+        self.sink = sink if sink is not None else PyAudioSink()
         self.volume = volume
         self.sample_width = sample_width
+        self.mixer = mixer
+        self.limiter = limiter
+        self.lookahead = lookahead
+        self.ring_buffer = None
+        self.block_size = block_size
+        self.latency = None
+        """
+        The output latency achieved by the last playback, in seconds. Includes
+        the sink latency and, in callback mode, one block.
+        """
+        self.metrics = None
+        """
+        The RenderMetrics of the last playback.
+        """
+        self.metrics_file = metrics_file
+        self.freeze_cache = freeze_cache
 
-        debug("Added tracks: " + str([track.name for track in self.tracks]))
+        debug("Added tracks: {}", [track.name for track in self.tracks])
 
     @contextmanager
-    def _open_stream(self):
-        # Open the stream.
-        debug("Opening stream.")
-        self.stream = self.audio.open(
-            format=self.audio.get_format_from_width(self.sample_width / 8), # 8bit
-            channels=1,                                                     # mono
-            rate=self.sample_rate,
-            output=True
-        )
-
+    def _open_sink(self, sink):
+        sink.open(self.output_rate, self.sample_width)
         try:
             yield
         finally:
-            debug("Closing stream")
-            self.stream.stop_stream()
-            self.stream.close()
+            sink.close()
 
-    def play(self):
-        compiled_track = sum(self.tracks)
-        waveforms = compiled_track.waveforms
+    def _compile(self) -> WaveCollapser:
+        """
+        Combines the tracks into a WaveCollapser, with fresh metrics.
+        """
+        tracks = self.tracks
+        if self.freeze_cache is not None:
+            tracks = self.freeze_cache.freeze_tracks(tracks,
+                                                     self.sample_width,
+                                                     self.volume,
+                                                     mixer=self.mixer)
+
+        timeline = MergedTimeline(tracks)
+
+        self.metrics = RenderMetrics()
+        return WaveCollapser(timeline,
+                             self.sample_rate,
+                             self.sample_width,
+                             mixer=self.mixer,
+                             metrics=self.metrics,
+                             limiter=self.limiter,
+                             output_rate=self.output_rate)
+
+    def _report_metrics(self):
+        """
+        Logs the metrics of the last playback and dumps them to the metrics
+        file, if any.
+        """
+        info(lambda: f"Render metrics: {self.metrics.summary()}")
+        if self.metrics_file is not None:
+            self.metrics.dump(self.metrics_file)
 
+    def _write_chunks(self, sink, chunks):
+        """
+        Writes each chunk to the sink, timing how long each write blocks.
+        """
+        for samples in chunks:
+            write_start = time.perf_counter()
+            sink.write(samples)
+            self.metrics.record_write(time.perf_counter() - write_start)
+
+    def play(self):
         # Main play algorithm.
-        wave_collapser = WaveCollapser(waveforms,
-                                       self.sample_rate,
-                                       self.sample_width)
+        wave_collapser = self._compile()
 
-        with self._open_stream():
+        with self._open_sink(self.sink):
             info("Beginning playback...")
 
+            if self.block_size is not None:
+                self._play_callback(wave_collapser)
+            else:
+                self._write_chunks(self.sink, self._render(wave_collapser))
+                self.latency = self.sink.latency
+
+        info("Playback complete with {}s latency.", self.latency)
+        self._report_metrics()
+
+    def render(self, filename: str, workers=1):
+        """
+        Render the tracks to a .wav file as fast as possible instead of playing
+        them. Chunks are streamed into the file as they are rendered, so memory
+        use doesn't grow with the length of the song.
+
+        Args:
+            filename: The .wav file to write.
+            workers: The number of processes to render with. If greater than
+                     1, ranges of chunks are rendered in parallel on a process
+                     pool.
+        """
+        wave_collapser = self._compile()
+
+        if workers > 1:
+            # Chunks are rendered in other processes, so nothing would be
+            # recorded here.
+            wave_collapser.metrics = None
+            chunks = ParallelRenderer(wave_collapser, workers).render(
+                CHUNK_SIZE, self.volume)
+        else:
+            chunks = self._render(wave_collapser)
+
+        info("Rendering to {}...", filename)
+        sink = WavSink(filename)
+        with self._open_sink(sink):
+            self._write_chunks(sink, chunks)
+
+        info("Render complete.")
+        self._report_metrics()
+
+    def _play_callback(self, wave_collapser: WaveCollapser):
+        """
+        Plays in callback mode. The sink pulls one block at a time and each
+        block is rendered on demand, so volume changes are heard within one
+        block.
+
+        Args:
+            wave_collapser: The WaveCollapser to render.
+        """
+        next_sample = 0
+
+        def render_block(num_samples: int):
+            nonlocal next_sample
+
+            samples = wave_collapser.collapse_samples(next_sample,
+                                                      num_samples,
+                                                      self.volume)
+            next_sample += num_samples
+            return samples
+
+        self.sink.play_blocks(render_block, self.block_size)
+        self.latency = self.sink.latency + self.block_size / self.output_rate
+
+    def _render(self, wave_collapser: WaveCollapser):
+        """
+        Generates consecutive chunks of frames until the end of the tracks.
+        With lookahead, chunks are rendered ahead of time on a RenderWorker.
+
+        Args:
+            wave_collapser: The WaveCollapser to render.
+        """
+        if self.lookahead == 0:
             t = 0.0
             samples = wave_collapser.collapse(t, CHUNK_SIZE, self.volume)
             while len(samples) > 0:
-                self.stream.write(bytes(bytearray(samples)))
+                yield samples
                 t += CHUNK_SIZE
                 samples = wave_collapser.collapse(t, CHUNK_SIZE, self.volume)
+            return
+
+        self.ring_buffer = RingBuffer(self.lookahead)
+        worker = RenderWorker(wave_collapser,
+                              self.ring_buffer,
+                              CHUNK_SIZE,
+                              lambda: self.volume)
+        worker.start()
+
+        try:
+            samples = self.ring_buffer.get()
+            while samples is not None:
+                yield samples
+                samples = self.ring_buffer.get()
+        finally:
+            worker.stop()
+            debug("Render-ahead underruns: {}, overruns: {}",
+                  self.ring_buffer.underruns,
+                  self.ring_buffer.overruns)
 
-        info("Playback complete.")
+        if worker.error is not None:
+            raise worker.error
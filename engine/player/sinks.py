@@ -0,0 +1,294 @@
+"""
+Audio sinks. A sink is where a Player sends rendered frames: a sound device,
+a file, a pipe, memory, or nowhere at all.
+"""
+
+from engine import debug
+from engine.waves import WavWriter
+
+import os
+import time
+
+# PyAudio is only needed to play through a sound device, so headless machines
+# can still render to the other sinks without it.
+try:
+    import pyaudio
+except ImportError:
+    pyaudio = None
+
+
+class Sink(object):
+    """
+    Interface for an audio output. Frames are pushed with write() between
+    open() and close().
+    """
+
+    def open(self, sample_rate: int, sample_width: int, num_channels=1):
+        """
+        Prepare the sink for frames of the given format.
+
+        Args:
+            sample_rate: The sample rate.
+            sample_width: The bit width of each sample.
+            num_channels: The number of interleaved channels.
+        """
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.num_channels = num_channels
+
+    def write(self, frames: bytes):
+        """
+        Output frames. May block, e.g. until a device is ready for more.
+
+        Args:
+            frames: Little-endian PCM frames.
+        """
+        raise NotImplementedError()
+
+    def play_blocks(self, render_block, block_size: int):
+        """
+        Pull blocks of frames from render_block until it returns no frames.
+        Sinks which are driven by a device clock override this to render each
+        block on demand. By default, blocks are written one after another.
+
+        Args:
+            render_block: Called with the number of samples to render, and
+                          returns the frames.
+            block_size: The number of samples in each block.
+        """
+        frames = render_block(block_size)
+        while len(frames) > 0:
+            self.write(frames)
+            frames = render_block(block_size)
+
+    def close(self):
+        """
+        Flush and release the sink.
+        """
+        pass
+
+    @property
+    def latency(self) -> float:
+        """
+        The output latency of the sink, in seconds.
+        """
+        return 0.0
+
+
+class PyAudioSink(Sink):
+    """
+    Plays frames through the default PyAudio output device.
+    """
+
+    def __init__(self):
+        self.audio = None
+        self.stream = None
+
+    def open(self, sample_rate: int, sample_width: int, num_channels=1):
+        super().open(sample_rate, sample_width, num_channels)
+
+        if pyaudio is None:
+            raise RuntimeError("PyAudio is required to play through a device.")
+
+        if self.audio is None:
+            self.audio = pyaudio.PyAudio()
+
+    def _open_stream(self, **kwargs):
+        debug("Opening stream.")
+        # 32-bit output is always float.
+        if self.sample_width == 32:
+            sample_format = pyaudio.paFloat32
+        else:
+            sample_format = self.audio.get_format_from_width(
+                self.sample_width / 8)
+
+        self.stream = self.audio.open(
+            format=sample_format,
+            channels=self.num_channels,
+            rate=self.sample_rate,
+            output=True,
+            **kwargs
+        )
+
+    def write(self, frames: bytes):
+        if self.stream is None:
+            self._open_stream()
+        self.stream.write(bytes(frames))
+
+    def play_blocks(self, render_block, block_size: int):
+        def callback(in_data, frame_count, time_info, status):
+            frames = render_block(frame_count)
+            if len(frames) == 0:
+                return (b"", pyaudio.paComplete)
+            return (bytes(frames), pyaudio.paContinue)
+
+        self._open_stream(frames_per_buffer=block_size,
+                          stream_callback=callback)
+
+        # The stream stops itself once the callback reports completion.
+        while self.stream.is_active():
+            time.sleep(0.1)
+
+    def close(self):
+        if self.stream is not None:
+            debug("Closing stream")
+            self.stream.stop_stream()
+            self.stream.close()
+            self.stream = None
+
+    @property
+    def latency(self) -> float:
+        if self.stream is None:
+            return 0.0
+        return self.stream.get_output_latency()
+
+
+class NullSink(Sink):
+    """
+    Discards frames as fast as they are written. Useful for tests and for
+    measuring render speed.
+    """
+
+    def __init__(self):
+        self.num_bytes = 0
+
+    def write(self, frames: bytes):
+        self.num_bytes += len(frames)
+
+
+class MemorySink(Sink):
+    """
+    Collects frames in memory.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def write(self, frames: bytes):
+        self.buffer += frames
+
+    def getvalue(self) -> bytes:
+        """
+        Returns every frame written so far.
+        """
+        return bytes(self.buffer)
+
+
+class PipeSink(Sink):
+    """
+    Writes raw PCM frames to a file descriptor or binary file object, such as
+    the stdin of an encoder:
+
+        >>> encoder = subprocess.Popen(
+        ...     ["ffmpeg", "-f", "s16le", "-ar", "22050", "-ac", "1",
+        ...      "-i", "-", "out.mp3"],
+        ...     stdin=subprocess.PIPE)
+        >>> player = Player(tracks, 22050, sink=PipeSink(encoder.stdin))
+    """
+
+    def __init__(self, output, close_output=False):
+        """
+        Args:
+            output: A file descriptor or a binary file object.
+            close_output: Whether to close the output when the sink closes.
+        """
+        self.output = output
+        self.close_output = close_output
+
+    def write(self, frames: bytes):
+        if isinstance(self.output, int):
+            view = memoryview(frames)
+            while len(view) > 0:
+                view = view[os.write(self.output, view):]
+        else:
+            self.output.write(frames)
+
+    def close(self):
+        if isinstance(self.output, int):
+            if self.close_output:
+                os.close(self.output)
+        else:
+            self.output.flush()
+            if self.close_output:
+                self.output.close()
+
+
+class WavSink(Sink):
+    """
+    Streams frames into a .wav file.
+    """
+
+    def __init__(self, filename: str):
+        """
+        Args:
+            filename: The .wav file to write.
+        """
+        self.filename = filename
+        self.writer = None
+
+    def open(self, sample_rate: int, sample_width: int, num_channels=1):
+        super().open(sample_rate, sample_width, num_channels)
+        self.writer = WavWriter(self.filename,
+                                sample_rate,
+                                sample_width,
+                                num_channels=num_channels)
+
+    def write(self, frames: bytes):
+        self.writer.write(frames)
+
+    def close(self):
+        self.writer.close()
+
+
+class TeeSink(Sink):
+    """
+    Fans every frame out to several sinks, so that one render can be played
+    and saved at the same time. If any of the sinks is driven by a device
+    clock, it drives the others in callback mode.
+    """
+
+    def __init__(self, *sinks):
+        """
+        Args:
+            sinks: The sinks to write to.
+        """
+        self.sinks = sinks
+
+    def open(self, sample_rate: int, sample_width: int, num_channels=1):
+        super().open(sample_rate, sample_width, num_channels)
+        for sink in self.sinks:
+            sink.open(sample_rate, sample_width, num_channels)
+
+    def write(self, frames: bytes):
+        for sink in self.sinks:
+            sink.write(frames)
+
+    def play_blocks(self, render_block, block_size: int):
+        # Let the first device-driven sink pull blocks, and copy each block to
+        # the rest.
+        clocked = [
+            sink for sink in self.sinks
+            if type(sink).play_blocks is not Sink.play_blocks
+        ]
+        if len(clocked) == 0:
+            super().play_blocks(render_block, block_size)
+            return
+
+        driver = clocked[0]
+        others = [sink for sink in self.sinks if sink is not driver]
+
+        def tee_block(num_samples: int) -> bytes:
+            frames = render_block(num_samples)
+            for sink in others:
+                sink.write(frames)
+            return frames
+
+        driver.play_blocks(tee_block, block_size)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+    @property
+    def latency(self) -> float:
+        return max((sink.latency for sink in self.sinks), default=0.0)
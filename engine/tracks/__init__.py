@@ -1 +1,4 @@
-from .tracks import Track, CustomNotesTrack, ImportedAudioTrack
+from .tracks import Track, CustomNotesTrack, ImportedAudioTrack, \
+    EventStore, EventTrack
+from .timeline import MergedTimeline, WaveIndex
+from .midi import TempoMap, read_midi
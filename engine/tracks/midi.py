@@ -0,0 +1,371 @@
+"""
+Standard MIDI File import. Each MIDI track is parsed as a stream of events,
+and the notes of each of its channels are loaded into a CustomNotesTrack in a
+single bulk insert.
+"""
+
+from engine import debug
+from engine.waves import Note
+from .tracks import CustomNotesTrack
+
+from array import array
+from collections import deque
+
+import numpy as np
+import struct
+
+DEFAULT_TEMPO = 500000
+"""
+The tempo of a MIDI file until its first tempo change, in microseconds per
+beat. This is 120 BPM.
+"""
+
+READ_BLOCK_SIZE = 65536
+"""
+The number of bytes of an MTrk chunk read from the file at a time.
+"""
+
+
+def midi_to_freq(keys) -> np.ndarray:
+    """
+    Converts MIDI key numbers to frequencies, tuned to A4 = 440 Hz.
+
+    Args:
+        keys: A MIDI key number, or an array of them.
+
+    Returns:
+        The frequencies, as floats.
+    """
+    return 440.0 * 2.0 ** ((np.asarray(keys, dtype=np.float64) - 69) / 12)
+
+
+class TempoMap(object):
+    """
+    Maps beats to seconds across tempo changes. The start of each tempo is
+    indexed, so converting a beat costs a binary search, and a whole array of
+    beats is converted at once.
+    """
+
+    def __init__(self, changes: list):
+        """
+        Create a tempo map.
+
+        Args:
+            changes: A list of (beat, bpm) tuples. If the first change isn't at
+                     beat 0, the first tempo also applies before it. Changes
+                     at the same beat replace each other in order.
+        """
+        if len(changes) == 0:
+            raise ValueError("A tempo map needs at least one tempo.")
+
+        changes = sorted(changes, key=lambda change: change[0])
+        beats = [0.0]
+        bpms = [changes[0][1]]
+        for beat, bpm in changes:
+            if bpm <= 0:
+                raise ValueError(f"Tempo must be positive, but was: {bpm}")
+            if beat <= beats[-1]:
+                bpms[-1] = bpm
+            else:
+                beats.append(beat)
+                bpms.append(bpm)
+
+        self.beats = np.array(beats, dtype=np.float64)
+        """
+        The beat at which each tempo starts.
+        """
+
+        self.bpms = np.array(bpms, dtype=np.float64)
+        """
+        Each tempo, in beats per minute.
+        """
+
+        self._seconds_per_beat = 60.0 / self.bpms
+        self._starts = np.concatenate((
+            [0.0],
+            np.cumsum(np.diff(self.beats) * self._seconds_per_beat[:-1])))
+
+    def seconds(self, beats) -> np.ndarray:
+        """
+        Converts beats to seconds.
+
+        Args:
+            beats: A beat, or an array of them.
+
+        Returns:
+            The time of each beat, in seconds.
+        """
+        beats = np.asarray(beats, dtype=np.float64)
+        tempos = np.maximum(
+            np.searchsorted(self.beats, beats, side="right") - 1, 0)
+        return self._starts[tempos] + \
+            (beats - self.beats[tempos]) * self._seconds_per_beat[tempos]
+
+
+class _ChunkReader(object):
+    """
+    Reads the bytes of a chunk from a file a block at a time, so that a long
+    track is never held in memory whole. Reading past the end of the chunk,
+    or of the file, raises a ValueError which names the file offset.
+    """
+
+    def __init__(self, f, length: int, filename: str):
+        """
+        Start reading a chunk at the file's current position.
+
+        Args:
+            f: The file, opened in binary mode.
+            length: The length of the chunk, in bytes.
+            filename: The name of the file, for error messages.
+        """
+        self.f = f
+        self.filename = filename
+        self.offset = f.tell()
+        """
+        The file offset of the next byte.
+        """
+
+        self.end = self.offset + length
+        """
+        The file offset just past the chunk.
+        """
+
+        self._block = b""
+        self._pos = 0
+
+    def at_end(self) -> bool:
+        return self.offset >= self.end
+
+    def error(self, message: str, offset=None) -> ValueError:
+        """
+        Creates an error about the chunk at the given file offset, which
+        defaults to the offset of the next byte.
+        """
+        if offset is None:
+            offset = self.offset
+        return ValueError(f"{message} at offset {offset} of {self.filename}.")
+
+    def byte(self) -> int:
+        if self._pos >= len(self._block):
+            size = min(READ_BLOCK_SIZE, self.end - self.offset)
+            self._block = self.f.read(size) if size > 0 else b""
+            self._pos = 0
+            if len(self._block) == 0:
+                raise self.error("Truncated MIDI track")
+
+        byte = self._block[self._pos]
+        self._pos += 1
+        self.offset += 1
+        return byte
+
+    def read(self, length: int) -> bytes:
+        if length > self.end - self.offset:
+            raise self.error("Truncated MIDI track")
+
+        data = self._block[self._pos:self._pos + length]
+        self._pos += len(data)
+        if len(data) < length:
+            # The block is used up, so carry on from the file.
+            data += self.f.read(length - len(data))
+            if len(data) < length:
+                raise self.error("Truncated MIDI track",
+                                 self.offset + len(data))
+        self.offset += length
+        return data
+
+    def read_varlen(self) -> int:
+        """
+        Reads a variable-length quantity, which is at most 4 bytes long.
+        """
+        offset = self.offset
+        value = 0
+        for i in range(4):
+            byte = self.byte()
+            value = (value << 7) | (byte & 0x7F)
+            if byte < 0x80:
+                return value
+        raise self.error("Malformed variable-length quantity", offset)
+
+
+class _MidiTrack(object):
+    """
+    The notes and tempo changes of one MIDI track, in ticks.
+    """
+
+    def __init__(self, index: int):
+        self.name = f"Track {index}"
+        self.tempos = []
+
+        # The notes of each channel, as parallel arrays.
+        self.on_ticks = {}
+        self.off_ticks = {}
+        self.keys = {}
+
+    def add_note(self, channel: int, on_tick: int, off_tick: int, key: int):
+        if channel not in self.keys:
+            self.on_ticks[channel] = array("q")
+            self.off_ticks[channel] = array("q")
+            self.keys[channel] = array("B")
+        self.on_ticks[channel].append(on_tick)
+        self.off_ticks[channel].append(off_tick)
+        self.keys[channel].append(key)
+
+
+def _parse_track(reader: _ChunkReader, index: int) -> _MidiTrack:
+    """
+    Parses the events of an MTrk chunk in a single pass, as they are read.
+    """
+    track = _MidiTrack(index)
+
+    # Note ons waiting for their note off, keyed by (channel << 7) | key.
+    # Overlapping notes on the same key are closed first in, first out.
+    pending = {}
+
+    tick = 0
+    status = 0
+    while not reader.at_end():
+        tick += reader.read_varlen()
+
+        offset = reader.offset
+        byte = reader.byte()
+        if byte >= 0x80:
+            status = byte
+            byte = None
+        elif status == 0:
+            raise reader.error(
+                f"Data byte without a status in MIDI track {index}", offset)
+
+        kind = status & 0xF0
+        if kind == 0x90 or kind == 0x80:
+            key = reader.byte() if byte is None else byte
+            velocity = reader.byte()
+
+            note = ((status & 0x0F) << 7) | key
+            if kind == 0x90 and velocity > 0:
+                pending.setdefault(note, deque()).append(tick)
+            elif note in pending:
+                on_ticks = pending[note]
+                track.add_note(status & 0x0F, on_ticks.popleft(), tick, key)
+                if len(on_ticks) == 0:
+                    del pending[note]
+        elif kind == 0xC0 or kind == 0xD0:
+            if byte is None:
+                reader.byte()
+        elif kind != 0xF0:
+            if byte is None:
+                reader.byte()
+            reader.byte()
+        elif status == 0xFF:
+            meta_type = reader.byte()
+            data = reader.read(reader.read_varlen())
+            if meta_type == 0x51 and len(data) == 3:
+                track.tempos.append((tick, int.from_bytes(data, "big")))
+            elif meta_type == 0x03:
+                track.name = data.decode("latin-1")
+            elif meta_type == 0x2F:
+                break
+            status = 0
+        elif status == 0xF0 or status == 0xF7:
+            reader.read(reader.read_varlen())
+            status = 0
+        else:
+            raise reader.error(
+                f"Unsupported MIDI status {status:#x} in track {index}",
+                offset)
+
+    # Notes which are never released stop at the end of the track.
+    for note, on_ticks in pending.items():
+        for on_tick in on_ticks:
+            track.add_note(note >> 7, on_tick, tick, note & 0x7F)
+
+    return track
+
+
+def read_midi(filename: str, sample_rate=22050, instrument=Note) -> list:
+    """
+    Imports a Standard MIDI File. Every channel of every MIDI track that has
+    notes becomes a CustomNotesTrack. Tempo changes apply to every track.
+    Velocities and controllers are ignored.
+
+    Args:
+        filename: The MIDI file to read.
+        sample_rate: The sample rate of the tracks.
+        instrument: The Note class which plays the notes.
+
+    Returns:
+        A list of CustomNotesTracks, in the order of their MIDI tracks and
+        channels.
+    """
+    with open(filename, "rb") as f:
+        chunk_type, length = struct.unpack(">4sI", f.read(8))
+        if chunk_type != b"MThd" or length < 6:
+            raise ValueError(f"{filename} is not a MIDI file.")
+
+        file_format, num_tracks, division = struct.unpack(
+            ">HHH", f.read(length)[:6])
+        if file_format not in (0, 1):
+            raise ValueError(
+                f"Unsupported MIDI file format {file_format} in {filename}.")
+
+        # Tracks are parsed as they are read, a block at a time, so neither
+        # the file nor a whole track is ever held in memory.
+        midi_tracks = []
+        while len(midi_tracks) < num_tracks:
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            chunk_type, length = struct.unpack(">4sI", header)
+            if chunk_type == b"MTrk":
+                reader = _ChunkReader(f, length, filename)
+                midi_tracks.append(_parse_track(reader, len(midi_tracks)))
+                end = reader.end
+            else:
+                end = f.tell() + length
+
+            # Tracks may end before their chunk does.
+            f.seek(end)
+
+    if division & 0x8000:
+        # SMPTE timing counts ticks per second, regardless of tempo. Treat a
+        # second as a beat at 60 BPM.
+        frames_per_second = 256 - (division >> 8)
+        ticks_per_beat = frames_per_second * (division & 0xFF)
+        tempo_map = TempoMap([(0.0, 60.0)])
+    else:
+        ticks_per_beat = division
+        changes = [(tick / ticks_per_beat, 60e6 / tempo)
+                   for midi_track in midi_tracks
+                   for tick, tempo in midi_track.tempos]
+        tempo_map = TempoMap([(0.0, 60e6 / DEFAULT_TEMPO)] + changes)
+
+    tracks = []
+    for midi_track in midi_tracks:
+        for channel in sorted(midi_track.keys):
+            name = midi_track.name
+            if len(midi_track.keys) > 1:
+                name = f"{name} (channel {channel + 1})"
+
+            on_ticks = np.frombuffer(midi_track.on_ticks[channel],
+                                     dtype=np.int64)
+            off_ticks = np.frombuffer(midi_track.off_ticks[channel],
+                                      dtype=np.int64)
+            start_samples = np.rint(
+                tempo_map.seconds(on_ticks / ticks_per_beat) * sample_rate)
+            end_samples = np.rint(
+                tempo_map.seconds(off_ticks / ticks_per_beat) * sample_rate)
+
+            track = CustomNotesTrack(name,
+                                     float(tempo_map.bpms[0]),
+                                     sample_rate=sample_rate,
+                                     instrument=instrument)
+            track.add_notes(start_samples,
+                            end_samples - start_samples,
+                            midi_to_freq(midi_track.keys[channel]),
+                            instrument)
+
+            # Notes appended by hand go after the imported ones.
+            track.offset = float(end_samples.max()) / sample_rate
+            tracks.append(track)
+
+    debug("Imported {} tracks from {}", len(tracks), filename)
+    return tracks
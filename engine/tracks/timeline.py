@@ -0,0 +1,185 @@
+"""
+Views and indexes over the timed waves of tracks. A MergedTimeline combines
+several tracks without copying them, and a WaveIndex can be queried for the
+waves that are playing during a given interval.
+"""
+
+from bisect import bisect_left
+
+import heapq
+
+
+def _wave_time(wave) -> float:
+    return wave.time
+
+
+class MergedTimeline(object):
+    """
+    Read-only, time-ordered view over the waves of several tracks. The tracks'
+    waves are already sorted, so they are merged lazily with a heap each time
+    the view is iterated. No waves are copied and the tracks are never
+    modified, so a timeline can be built as often as needed.
+
+    Waves at the same time are ordered by track, then by their order within
+    the track, the same as summing the tracks.
+    """
+
+    def __init__(self, tracks: list):
+        """
+        Create a view over the given tracks.
+
+        Args:
+            tracks: A list of Tracks, which must share a sample rate.
+        """
+        self.tracks = list(tracks)
+        self.sample_rate = None
+
+        for track in self.tracks:
+            if self.sample_rate is None:
+                self.sample_rate = track.sample_rate
+            elif track.sample_rate != self.sample_rate:
+                raise ValueError(
+                    f"Could not merge {track.name} with " +
+                    f"{self.tracks[0].name}. Mismatched sample rates.")
+
+    def __len__(self):
+        return sum(len(track.waveforms) for track in self.tracks)
+
+    def __iter__(self):
+        return heapq.merge(*[track.waveforms for track in self.tracks],
+                           key=_wave_time)
+
+    def items(self):
+        """
+        Iterate over (track, TimedWave) pairs in time order, to tell which
+        track each wave belongs to.
+        """
+        def track_items(track):
+            for wave in track.waveforms:
+                yield track, wave
+
+        return heapq.merge(*[track_items(track) for track in self.tracks],
+                           key=lambda item: item[1].time)
+
+
+class _Node(object):
+    """
+    A node in a centered interval tree. Holds every interval which contains the
+    node's center, sorted both by start time and by end time.
+    """
+
+    __slots__ = ("center", "by_start", "starts", "by_end", "ends", "left",
+                 "right")
+
+    def __init__(self, center: float, intervals: list):
+        self.center = center
+
+        # Intervals are (start, end, position, wave) tuples.
+        self.by_start = sorted(intervals, key=lambda i: i[0])
+        self.starts = [i[0] for i in self.by_start]
+        self.by_end = sorted(intervals, key=lambda i: i[1])
+        self.ends = [i[1] for i in self.by_end]
+        self.left = None
+        self.right = None
+
+
+class WaveIndex(object):
+    """
+    Static interval index over a sorted list of TimedWaves. Each wave occupies
+    the interval [time, time + duration].
+
+    Looking up the waves that are active in an interval costs O(log M + k) for
+    M waves, k of which are active.
+    """
+
+    def __init__(self, waveforms: list):
+        """
+        Build an index over the given waves.
+
+        Args:
+            waveforms: A list of TimedWaves, sorted by time.
+        """
+        self.waveforms = waveforms
+
+        intervals = [
+            (wave.time, wave.time + wave.waveform.duration, position, wave)
+            for position, wave in enumerate(waveforms)
+        ]
+
+        self.end_time = max((i[1] for i in intervals), default=float("-inf"))
+        """
+        The time at which the last wave stops playing.
+        """
+
+        self._root = self._build(intervals)
+
+    def __len__(self):
+        return len(self.waveforms)
+
+    def _build(self, intervals: list) -> _Node:
+        """
+        Recursively builds a centered interval tree.
+        """
+        if len(intervals) == 0:
+            return None
+
+        # Use the median endpoint as the center so that the tree is balanced.
+        endpoints = sorted(e for i in intervals for e in (i[0], i[1]))
+        center = endpoints[len(endpoints) // 2]
+
+        left, here, right = [], [], []
+        for interval in intervals:
+            if interval[1] < center:
+                left.append(interval)
+            elif interval[0] > center:
+                right.append(interval)
+            else:
+                here.append(interval)
+
+        node = _Node(center, here)
+        node.left = self._build(left)
+        node.right = self._build(right)
+        return node
+
+    def active_at(self, t0: float, t1: float) -> list:
+        """
+        Find every wave that is playing at some point in [t0, t1). A wave which
+        ends exactly at t0 is included.
+
+        Args:
+            t0: The start of the interval (inclusive).
+            t1: The end of the interval (exclusive).
+
+        Returns:
+            The active TimedWaves, in the same order as the indexed list.
+        """
+        found = []
+        node = self._root
+        stack = []
+        while node is not None or len(stack) > 0:
+            if node is None:
+                node = stack.pop()
+
+            if t1 <= node.center:
+                # Every interval here ends at or after t1, so only the start
+                # matters.
+                # Nothing to the right can start before t1.
+                count = bisect_left(node.starts, t1)
+                found.extend(node.by_start[:count])
+                node = node.left
+            elif t0 > node.center:
+                # Every interval here starts before t0, so only the end
+                # matters. Nothing to the left can end after t0.
+                count = bisect_left(node.ends, t0)
+                found.extend(node.by_end[count:])
+                node = node.right
+            else:
+                # The center is within the interval, so everything here is
+                # active and both subtrees may be.
+                found.extend(node.by_start)
+                if node.right is not None:
+                    stack.append(node.right)
+                node = node.left
+
+        found.sort(key=lambda i: i[2])
+        return [i[3] for i in found]
@@ -4,10 +4,23 @@ as a series of notes or chords. Tracks may also be an imported waveform or a
 concatenation of several waveforms.
 """
 
-from engine.waves import Note, Waveform, WavFile
+from engine.waves import ASSETS, Note, ResampledWave, Waveform, WavFile
+from engine.waves.notes import NOTES
 
 from sortedcontainers import SortedList
 
+import hashlib
+import math
+import numpy as np
+import weakref
+
+SHORT_EVENT_SHARE = 0.99
+"""
+The share of events an EventStore treats as short. Looking up the active
+events scans every event which started within the length of the longest short
+event, and finds the longer ones through an index of their ends.
+"""
+
 
 def beat_to_duration(tempo, beat):
     # tempo is in bpm.
@@ -47,14 +60,22 @@ class Track(object):
 
     def add_waveform(self, time: float, waveform: Waveform):
         """
-        Adds a raw waveform to this track.
+        Adds a raw waveform to this track. Audio files at another sample rate
+        are resampled to the track's rate.
         """
         if time < 0.0:
             raise ValueError("Time offset must be non-negative.")
 
         if waveform.sample_rate != self.sample_rate:
-            raise ValueError(
-                "Sample rate of waveform does not match the rest of the track!")
+            # Resample the original audio rather than a resampled copy.
+            if isinstance(waveform, ResampledWave):
+                waveform = waveform.waveform
+            if not isinstance(waveform, WavFile):
+                raise ValueError(
+                    "Sample rate of waveform does not match the rest of the " +
+                    "track!")
+            if waveform.sample_rate != self.sample_rate:
+                waveform = ResampledWave(waveform, self.sample_rate)
         self.waveforms.add(TimedWave(time, waveform))
 
     def __add__(self, other):
@@ -67,7 +88,7 @@ class Track(object):
                 f"Mistmached sample rates.")
 
         for wave in other.waveforms:
-            self.waveforms.add(wave)
+            self.add_waveform(wave.time, wave.waveform)
         return self
 
     def __radd__(self, other):
@@ -80,22 +101,566 @@ class Track(object):
             return self.__add__(other)
 
 
-class CustomNotesTrack(Track):
-    def __init__(self, name, tempo, sample_rate=22050):
+class EventStore(object):
+    """
+    Compact, sorted store of note events. Each event is a row of parallel
+    arrays: its start sample, its length in samples, its frequency and the id
+    of its instrument, which is the Note class that plays it.
+
+    Events are appended in any order, one at a time or in bulk, and sorted
+    once when the store is next read. Waveforms are only created for the
+    events that are playing, when playback reaches them, so a track of
+    millions of notes costs a few dozen bytes per note.
+
+    Iterating or indexing the store yields TimedWaves in time order, like the
+    SortedList of a Track. They're created on demand, so the store is only
+    modified through append() and extend(), not SortedList.add().
+    """
+
+    def __init__(self, sample_rate: int, capacity=1024):
+        """
+        Create an empty store.
+
+        Args:
+            sample_rate: The sample rate of the events.
+            capacity: The number of events to allocate room for up front.
+        """
+        self.sample_rate = sample_rate
+
+        self.instruments = []
+        """
+        The Note classes of the events, indexed by instrument id.
+        """
+
+        self._size = 0
+        self._starts = np.empty(capacity, dtype=np.int64)
+        self._lengths = np.empty(capacity, dtype=np.int64)
+        self._freqs = np.empty(capacity, dtype=np.float64)
+        self._instrument_ids = np.empty(capacity, dtype=np.int32)
+        self._sorted = True
+        self._last_start = 0
+        self._max_length = 0
+
+        # Built by finalize(). See _index().
+        self._indexed = True
+        self._short_length = 0
+        self._max_ends = []
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        self.finalize()
+        for i in range(self._size):
+            yield self._wave(i)
+
+    def __getitem__(self, index):
+        """
+        Gets the TimedWave of the event at a position in time order, or a
+        list of them for a slice.
+        """
+        self.finalize()
+        if isinstance(index, slice):
+            return [self._wave(i) for i in range(*index.indices(self._size))]
+
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("EventStore index out of range")
+        return self._wave(index)
+
+    @property
+    def end_sample(self) -> int:
+        """
+        The sample at which the last event stops playing.
+        """
+        if self._size == 0:
+            return 0
+        return int((self._starts[:self._size] +
+                    self._lengths[:self._size]).max())
+
+    @property
+    def end_time(self) -> float:
+        """
+        The time at which the last event stops playing, like
+        WaveIndex.end_time.
+        """
+        if self._size == 0:
+            return float("-inf")
+        return self.end_sample / self.sample_rate
+
+    def instrument_id(self, instrument: type) -> int:
+        """
+        Gets the id of an instrument, registering it if it's new.
+
+        Args:
+            instrument: A Note class, which is created with a frequency, a
+                        duration and a sample rate.
+        """
+        if not (isinstance(instrument, type) and issubclass(instrument, Note)):
+            raise ValueError(f"{instrument} is not a Note class.")
+
+        try:
+            return self.instruments.index(instrument)
+        except ValueError:
+            self.instruments.append(instrument)
+            return len(self.instruments) - 1
+
+    def append(self,
+               start_sample: int,
+               num_samples: int,
+               freq: float,
+               instrument=Note):
+        """
+        Appends a single event.
+
+        Args:
+            start_sample: The sample at which the event starts.
+            num_samples: The length of the event, in samples.
+            freq: The frequency of the note.
+            instrument: The Note class which plays the event.
+        """
+        if start_sample < 0:
+            raise ValueError("Start samples must be non-negative.")
+        if num_samples < 0:
+            raise ValueError("Lengths must be non-negative.")
+        if freq < 0.0:
+            raise ValueError("Frequencies must be non-negative.")
+
+        instrument_id = self.instrument_id(instrument)
+        self._reserve(self._size + 1)
+
+        # Plain scalar stores, since this is called once per note.
+        i = self._size
+        self._starts[i] = start_sample
+        self._lengths[i] = num_samples
+        self._freqs[i] = freq
+        self._instrument_ids[i] = instrument_id
+
+        if start_sample < self._last_start:
+            self._sorted = False
+        self._last_start = start_sample
+        self._max_length = max(self._max_length, num_samples)
+        self._indexed = False
+        self._size += 1
+
+    def extend(self,
+               start_samples,
+               num_samples,
+               freqs,
+               instrument=Note):
+        """
+        Appends many events at once, played by the same instrument.
+
+        Args:
+            start_samples: The sample at which each event starts.
+            num_samples: The length of each event, in samples.
+            freqs: The frequency of each note.
+            instrument: The Note class which plays the events.
+        """
+        start_samples = np.asarray(start_samples, dtype=np.int64)
+        num_samples = np.asarray(num_samples, dtype=np.int64)
+        freqs = np.asarray(freqs, dtype=np.float64)
+
+        count = len(start_samples)
+        if len(num_samples) != count or len(freqs) != count:
+            raise ValueError(
+                "start_samples, num_samples and freqs must be the same " +
+                "length.")
+        if count == 0:
+            return
+
+        if start_samples.min() < 0:
+            raise ValueError("Start samples must be non-negative.")
+        if num_samples.min() < 0:
+            raise ValueError("Lengths must be non-negative.")
+        if freqs.min() < 0.0:
+            raise ValueError("Frequencies must be non-negative.")
+
+        instrument_id = self.instrument_id(instrument)
+        self._reserve(self._size + count)
+
+        end = self._size + count
+        self._starts[self._size:end] = start_samples
+        self._lengths[self._size:end] = num_samples
+        self._freqs[self._size:end] = freqs
+        self._instrument_ids[self._size:end] = instrument_id
+
+        if start_samples[0] < self._last_start or \
+                (np.diff(start_samples) < 0).any():
+            self._sorted = False
+        self._last_start = int(start_samples[-1])
+        self._max_length = max(self._max_length, int(num_samples.max()))
+        self._indexed = False
+        self._size = end
+
+    def merge(self, other: "EventStore"):
+        """
+        Appends every event of another store, copying its arrays rather than
+        creating a waveform per event.
+
+        Args:
+            other: The store to copy, at the same sample rate.
+        """
+        if other.sample_rate != self.sample_rate:
+            raise ValueError(
+                "Sample rate of events does not match the rest of the store!")
+
+        count = other._size
+        if count == 0:
+            return
+
+        # Instrument ids are local to a store, so map them to ours.
+        other.finalize()
+        instrument_ids = np.array(
+            [self.instrument_id(instrument)
+             for instrument in other.instruments],
+            dtype=np.int32)
+        self._reserve(self._size + count)
+
+        end = self._size + count
+        self._starts[self._size:end] = other._starts[:count]
+        self._lengths[self._size:end] = other._lengths[:count]
+        self._freqs[self._size:end] = other._freqs[:count]
+        self._instrument_ids[self._size:end] = \
+            instrument_ids[other._instrument_ids[:count]]
+
+        if other._starts[0] < self._last_start:
+            self._sorted = False
+        self._last_start = int(other._starts[count - 1])
+        self._max_length = max(self._max_length, other._max_length)
+        self._indexed = False
+        self._size = end
+
+    def _reserve(self, capacity: int):
+        """
+        Grows the arrays to hold at least capacity events, doubling them so
+        that appending one event at a time stays cheap.
+        """
+        if capacity <= len(self._starts):
+            return
+
+        capacity = max(capacity, 2 * len(self._starts))
+        for name in ("_starts", "_lengths", "_freqs", "_instrument_ids"):
+            old = getattr(self, name)
+            new = np.empty(capacity, dtype=old.dtype)
+            new[:self._size] = old[:self._size]
+            setattr(self, name, new)
+
+    def finalize(self):
+        """
+        Sorts the events by start sample and indexes them. Events which start
+        together keep the order they were added in. Called automatically
+        before the events are read.
+        """
+        if not self._sorted:
+            order = np.argsort(self._starts[:self._size], kind="stable")
+            for name in ("_starts", "_lengths", "_freqs", "_instrument_ids"):
+                values = getattr(self, name)
+                values[:self._size] = values[:self._size][order]
+            self._last_start = int(self._starts[self._size - 1])
+            self._sorted = True
+
+        if not self._indexed:
+            self._index()
+
+    def _index(self):
+        """
+        Splits the sorted events into short and long ones. Short events are
+        found by their start, and long ones through a tree of the latest end
+        of each block of events: _max_ends[level][block] is the latest end of
+        events [block << level, (block + 1) << level).
+        """
+        lengths = self._lengths[:self._size]
+        self._short_length = 0
+        self._max_ends = []
+
+        if self._size > 0:
+            k = min(self._size - 1, int(self._size * SHORT_EVENT_SHARE))
+            self._short_length = int(np.partition(lengths, k)[k])
+
+        # Most tracks have no long events at all.
+        if self._max_length > self._short_length:
+            size = 1 << (self._size - 1).bit_length()
+            ends = np.full(size, np.iinfo(np.int64).min, dtype=np.int64)
+            ends[:self._size] = self._starts[:self._size] + lengths
+            self._max_ends.append(ends)
+            while len(ends) > 1:
+                ends = ends.reshape(-1, 2).max(axis=1)
+                self._max_ends.append(ends)
+
+        self._indexed = True
+
+    def active(self, start_sample: int, end_sample: int) -> np.ndarray:
+        """
+        Finds the events which are playing at some point in
+        [start_sample, end_sample).
+
+        Returns:
+            The indices of the active events, in time order.
+        """
+        self.finalize()
+        starts = self._starts[:self._size]
+
+        # Short events which start earlier than _short_length before the
+        # interval have already stopped.
+        first = np.searchsorted(starts, start_sample - self._short_length,
+                                side="right")
+        last = np.searchsorted(starts, end_sample, side="left")
+
+        indices = np.arange(first, last)
+        ends = starts[first:last] + self._lengths[first:last]
+        indices = indices[ends > start_sample]
+
+        if self._max_ends:
+            indices = np.concatenate(
+                (self._playing_before(first, start_sample), indices))
+        return indices
+
+    def _playing_before(self, first: int, start_sample: int) -> np.ndarray:
+        """
+        Finds the events before index first which are still playing at
+        start_sample, descending the tree of _max_ends through the blocks
+        which end after it. Costs O(log M) per event found.
+        """
+        blocks = np.zeros(1, dtype=np.int64)
+        for level in range(len(self._max_ends) - 1, -1, -1):
+            ends = self._max_ends[level]
+            blocks = blocks[((blocks << level) < first) &
+                            (ends[blocks] > start_sample)]
+            if level > 0:
+                blocks = (2 * blocks[:, np.newaxis] + [0, 1]).ravel()
+        return blocks
+
+    def place(self, start_sample: int, num_samples: int) -> list:
+        """
+        Finds the events which are playing in an interval and where each one
+        lands, in integer samples.
+
+        Args:
+            start_sample: The first sample of the interval.
+            num_samples: The number of samples in the interval.
+
+        Returns:
+            A list of (wave, interval_start_idx, wave_start_idx, wave_end_idx)
+            tuples, the same as WaveCollapser uses.
+        """
+        indices = self.active(start_sample, start_sample + num_samples)
+        offsets = self._starts[indices] - start_sample
+        interval_starts = np.maximum(0, offsets)
+        wave_starts = np.maximum(0, -offsets)
+        wave_ends = np.minimum(self._lengths[indices],
+                               wave_starts + num_samples - interval_starts)
+
+        return [
+            (self._wave(i), interval_start, wave_start, wave_end)
+            for i, interval_start, wave_start, wave_end in zip(
+                indices.tolist(),
+                interval_starts.tolist(),
+                wave_starts.tolist(),
+                wave_ends.tolist())
+        ]
+
+    def digest(self) -> bytes:
+        """
+        Hashes the events and the sound of every instrument and frequency
+        they use, without creating a waveform per event.
+
+        Returns:
+            A SHA-256 digest.
+        """
+        self.finalize()
+        h = hashlib.sha256()
+        for name in ("_starts", "_lengths", "_freqs", "_instrument_ids"):
+            h.update(getattr(self, name)[:self._size].tobytes())
+
+        # An instrument sounds different at each frequency, so fingerprint
+        # the first note of each pair.
+        pairs = np.column_stack((self._instrument_ids[:self._size],
+                                 self._freqs[:self._size]))
+        _, firsts = np.unique(pairs, axis=0, return_index=True)
+        for i in np.sort(firsts).tolist():
+            h.update(repr(self._wave(i).waveform.fingerprint()).encode())
+        return h.digest()
+
+    def _wave(self, i: int) -> TimedWave:
+        """
+        Creates the TimedWave of event i.
+        """
+        num_samples = int(self._lengths[i])
+        duration = num_samples / self.sample_rate
+
+        # Make sure the waveform has every sample of the event, even if the
+        # division rounded down.
+        if int(duration * self.sample_rate) < num_samples:
+            duration = math.nextafter(duration, math.inf)
+
+        instrument = self.instruments[self._instrument_ids[i]]
+        return TimedWave(
+            int(self._starts[i]) / self.sample_rate,
+            instrument(float(self._freqs[i]), duration, self.sample_rate))
+
+
+class EventTrack(Track):
+    """
+    A track of notes, kept in an EventStore instead of as waveforms. Building
+    one is much faster and smaller than adding a Note per event to a Track,
+    and timing is kept in whole samples.
+    """
+
+    def __init__(self, name, sample_rate=22050):
+        """
+        Creates an empty event track.
+        """
+        super().__init__(name, sample_rate=sample_rate)
+
+        self.waveforms = EventStore(sample_rate)
+
+    def add_waveform(self, time: float, waveform: Waveform):
+        """
+        Adds a note to this track. Only Notes can be added, and they are
+        stored as events, so they are recreated from their class, frequency
+        and duration. Notes configured any other way, like a WavetableNote
+        given its shape, can't be added.
+        """
+        if not isinstance(waveform, Note):
+            raise ValueError(
+                f"{self.name} can only hold notes, not {waveform}.")
+
+        if waveform.sample_rate != self.sample_rate:
+            raise ValueError(
+                "Sample rate of waveform does not match the rest of the track!")
+
+        if not self._can_hold(waveform):
+            raise ValueError(
+                f"{self.name} can only hold notes which are recreated from " +
+                f"their frequency and duration, but {waveform} was " +
+                f"configured otherwise. Subclass {type(waveform).__name__} " +
+                "instead.")
+
+        self.add_note(time,
+                      waveform.duration,
+                      waveform.freq,
+                      instrument=type(waveform))
+
+    def _can_hold(self, waveform: Waveform) -> bool:
+        """
+        Whether a waveform can be stored as an event, and sounds the same
+        when it's recreated from the event.
+        """
+        if not isinstance(waveform, Note) or \
+                waveform.sample_rate != self.sample_rate:
+            return False
+
+        try:
+            recreated = type(waveform)(waveform.freq,
+                                       waveform.duration,
+                                       waveform.sample_rate)
+        except (TypeError, ValueError):
+            return False
+        return recreated.fingerprint() == waveform.fingerprint()
+
+    def __add__(self, other):
+        """
+        Concatenates this track with another track. The events of another
+        EventTrack are copied as they are. If the other track holds anything
+        but notes, both are concatenated into a new Track instead, since
+        events can only hold notes.
+        """
+        if self.sample_rate != other.sample_rate:
+            raise ValueError(
+                f"Could not concatenate {self.name} with {other.name}. "
+                f"Mistmached sample rates.")
+
+        if isinstance(other.waveforms, EventStore):
+            self.waveforms.merge(other.waveforms)
+            return self
+
+        waves = list(other.waveforms)
+        if all(self._can_hold(wave.waveform) for wave in waves):
+            for wave in waves:
+                self.add_note(wave.time,
+                              wave.waveform.duration,
+                              wave.waveform.freq,
+                              instrument=type(wave.waveform))
+            return self
+
+        track = Track(self.name, sample_rate=self.sample_rate)
+        return track + self + other
+
+    def add_note(self,
+                 time: float,
+                 duration: float,
+                 freq: float,
+                 instrument=Note):
+        """
+        Adds a note event to this track.
+
+        Args:
+            time: When the note starts, in seconds.
+            duration: The duration of the note, in seconds.
+            freq: The frequency of the note.
+            instrument: The Note class which plays the note.
+        """
+        if time < 0.0:
+            raise ValueError("Time offset must be non-negative.")
+
+        # Both ends are rounded to the nearest sample, like append_note().
+        start_sample = round(time * self.sample_rate)
+        end_sample = round((time + duration) * self.sample_rate)
+        self.waveforms.append(start_sample,
+                              end_sample - start_sample,
+                              freq,
+                              instrument)
+
+    def add_notes(self,
+                  start_samples,
+                  num_samples,
+                  freqs,
+                  instrument=Note):
+        """
+        Adds many note events at once. See EventStore.extend().
+        """
+        self.waveforms.extend(start_samples, num_samples, freqs, instrument)
+
+
+class CustomNotesTrack(EventTrack):
+    def __init__(self, name, tempo, sample_rate=22050, instrument=Note):
         """
         Creates a notes track with the specified tempo.
+
+        Args:
+            name: The name of the track.
+            tempo: The tempo, in beats per minute.
+            sample_rate: The sample rate.
+            instrument: The Note class which plays appended notes, like a
+                        SampledInstrument.
         """
         super().__init__(name, sample_rate=sample_rate)
 
         self.tempo = tempo
         self.offset = 0.0
+        self.instrument = instrument
+
+        # Fail fast on anything that isn't a Note class.
+        self.waveforms.instrument_id(instrument)
 
     def append_note(self, beat: float, note: str):
         """
         Append a new note to the end of this track.
         """
+        if note not in NOTES:
+            raise ValueError(f"{note} is not a valid note.")
+
+        # Both ends are rounded to the nearest sample, so consecutive notes
+        # meet exactly, however long the track is.
         duration = beat_to_duration(self.tempo, beat)
-        self.add_waveform(self.offset, Note(note, duration, self.sample_rate))
+        start_sample = round(self.offset * self.sample_rate)
+        end_sample = round((self.offset + duration) * self.sample_rate)
+        self.waveforms.append(start_sample,
+                              end_sample - start_sample,
+                              NOTES[note],
+                              self.instrument)
         self.offset += duration
 
     def append_rest(self, beat: float):
@@ -106,12 +671,40 @@ class CustomNotesTrack(Track):
 
 
 class ImportedAudioTrack(Track):
-    def __init__(self, name, sample_rate=22050):
+    def __init__(self, name, sample_rate=22050, assets=ASSETS):
         """
         Creates a track that imports audio.
+
+        Args:
+            name: The name of the track.
+            sample_rate: The sample rate.
+            assets: The AssetRegistry to share files through, or None to load
+                    every file separately.
         """
         super().__init__(name, sample_rate=sample_rate)
 
+        self.assets = assets
+
+    def __getstate__(self):
+        # Registries belong to a process, so copies load their own files.
+        state = self.__dict__.copy()
+        state["assets"] = None
+        return state
+
     def add_wav_file(self, offset: float, filename: str):
-        wav_file = WavFile(filename)
-        self.add_waveform(offset, wav_file)
\ No newline at end of file
+        """
+        Adds a .wav file at the given offset. Every use of a file shares the
+        same WavFile from the registry, which is released once the track is
+        garbage collected.
+        """
+        if self.assets is None:
+            self.add_waveform(offset, WavFile(filename))
+            return
+
+        wav_file = self.assets.acquire(filename)
+        try:
+            self.add_waveform(offset, wav_file)
+        except ValueError:
+            self.assets.release(wav_file)
+            raise
+        weakref.finalize(self, self.assets.release, wav_file)
@@ -1,2 +1,9 @@
-from .wav import WavFile
-from .waveform import Waveform, Note
\ No newline at end of file
+from .cache import LRUCache, NOTE_CACHE
+from .wav import WavFile, WavReader, WavWriter
+from .assets import AssetRegistry, ASSETS
+from .library import SampleLibrary, WavInfo
+from .waveform import Waveform, Note
+from .resample import Resampler, ResampledWave, RESAMPLE_CACHE, resample
+from .oscillator import sine_bank
+from .wavetable import WavetableNote, SquareNote, SawNote, TriangleNote
+from .instrument import SampledInstrument
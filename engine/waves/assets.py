@@ -0,0 +1,242 @@
+"""
+Shared registry of imported audio files. Every use of a file within a process
+shares a single WavFile and a single decoded, read-only copy of its samples,
+however many times it's triggered.
+"""
+
+from engine import debug
+from .wav import WavFile
+
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+
+import os
+
+PRELOAD_WORKERS = 4
+"""
+The default number of threads which decode files in the background.
+"""
+
+
+class _Entry(object):
+    """
+    A file in the registry. The future resolves to its WavFile once it has
+    been loaded.
+    """
+
+    __slots__ = ("stamp", "future", "refs", "num_bytes")
+
+    def __init__(self, stamp: tuple):
+        self.stamp = stamp
+        self.future = Future()
+        self.refs = 0
+        self.num_bytes = 0
+
+
+class AssetRegistry(object):
+    """
+    Resolves paths to shared WavFiles, decoded once into float32.
+
+    Files are keyed by absolute path and checked against their size and
+    modification time whenever they are acquired. A file which changed on
+    disk is loaded again, while holders of the old version keep using it.
+
+    Each acquire() must be paired with a release(). Files that nobody holds
+    stay decoded until the decoded samples exceed the memory budget, and are
+    then evicted least recently used first. Files which are held are never
+    evicted. Files too large for the budget are never decoded, and are read
+    from their memory map instead.
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        Create an empty registry.
+
+        Args:
+            max_bytes: The budget for decoded samples, in bytes.
+        """
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def acquire(self, filename: str) -> WavFile:
+        """
+        Gets the shared WavFile of a file, loading and decoding it if it isn't
+        loaded or has changed on disk. If another thread is loading the file,
+        waits for it instead.
+
+        Args:
+            filename: The .wav file.
+
+        Returns:
+            The shared WavFile. Must be handed back with release().
+        """
+        path = os.path.abspath(filename)
+        stat = os.stat(path)
+        stamp = (stat.st_size, stat.st_mtime_ns)
+
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and entry.stamp != stamp:
+                debug("Reloading changed asset {}", path)
+                self._remove(path)
+                self.reloads += 1
+                entry = None
+
+            load = entry is None
+            if load:
+                entry = self._entries[path] = _Entry(stamp)
+                self.misses += 1
+            else:
+                self._entries.move_to_end(path)
+                self.hits += 1
+            entry.refs += 1
+
+        if load:
+            self._load(path, entry)
+
+        try:
+            return entry.future.result()
+        except Exception:
+            with self._lock:
+                entry.refs -= 1
+            raise
+
+    def release(self, wav_file: WavFile):
+        """
+        Hands back a WavFile from acquire(). Once nobody holds it, it may be
+        evicted.
+
+        Args:
+            wav_file: The WavFile to release.
+        """
+        path = os.path.abspath(wav_file.filename)
+        with self._lock:
+            entry = self._entries.get(path)
+
+            # Files which were reloaded since aren't tracked anymore.
+            if entry is None or not entry.future.done() or \
+                    entry.future.exception() is not None or \
+                    entry.future.result() is not wav_file:
+                return
+
+            entry.refs -= 1
+            self._evict()
+
+    def preload(self, filenames: list, workers=PRELOAD_WORKERS) -> list:
+        """
+        Loads and decodes files on a background thread pool, so that they
+        are ready before playback starts. Preloaded files aren't held, so
+        they can be evicted if the budget runs out.
+
+        Args:
+            filenames: The .wav files to load.
+            workers: The number of threads to decode with.
+
+        Returns:
+            A list of Futures, one per file, which resolve to the WavFiles.
+        """
+        executor = ThreadPoolExecutor(max_workers=workers)
+        futures = [executor.submit(self._preload, filename)
+                   for filename in filenames]
+        executor.shutdown(wait=False)
+        return futures
+
+    def clear(self):
+        """
+        Forget every file and reset the counters. WavFiles which are still
+        held keep working.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.num_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.reloads = 0
+            self.evictions = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the registry counters.
+        """
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "held": sum(1 for entry in self._entries.values()
+                            if entry.refs > 0),
+                "bytes": self.num_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": self.evictions,
+            }
+
+    def _preload(self, filename: str) -> WavFile:
+        wav_file = self.acquire(filename)
+        self.release(wav_file)
+        return wav_file
+
+    def _load(self, path: str, entry: _Entry):
+        """
+        Loads and decodes a file outside of the lock, then resolves its entry.
+        """
+        try:
+            wav_file = WavFile(path)
+            if wav_file.decoded_size <= self.max_bytes:
+                wav_file.decode()
+                num_bytes = wav_file.decoded_size
+            else:
+                num_bytes = 0
+        except Exception as e:
+            with self._lock:
+                if self._entries.get(path) is entry:
+                    del self._entries[path]
+            entry.future.set_exception(e)
+            return
+
+        with self._lock:
+            # The entry may have been replaced while it was loading.
+            if self._entries.get(path) is entry:
+                entry.num_bytes = num_bytes
+                self.num_bytes += num_bytes
+                self._evict()
+        entry.future.set_result(wav_file)
+
+    def _remove(self, path: str):
+        """
+        Drops an entry. Must be called with the lock held.
+        """
+        entry = self._entries.pop(path)
+        self.num_bytes -= entry.num_bytes
+
+    def _evict(self):
+        """
+        Evicts least recently used files which nobody holds, until the
+        decoded samples fit in the budget. Must be called with the lock held.
+        """
+        if self.num_bytes <= self.max_bytes:
+            return
+
+        for path, entry in list(self._entries.items()):
+            if self.num_bytes <= self.max_bytes:
+                break
+            if entry.refs == 0 and entry.future.done():
+                self._remove(path)
+                self.evictions += 1
+
+
+ASSETS = AssetRegistry(512 * 1024 * 1024)
+"""
+The registry used by ImportedAudioTrack. Defaults to a 512MB budget.
+"""
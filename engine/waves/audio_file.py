@@ -4,6 +4,10 @@ Audio file utilities.
 
 from engine import debug, info
 
+import mmap
+import os
+import numpy as np
+
 
 def typecast_int(byte_str: bytes) -> int:
     val = int.from_bytes(byte_str, byteorder='little')
@@ -16,6 +20,42 @@ def typecast_str(byte_str: bytes) -> str:
 def typecast_bytes(byte_str: bytes) -> bytes:
     return byte_str
 
+def decode_signed_ints(buffer,
+                       offset: int,
+                       length: int,
+                       count: int) -> np.ndarray:
+    """
+    Decodes a run of little-endian signed ints from a buffer. For 1, 2, 4 and 8
+    byte ints this is a view of the buffer and does not copy.
+
+    Args:
+        buffer: Any object which supports the buffer protocol.
+        offset: The byte offset within the buffer.
+        length: The length of each integer in bytes.
+        count: The number of integers to decode.
+
+    Returns:
+        An integer numpy array.
+    """
+    if length in (1, 2, 4, 8):
+        return np.frombuffer(buffer,
+                             dtype=f"<i{length}",
+                             count=count,
+                             offset=offset)
+
+    # Odd widths such as 24-bit have no numpy type, so assemble each int from
+    # its bytes and sign extend.
+    raw = np.frombuffer(buffer,
+                        dtype=np.uint8,
+                        count=length * count,
+                        offset=offset).reshape(count, length)
+    values = np.zeros(count, dtype=np.int64)
+    for j in range(length):
+        values |= raw[:, j].astype(np.int64) << (8 * j)
+
+    sign = 1 << (8 * length - 1)
+    return (values ^ sign) - sign
+
 class Header(object):
     """
     Utility object for parsing a header in an audio file.
@@ -82,13 +122,46 @@ class InputAudioFile(object):
     Loads an audio file into memory and supports seeking through.
     """
 
-    def __init__(self, filename: str, header_format: Header):
+    def __init__(self,
+                 filename: str,
+                 header_format=None,
+                 memory_map=False):
         """
         Loads the given file into memory.
+
+        Args:
+            filename: The file to load.
+            header_format: The Header specification of this file type, if it
+                           has a fixed layout.
+            memory_map: Map the file read-only instead of reading it. Pages of
+                        the file are only read from disk once accessed.
         """
+        self.filename = filename
         self.header = header_format
-        with open(filename, "rb") as f:
-            self.data = f.read()
+        self.memory_map = memory_map
+        self._load()
+
+    def __getstate__(self):
+        # Memory maps can't be pickled, so pickle the filename and reload the
+        # file on the other end instead.
+        state = self.__dict__.copy()
+        del state["data"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._load()
+
+    def _load(self):
+        """
+        Reads or maps the file.
+        """
+        with open(self.filename, "rb") as f:
+            # Empty files can't be mapped, but there's nothing to read anyway.
+            if self.memory_map and os.fstat(f.fileno()).st_size > 0:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self.data = f.read()
 
     def __len__(self):
         return len(self.data)
@@ -125,6 +198,24 @@ class InputAudioFile(object):
         byte_str = self.read_bytes(offset, length=length)
         return int.from_bytes(byte_str, byteorder='little', signed=True)
 
+    def read_signed_ints(self, offset, length, count) -> np.ndarray:
+        """
+        Read a run of little-endian signed ints. For 1, 2, 4 and 8 byte ints
+        this is a read-only view of the data and does not copy.
+
+        Args:
+            offset: The byte offset within the file.
+            length: The length of each integer in bytes.
+            count: The number of integers to read.
+
+        Returns:
+            An integer numpy array.
+        """
+        if offset + length * count > len(self.data):
+            raise ValueError("Attempted to seek past the end of the file.")
+
+        return decode_signed_ints(self.data, offset, length, count)
+
     def validate_header(self):
         """
         Validates all of the required fields within the header.
@@ -133,11 +224,11 @@ class InputAudioFile(object):
             True if header is valid, per the required header entries.
         """
         for name in self.header.get_required_val_specs():
-            debug(f"Validating header entry: {name}")
+            debug("Validating header entry: {}", name)
             header_spec = self.header.get_spec(name)
             b = self.read_bytes(header_spec["offset"], header_spec["length"])
             if header_spec["typecast"](b) != header_spec["required_val"]:
-                info(f"Unable to parse file header entry {name}")
+                info("Unable to parse file header entry {}", name)
                 return False
 
         debug("Successfully validated header!")
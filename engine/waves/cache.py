@@ -0,0 +1,141 @@
+"""
+Caches for rendered sample buffers.
+"""
+
+from collections import OrderedDict
+from threading import Lock
+
+import numpy as np
+
+
+class LRUCache(object):
+    """
+    Process-wide cache of numpy buffers with a memory ceiling. When adding a
+    buffer would exceed the ceiling, the least recently used buffers are
+    evicted first.
+
+    Cached buffers are marked read-only, since they are shared between every
+    caller that looks them up.
+    """
+
+    def __init__(self, max_bytes: int):
+        """
+        Create an empty cache.
+
+        Args:
+            max_bytes: The maximum total size of the cached buffers.
+        """
+        self.max_bytes = max_bytes
+        self.num_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key) -> np.ndarray:
+        """
+        Look up a buffer and mark it as the most recently used.
+
+        Args:
+            key: The key of the buffer.
+
+        Returns:
+            The buffer, or None if it isn't cached.
+        """
+        with self._lock:
+            buffer = self._entries.get(key)
+            if buffer is None:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return buffer
+
+    def put(self, key, buffer: np.ndarray) -> np.ndarray:
+        """
+        Add a buffer to the cache. Buffers larger than the ceiling are never
+        cached.
+
+        Args:
+            key: The key of the buffer.
+            buffer: The buffer to cache.
+
+        Returns:
+            The buffer, now read-only.
+        """
+        buffer.flags.writeable = False
+        if buffer.nbytes > self.max_bytes:
+            return buffer
+
+        with self._lock:
+            if key in self._entries:
+                self.num_bytes -= self._entries.pop(key).nbytes
+
+            self._entries[key] = buffer
+            self.num_bytes += buffer.nbytes
+            self._evict(self.max_bytes)
+
+        return buffer
+
+    def resize(self, max_bytes: int):
+        """
+        Change the memory ceiling, evicting buffers if necessary.
+
+        Args:
+            max_bytes: The new maximum total size of the cached buffers.
+        """
+        with self._lock:
+            self.max_bytes = max_bytes
+            self._evict(max_bytes)
+
+    def clear(self):
+        """
+        Drop every buffer and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.num_bytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters, for sizing the cache.
+        """
+        return {
+            "entries": len(self._entries),
+            "bytes": self.num_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _evict(self, max_bytes: int):
+        """
+        Evicts least recently used buffers until the cache fits in max_bytes.
+        Must be called with the lock held.
+        """
+        while self.num_bytes > max_bytes:
+            _, buffer = self._entries.popitem(last=False)
+            self.num_bytes -= buffer.nbytes
+            self.evictions += 1
+
+
+NOTE_CACHE = LRUCache(64 * 1024 * 1024)
+"""
+Rendered Note frames, keyed by (freq, duration, sample_rate, bit_width,
+volume bucket), float Note samples, keyed by (freq, duration, sample_rate),
+and the pitch-shifted roots of SampledInstruments, keyed by (root, freq,
+sample_rate). Defaults to a 64MB ceiling.
+"""
@@ -0,0 +1,209 @@
+"""
+Sample decoders for the formats found in .wav files: integer PCM, IEEE float
+and G.711 mu-law and A-law. Each decoder converts a whole block of samples at
+once, with array casts or lookup tables, either to float samples or to integer
+samples of any bit width.
+"""
+
+from .audio_file import decode_signed_ints
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 1
+"""
+Format tag for integer PCM samples.
+"""
+
+WAVE_FORMAT_IEEE_FLOAT = 3
+"""
+Format tag for IEEE float samples.
+"""
+
+WAVE_FORMAT_ALAW = 6
+"""
+Format tag for 8-bit G.711 A-law samples.
+"""
+
+WAVE_FORMAT_MULAW = 7
+"""
+Format tag for 8-bit G.711 mu-law samples.
+"""
+
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+"""
+Format tag for a fmt chunk which holds the real format tag in its extension.
+"""
+
+SUPPORTED_WIDTHS = {
+    WAVE_FORMAT_PCM: (8, 16, 24, 32),
+    WAVE_FORMAT_IEEE_FLOAT: (32, 64),
+    WAVE_FORMAT_ALAW: (8,),
+    WAVE_FORMAT_MULAW: (8,),
+}
+"""
+The bit widths that can be decoded, by format tag.
+"""
+
+
+def _mulaw_table() -> np.ndarray:
+    """
+    Decodes every mu-law code to a 16-bit linear sample, per G.711.
+    """
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponents = (codes >> 4) & 0x07
+    magnitudes = ((((codes & 0x0F) << 3) + 0x84) << exponents) - 0x84
+    return np.where(codes & 0x80, -magnitudes, magnitudes).astype(np.int16)
+
+
+def _alaw_table() -> np.ndarray:
+    """
+    Decodes every A-law code to a 16-bit linear sample, per G.711.
+    """
+    codes = np.arange(256, dtype=np.int32) ^ 0x55
+    exponents = (codes >> 4) & 0x07
+    mantissas = (codes & 0x0F) << 4
+    magnitudes = np.where(exponents == 0,
+                          mantissas + 0x08,
+                          (mantissas + 0x108) << np.maximum(exponents - 1, 0))
+    return np.where(codes & 0x80, magnitudes, -magnitudes).astype(np.int16)
+
+
+G711_TABLES = {
+    WAVE_FORMAT_MULAW: _mulaw_table(),
+    WAVE_FORMAT_ALAW: _alaw_table(),
+}
+"""
+Lookup tables from each 8-bit G.711 code to a 16-bit linear sample.
+"""
+
+
+def check_format(format_type: int, bit_width: int):
+    """
+    Raises a ValueError unless samples of the given format can be decoded.
+
+    Args:
+        format_type: The format tag.
+        bit_width: The bit width of each sample.
+    """
+    if format_type not in SUPPORTED_WIDTHS:
+        raise ValueError(f"Unsupported format type: {format_type}")
+
+    if bit_width not in SUPPORTED_WIDTHS[format_type]:
+        raise ValueError(
+            f"Unsupported bit width {bit_width} for format type " +
+            f"{format_type}.")
+
+
+def convert_bit_depth(samples: np.ndarray,
+                      from_bits: int,
+                      to_bits: int) -> np.ndarray:
+    """
+    Converts signed integer samples from one bit width to another. Widening
+    is exact. Narrowing rounds to the nearest value and clips at full scale.
+
+    Args:
+        samples: A numpy array of signed integer samples.
+        from_bits: The bit width of the samples.
+        to_bits: The bit width to convert to.
+
+    Returns:
+        A numpy array of int64 samples.
+    """
+    samples = samples.astype(np.int64)
+    if to_bits >= from_bits:
+        return samples << (to_bits - from_bits)
+
+    shift = from_bits - to_bits
+    rounded = (samples + (1 << (shift - 1))) >> shift
+    return np.minimum(rounded, (1 << (to_bits - 1)) - 1)
+
+
+def decode_floats(buffer,
+                  offset: int,
+                  count: int,
+                  format_type: int,
+                  bit_width: int) -> np.ndarray:
+    """
+    Decodes a block of samples to floats in the range [-1.0, 1.0).
+
+    Args:
+        buffer: Any object which supports the buffer protocol.
+        offset: The byte offset of the first sample within the buffer.
+        count: The number of samples to decode.
+        format_type: The format tag of the samples.
+        bit_width: The bit width of each sample.
+
+    Returns:
+        A float32 numpy array.
+    """
+    if format_type == WAVE_FORMAT_IEEE_FLOAT:
+        return np.frombuffer(buffer,
+                             dtype=f"<f{bit_width // 8}",
+                             count=count,
+                             offset=offset).astype(np.float32)
+
+    if format_type in G711_TABLES:
+        codes = np.frombuffer(buffer, dtype=np.uint8, count=count,
+                              offset=offset)
+        return G711_TABLES[format_type][codes].astype(np.float32) / 32768.0
+
+    samples = decode_signed_ints(buffer, offset, bit_width // 8, count)
+
+    # 8-bit data is unsigned and centered on 128, but is read as signed.
+    if bit_width == 8:
+        samples = samples.view(np.uint8).astype(np.float32) - 128.0
+    return samples.astype(np.float32) / (1 << (bit_width - 1))
+
+
+def floats_to_ints(samples: np.ndarray, to_bits: int) -> np.ndarray:
+    """
+    Converts float samples to signed integers of a bit width. Samples are
+    rounded to the nearest value and clipped at full scale.
+
+    Args:
+        samples: A numpy array of float samples, nominally in [-1.0, 1.0).
+        to_bits: The bit width to convert to.
+
+    Returns:
+        A numpy array of int64 samples.
+    """
+    full_scale = 1 << (to_bits - 1)
+    return np.clip(np.rint(np.asarray(samples, dtype=np.float64) * full_scale),
+                   -full_scale,
+                   full_scale - 1).astype(np.int64)
+
+
+def decode_ints(buffer,
+                offset: int,
+                count: int,
+                format_type: int,
+                bit_width: int,
+                to_bits: int) -> np.ndarray:
+    """
+    Decodes a block of samples to signed integers of another bit width.
+
+    Args:
+        buffer: Any object which supports the buffer protocol.
+        offset: The byte offset of the first sample within the buffer.
+        count: The number of samples to decode.
+        format_type: The format tag of the samples.
+        bit_width: The bit width of each sample.
+        to_bits: The bit width to convert to.
+
+    Returns:
+        A numpy array of int64 samples.
+    """
+    if format_type == WAVE_FORMAT_IEEE_FLOAT:
+        return floats_to_ints(
+            decode_floats(buffer, offset, count, format_type, bit_width),
+            to_bits)
+
+    if format_type in G711_TABLES:
+        codes = np.frombuffer(buffer, dtype=np.uint8, count=count,
+                              offset=offset)
+        return convert_bit_depth(G711_TABLES[format_type][codes], 16, to_bits)
+
+    samples = decode_signed_ints(buffer, offset, bit_width // 8, count)
+    if bit_width == 8:
+        samples = samples.view(np.uint8).astype(np.int64) - 128
+    return convert_bit_depth(samples, bit_width, to_bits)
@@ -0,0 +1,254 @@
+"""
+Sampled instruments. A note is played from the recording of the nearest root
+note, pitch shifted by resampling it with the polyphase resampler. Playing a
+recording faster raises its pitch, so shifting a root to another note is the
+same as converting it between two sample rates in the ratio of the pitches.
+
+Pitch-shifted buffers are cached in NOTE_CACHE per (root, pitch, sample
+rate), so after the first note of each pitch, a note costs a slice of a
+shared buffer.
+"""
+
+from .assets import ASSETS
+from .cache import NOTE_CACHE
+from .notes import NOTES
+from .resample import get_resampler, resample_range
+from .waveform import MAX_NOTE_CACHE_SHARE, Note
+
+from fractions import Fraction
+from functools import lru_cache
+from threading import Lock
+
+import math
+import numpy as np
+
+MAX_PITCH_PHASES = 1024
+"""
+The most phases a pitch shift may use. The pitch ratio is rounded to the
+nearest fraction with at most this many phases, which is within 0.1 cents for
+every note within 3 octaves of a root, and bounds the size of the filter bank.
+"""
+
+_roots = {}
+"""
+The loaded root notes of every set of roots so far, keyed by their items.
+"""
+
+_roots_lock = Lock()
+
+
+class _Root(object):
+    """
+    A recorded root note.
+    """
+
+    __slots__ = ("freq", "wav_file", "fingerprint")
+
+    def __init__(self, freq: float, wav_file):
+        self.freq = freq
+        self.wav_file = wav_file
+        self.fingerprint = wav_file.fingerprint()
+
+
+def _note_freq(note) -> float:
+    """
+    The frequency of a root note, given by name or in Hz.
+    """
+    if isinstance(note, str):
+        if note not in NOTES or NOTES[note] <= 0.0:
+            raise ValueError(f"{note} is not a valid root note.")
+        return NOTES[note]
+
+    freq = float(note)
+    if freq <= 0.0:
+        raise ValueError(f"Root frequency must be positive, but was: {note}")
+    return freq
+
+
+def get_roots(roots: dict) -> tuple:
+    """
+    Gets the shared, loaded root notes of an instrument, loading them if
+    necessary. Roots are held for the life of the process, like wavetables.
+
+    Args:
+        roots: A dict from each root note, by name or in Hz, to the .wav file
+               which plays it.
+
+    Returns:
+        A tuple of _Roots, sorted by frequency.
+    """
+    if len(roots) == 0:
+        raise ValueError("An instrument needs at least one root note.")
+
+    key = tuple(sorted((repr(note), filename)
+                       for note, filename in roots.items()))
+    with _roots_lock:
+        loaded = _roots.get(key)
+        if loaded is not None:
+            return loaded
+
+    loaded = []
+    try:
+        for note, filename in roots.items():
+            freq = _note_freq(note)
+
+            # Every root shares its decoded samples through the registry.
+            wav_file = ASSETS.acquire(filename)
+            loaded.append(_Root(freq, wav_file))
+            if wav_file.num_channels != 1:
+                raise ValueError(
+                    f"Root {note} must be mono, but {filename} has " +
+                    f"{wav_file.num_channels} channels.")
+    except Exception:
+        _release_roots(loaded)
+        raise
+
+    loaded = tuple(sorted(loaded, key=lambda root: root.freq))
+    with _roots_lock:
+        shared = _roots.setdefault(key, loaded)
+
+    # Another thread loaded the same roots first, so only its are held.
+    if shared is not loaded:
+        _release_roots(loaded)
+    return shared
+
+
+def _release_roots(roots):
+    """
+    Hands the files of some roots back to the registry.
+    """
+    for root in roots:
+        ASSETS.release(root.wav_file)
+
+
+@lru_cache(maxsize=1024)
+def _pitch_resampler(root_rate: int,
+                     root_freq: float,
+                     sample_rate: int,
+                     freq: float):
+    """
+    Gets the Resampler which shifts a root to a pitch and a sample rate. The
+    root is consumed at the ratio of the pitches, times the ratio of the
+    rates.
+    """
+    ratio = Fraction(root_rate * freq / (sample_rate * root_freq))
+    ratio = ratio.limit_denominator(MAX_PITCH_PHASES)
+    return get_resampler(ratio.numerator, ratio.denominator)
+
+
+class SampledInstrument(Note):
+    """
+    A note played from recordings of an instrument. Subclass it with the
+    recordings as roots:
+
+        >>> class Piano(SampledInstrument):
+        ...     roots = {"C4": "samples/piano_c4.wav",
+        ...              "C5": "samples/piano_c5.wav"}
+        >>> track = CustomNotesTrack("Melody", 200, instrument=Piano)
+
+    A note plays the root nearest to its pitch, pitch shifted to the note and
+    converted to the note's sample rate in a single pass. It plays until the
+    recording runs out or the note ends, whichever comes first.
+
+    Tracks recreate notes from their class, frequency and duration, so roots
+    are always given by subclassing.
+    """
+
+    roots = {}
+    """
+    A dict from each root note, by name or in Hz, to the .wav file which
+    plays it.
+    """
+
+    def __init__(self, note, duration: float, sample_rate=22050):
+        super().__init__(note, duration, sample_rate=sample_rate)
+
+        # The root nearest in pitch changes the recording the least.
+        loaded = get_roots(self.roots)
+        if self.freq > 0.0:
+            self.root = min(loaded,
+                            key=lambda root: abs(math.log(self.freq /
+                                                          root.freq)))
+        else:
+            self.root = loaded[0]
+
+    def fingerprint(self) -> tuple:
+        return ("SampledInstrument",
+                self.root.fingerprint,
+                self.freq,
+                self.duration,
+                self.sample_rate)
+
+    def _cache_key(self) -> tuple:
+        return (self.root.fingerprint,
+                self.freq,
+                self.duration,
+                self.sample_rate)
+
+    @property
+    def resampler(self):
+        """
+        The Resampler which shifts the root to this note.
+        """
+        return _pitch_resampler(self.root.wav_file.sample_rate,
+                                self.root.freq,
+                                self.sample_rate,
+                                self.freq)
+
+    def _shifted(self, start_sample: int, end_sample: int) -> np.ndarray:
+        """
+        The pitch-shifted root from [start_sample, end_sample), which must be
+        within the shifted root.
+        """
+        resampler = self.resampler
+        num_samples = resampler.num_outputs(self.root.wav_file.num_samples)
+
+        # The whole shifted root is shared by every note of this pitch,
+        # whatever its duration.
+        if num_samples * 4 > NOTE_CACHE.max_bytes * MAX_NOTE_CACHE_SHARE:
+            return resample_range(self.root.wav_file,
+                                  resampler,
+                                  start_sample,
+                                  end_sample - start_sample)
+
+        key = ("SampledInstrument",
+               self.root.fingerprint,
+               self.freq,
+               self.sample_rate)
+        samples = NOTE_CACHE.get(key)
+        if samples is None:
+            samples = NOTE_CACHE.put(key, resample_range(self.root.wav_file,
+                                                         resampler,
+                                                         0,
+                                                         num_samples))
+        return samples[start_sample:end_sample]
+
+    def get_samples(self, start_sample: int, end_sample: int) -> np.ndarray:
+        """
+        Returns the pitch-shifted root from [start_sample, end_sample), and
+        silence once the recording runs out.
+
+        Args:
+            start_sample: The first sample (inclusive).
+            end_sample: The end sample (exclusive).
+
+        Return:
+            Numpy array of float32 samples.
+        """
+        self._validate_range(start_sample, end_sample)
+
+        if self.freq == 0.0:
+            return np.zeros(end_sample - start_sample, dtype=np.float32)
+
+        recorded = self.resampler.num_outputs(self.root.wav_file.num_samples)
+        if end_sample <= recorded:
+            return self._shifted(start_sample, end_sample)
+
+        samples = np.zeros(end_sample - start_sample, dtype=np.float32)
+        if start_sample < recorded:
+            samples[:recorded - start_sample] = \
+                self._shifted(start_sample, recorded)
+        return samples
+
+    def _render(self, start_sample: int, end_sample: int) -> np.ndarray:
+        return self.get_samples(start_sample, end_sample).astype(np.float64)
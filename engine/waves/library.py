@@ -0,0 +1,334 @@
+"""
+Sample library indexing. Scans directories of .wav files and keeps their
+metadata in a persistent index, reading only the header of each file. Files
+whose size and modification time haven't changed since the last scan aren't
+read again.
+"""
+
+from engine import debug, info
+from .riff import RiffReader
+from .wav import WavFormat, read_wav_header
+
+from concurrent.futures import ThreadPoolExecutor
+
+import json
+import os
+import struct
+
+CANONICAL_HEADER = struct.Struct("<4sI4s4sIHHIIHH4sI")
+"""
+The 44 byte header of a .wav file whose fmt chunk is 16 bytes long and is
+followed directly by its data chunk, as most files are.
+"""
+
+FMT_OFFSET = 20
+"""
+The offset of the body of the fmt chunk within a canonical header.
+"""
+
+INDEX_VERSION = 1
+"""
+Bumped whenever the index format changes, which discards older indexes.
+"""
+
+SCAN_WORKERS = 8
+"""
+The default number of threads which read headers.
+"""
+
+WAV_EXTENSIONS = (".wav", ".wave")
+"""
+The file extensions which are scanned, compared case insensitively.
+"""
+
+
+class WavInfo(object):
+    """
+    The metadata of a .wav file in the library.
+    """
+
+    __slots__ = ("path", "size", "mtime_ns", "format_type", "sample_rate",
+                 "num_channels", "bit_width", "duration", "error")
+
+    def __init__(self,
+                 path: str,
+                 size: int,
+                 mtime_ns: int,
+                 format_type=None,
+                 sample_rate=None,
+                 num_channels=None,
+                 bit_width=None,
+                 duration=None,
+                 error=None):
+        """
+        Args:
+            path: The absolute path of the file.
+            size: The size of the file, in bytes.
+            mtime_ns: The modification time of the file.
+            format_type: The format tag of the samples.
+            sample_rate: The sample rate.
+            num_channels: The number of interleaved channels.
+            bit_width: The bit width of each sample.
+            duration: The duration of the file, in seconds.
+            error: Why the file couldn't be parsed, if it couldn't. The other
+                   metadata is None.
+        """
+        self.path = path
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.format_type = format_type
+        self.sample_rate = sample_rate
+        self.num_channels = num_channels
+        self.bit_width = bit_width
+        self.duration = duration
+        self.error = error
+
+    def to_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, values: dict):
+        return cls(**values)
+
+
+def read_wav_info(path: str, size: int, mtime_ns: int) -> WavInfo:
+    """
+    Reads the metadata of a .wav file from its header. Canonical headers take
+    a single read. Anything else, such as a file with LIST chunks, falls back
+    to walking the chunks.
+
+    Args:
+        path: The .wav file.
+        size: The size of the file, in bytes.
+        mtime_ns: The modification time of the file.
+
+    Returns:
+        A WavInfo. Files which can't be parsed have an error instead of
+        metadata.
+    """
+    try:
+        with open(path, "rb") as f:
+            header = f.read(CANONICAL_HEADER.size)
+            if len(header) == CANONICAL_HEADER.size:
+                (riff, _, wave, fmt, fmt_size, _, _, _, _, _, _, data,
+                 data_size) = CANONICAL_HEADER.unpack_from(header)
+                canonical = riff == b"RIFF" and wave == b"WAVE" and \
+                    fmt == b"fmt " and fmt_size == 16 and data == b"data"
+            else:
+                canonical = False
+
+            # The fmt chunk is validated by WavFormat on both paths, like
+            # WavFile does. Anything else, including extensible formats,
+            # whose fmt chunks are longer, needs the chunks walked.
+            if canonical:
+                wav_format = WavFormat(header[FMT_OFFSET:FMT_OFFSET + 16])
+                data_offset = CANONICAL_HEADER.size
+            else:
+                f.seek(0)
+                wav_format, chunk = read_wav_header(RiffReader(f, b"WAVE"))
+                data_offset = chunk.offset
+                data_size = chunk.size
+    except (OSError, ValueError) as e:
+        return WavInfo(path, size, mtime_ns, error=str(e))
+
+    bytes_per_sec = wav_format.bytes_per_sec
+    if bytes_per_sec == 0:
+        return WavInfo(path, size, mtime_ns, error="bytes_per_sec is 0.")
+
+    # Like WavFile, recordings which were cut short only count what's there.
+    available = max(0, size - data_offset)
+    if data_size is None or data_size > available:
+        data_size = available
+    data_size -= data_size % wav_format.block_align
+
+    return WavInfo(path,
+                   size,
+                   mtime_ns,
+                   format_type=wav_format.format_type,
+                   sample_rate=wav_format.sample_rate,
+                   num_channels=wav_format.num_channels,
+                   bit_width=wav_format.bit_width,
+                   duration=data_size / bytes_per_sec)
+
+
+class SampleLibrary(object):
+    """
+    Persistent index of the .wav files under a set of directories.
+
+        >>> library = SampleLibrary("library.json")
+        >>> library.scan(["samples/drums", "samples/vocals"])
+        >>> drums = [wav for wav in library if wav.sample_rate == 22050]
+
+    The index is keyed by absolute path, and each file is only read again if
+    its size or modification time changed. Files which can't be parsed are
+    remembered too, with their error, so they aren't retried until they
+    change.
+    """
+
+    def __init__(self, index_file: str):
+        """
+        Open a library, loading its index if it exists.
+
+        Args:
+            index_file: The JSON file to keep the index in.
+        """
+        self.index_file = index_file
+        self.entries = {}
+        """
+        Every indexed file, keyed by absolute path, including those which
+        couldn't be parsed.
+        """
+
+        self.read = 0
+        """
+        The number of headers read by the last scan.
+        """
+
+        self.reused = 0
+        """
+        The number of files reused from the index by the last scan.
+        """
+
+        self._load()
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __iter__(self):
+        """
+        Iterate over the WavInfo of every file that could be parsed, in path
+        order.
+        """
+        for path in sorted(self.entries):
+            wav_info = self.entries[path]
+            if wav_info.error is None:
+                yield wav_info
+
+    def get(self, path: str) -> WavInfo:
+        """
+        Look up the WavInfo of a file, or None if it isn't indexed.
+        """
+        return self.entries.get(os.path.abspath(path))
+
+    def _load(self):
+        """
+        Loads the index. A missing, corrupted or outdated index is ignored,
+        and is rebuilt by the next scan.
+        """
+        try:
+            with open(self.index_file) as f:
+                index = json.load(f)
+            if index.get("version") != INDEX_VERSION:
+                raise ValueError(f"Unsupported version {index.get('version')}")
+            self.entries = {
+                path: WavInfo.from_dict(values)
+                for path, values in index["files"].items()
+            }
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            info("Ignoring sample library index {}: {}", self.index_file, e)
+
+    def save(self):
+        """
+        Writes the index. It's written to a temporary file first, so a failed
+        write never leaves a partial index behind.
+        """
+        tmp_filename = self.index_file + ".tmp"
+        # json.dumps() encodes in C, unlike json.dump().
+        with open(tmp_filename, "w") as f:
+            f.write(json.dumps({
+                "version": INDEX_VERSION,
+                "files": {
+                    path: wav_info.to_dict()
+                    for path, wav_info in self.entries.items()
+                },
+            }))
+        os.replace(tmp_filename, self.index_file)
+
+    def scan(self, directories: list, workers=SCAN_WORKERS, save=True):
+        """
+        Scans directories recursively for .wav files and updates the index.
+        Files which were deleted are dropped from it.
+
+        Directories are listed and headers are read on a thread pool, since
+        both mostly wait on the disk.
+
+        Args:
+            directories: The directories to scan.
+            workers: The number of threads to scan with.
+            save: Whether to save the index afterwards, if it changed.
+        """
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            files = self._list(executor,
+                               [os.path.abspath(d) for d in directories])
+
+            entries = {}
+            changed = []
+            for path, size, mtime_ns in files:
+                wav_info = self.entries.get(path)
+                if wav_info is not None and wav_info.size == size and \
+                        wav_info.mtime_ns == mtime_ns:
+                    entries[path] = wav_info
+                else:
+                    changed.append((path, size, mtime_ns))
+
+            for wav_info in executor.map(lambda f: read_wav_info(*f),
+                                         changed):
+                entries[wav_info.path] = wav_info
+
+        self.read = len(changed)
+        self.reused = len(entries) - len(changed)
+        debug("Scanned {} files, read {} headers", len(entries), self.read)
+
+        # Files under other directories are kept.
+        roots = tuple(os.path.join(os.path.abspath(d), "")
+                      for d in directories)
+        for path, wav_info in self.entries.items():
+            if not path.startswith(roots):
+                entries.setdefault(path, wav_info)
+        modified = self.read > 0 or entries.keys() != self.entries.keys()
+        self.entries = entries
+
+        if save and (modified or not os.path.exists(self.index_file)):
+            self.save()
+
+    def _list(self, executor, directories: list) -> list:
+        """
+        Lists every .wav file under the directories, one directory per task.
+
+        Returns:
+            A list of (path, size, mtime_ns) tuples.
+        """
+        files = []
+        pending = [executor.submit(_list_directory, d) for d in directories]
+        while len(pending) > 0:
+            subdirectories, directory_files = pending.pop().result()
+            files.extend(directory_files)
+            pending.extend(executor.submit(_list_directory, d)
+                           for d in subdirectories)
+        return files
+
+
+def _list_directory(directory: str) -> tuple:
+    """
+    Lists a single directory.
+
+    Returns:
+        (subdirectories, [(path, size, mtime_ns)]) for the .wav files in it.
+        Unreadable directories are empty.
+    """
+    subdirectories = []
+    files = []
+    try:
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    subdirectories.append(entry.path)
+                elif entry.name.lower().endswith(WAV_EXTENSIONS) and \
+                        entry.is_file():
+                    stat = entry.stat()
+                    files.append((entry.path, stat.st_size, stat.st_mtime_ns))
+    except OSError as e:
+        debug("Could not list {}: {}", directory, e)
+    return subdirectories, files
@@ -0,0 +1,103 @@
+"""
+Oscillator bank. Synthesizes many sine voices together, so that the cost of a
+chord grows with the number of samples rather than with the number of numpy
+calls per voice.
+"""
+
+import numpy as np
+
+BANK_BLOCK_SIZE = 16384
+"""
+The number of samples synthesized per vectorized pass. Voices are packed into
+blocks of about this size, which keeps the working arrays in cache. Longer
+voices get a pass of their own.
+"""
+
+
+def sine_bank(freqs: np.ndarray,
+              interval_starts: np.ndarray,
+              wave_starts: np.ndarray,
+              wave_ends: np.ndarray,
+              sample_rate: int,
+              num_samples: int) -> np.ndarray:
+    """
+    Renders and sums a bank of sine voices into one buffer.
+
+    Each voice plays samples [wave_start, wave_end) of a sine wave which
+    started at phase 0 on its sample 0, like a Note. The starting phase of
+    each voice is derived from its sample position and wrapped to a single
+    cycle, so phase is continuous across chunk boundaries and after seeks,
+    without keeping any state between calls.
+
+    Args:
+        freqs: The frequency of each voice.
+        interval_starts: Where each voice starts within the buffer.
+        wave_starts: The first sample of each voice (inclusive).
+        wave_ends: The end sample of each voice (exclusive).
+        sample_rate: The sample rate.
+        num_samples: The number of samples in the buffer.
+
+    Returns:
+        A float32 numpy array of num_samples samples.
+    """
+    cycles = np.asarray(freqs, dtype=np.float64) / sample_rate
+    interval_starts = np.asarray(interval_starts, dtype=np.int64)
+    wave_starts = np.asarray(wave_starts, dtype=np.int64)
+    lengths = np.asarray(wave_ends, dtype=np.int64) - wave_starts
+
+    # Phase in cycles at the first sample of each voice, wrapped so that it
+    # keeps full precision no matter how far into the note we are.
+    start_phases = np.mod(cycles * wave_starts, 1.0)
+
+    bus = np.zeros(num_samples, dtype=np.float32)
+    if len(lengths) == 0:
+        return bus
+
+    # Split the voices into blocks of about BANK_BLOCK_SIZE samples.
+    ends = np.cumsum(lengths)
+    splits = np.searchsorted(
+        ends, np.arange(BANK_BLOCK_SIZE, ends[-1], BANK_BLOCK_SIZE))
+
+    first = 0
+    for last in np.append(np.unique(splits + 1), len(lengths)):
+        if last > first:
+            _render_block(bus,
+                          cycles[first:last],
+                          start_phases[first:last],
+                          interval_starts[first:last],
+                          lengths[first:last])
+            first = last
+
+    return bus
+
+
+def _render_block(bus: np.ndarray,
+                  cycles: np.ndarray,
+                  start_phases: np.ndarray,
+                  interval_starts: np.ndarray,
+                  lengths: np.ndarray):
+    """
+    Synthesizes a block of voices in one vectorized pass, laid end to end, and
+    adds each voice into the bus.
+    """
+    ends = np.cumsum(lengths)
+    run_starts = ends - lengths
+
+    # The phase of sample j of the block is base + j * cycles of its voice. A
+    # voice which fills a whole block doesn't need its parameters repeated.
+    base = start_phases - run_starts * cycles
+    if len(lengths) == 1:
+        phases = np.arange(ends[-1]) * cycles[0]
+        phases += base[0]
+    else:
+        phases = np.arange(ends[-1]) * np.repeat(cycles, lengths)
+        phases += np.repeat(base, lengths)
+    phases -= np.floor(phases)
+
+    # The wrapped phase is precise enough for a single precision sine, which
+    # is much faster.
+    samples = np.sin(np.float32(2 * np.pi) * phases.astype(np.float32))
+
+    for i in range(len(lengths)):
+        bus[interval_starts[i]:interval_starts[i] + lengths[i]] += \
+            samples[run_starts[i]:ends[i]]
@@ -0,0 +1,363 @@
+"""
+Sample rate conversion. Samples are resampled by a polyphase windowed-sinc
+filter: the ratio between the rates is reduced to a fraction up / down, and a
+Kaiser windowed sinc is split into one short filter per phase of the output
+grid. Each output sample is then a dot product of one phase with the input
+samples around it.
+
+Every output sample only depends on the input samples within half_width of
+it, so any range of outputs can be computed on its own from just those inputs.
+This lets long buffers be converted a chunk at a time, in any order, and still
+match converting the whole buffer at once.
+"""
+
+from .cache import LRUCache
+from .codecs import floats_to_ints
+from .waveform import Waveform
+
+from functools import lru_cache
+from math import gcd
+
+import numpy as np
+
+ZERO_CROSSINGS = 16
+"""
+The number of zero crossings of the sinc on either side of its center. More
+makes the transition band narrower, at the cost of more taps per sample.
+"""
+
+KAISER_BETA = 8.6
+"""
+The shape of the Kaiser window. 8.6 attenuates aliases by about 90 dB.
+"""
+
+ROLLOFF = 0.94
+"""
+The cutoff of the filter, as a fraction of the lower Nyquist frequency. Leaves
+room for the transition band below Nyquist, so that it doesn't alias.
+"""
+
+MIN_PHASE_RUN = 32
+"""
+The number of outputs per phase from which outputs are computed a phase at a
+time, instead of an output at a time.
+"""
+
+GATHER_BLOCK_SIZE = 1 << 16
+"""
+The number of outputs whose windows are gathered at once, when computing an
+output at a time. Bounds the memory used for the windows.
+"""
+
+RESAMPLE_CACHE = LRUCache(128 * 1024 * 1024)
+"""
+Resampled buffers of whole waveforms, keyed by (fingerprint, sample_rate).
+Defaults to a 128MB ceiling.
+"""
+
+
+class Resampler(object):
+    """
+    Converts float samples from one sample rate to another.
+
+        >>> resampler = get_resampler(22050, 44100)
+        >>> converted = resampler.resample(samples)
+
+    Output sample m lies at input position m * down / up. Its phase is the
+    fractional part of that position, and each phase has its own filter of
+    2 * half_width taps.
+    """
+
+    def __init__(self, from_rate: int, to_rate: int):
+        """
+        Designs the filter bank. Use get_resampler() to share banks between
+        conversions.
+
+        Args:
+            from_rate: The sample rate of the input.
+            to_rate: The sample rate of the output.
+        """
+        if from_rate <= 0 or to_rate <= 0:
+            raise ValueError(
+                f"Sample rates must be positive, but were: {from_rate}, " +
+                f"{to_rate}")
+
+        divisor = gcd(from_rate, to_rate)
+        self.from_rate = from_rate
+        self.to_rate = to_rate
+        self.up = to_rate // divisor
+        self.down = from_rate // divisor
+
+        # When downsampling, the sinc is stretched to cut off below the new
+        # Nyquist frequency, so it needs proportionally more taps.
+        scale = min(1.0, self.up / self.down) * ROLLOFF
+        self.half_width = int(np.ceil(ZERO_CROSSINGS / scale))
+
+        # The distance of each tap from the output position, for each phase.
+        taps = np.arange(2 * self.half_width)
+        phases = np.arange(self.up)[:, np.newaxis] / self.up
+        x = phases + (self.half_width - 1 - taps)
+        window = np.i0(KAISER_BETA * np.sqrt(
+            np.maximum(0.0, 1.0 - (x / self.half_width) ** 2)))
+        bank = np.sinc(scale * x) * window / np.i0(KAISER_BETA)
+
+        # Each phase passes DC at unity gain, so a constant stays constant.
+        bank /= bank.sum(axis=1, keepdims=True)
+        self.bank = bank.astype(np.float32)
+        """
+        The filter of each phase, as an (up, 2 * half_width) array.
+        """
+
+    def num_outputs(self, num_inputs: int) -> int:
+        """
+        The number of output samples that cover num_inputs input samples.
+        """
+        return -(-num_inputs * self.up // self.down)
+
+    def input_range(self, start_output: int, num_outputs: int) -> tuple:
+        """
+        The input samples which a range of output samples depends on.
+
+        Args:
+            start_output: The first output sample.
+            num_outputs: The number of output samples.
+
+        Returns:
+            (first_input, end_input). Inputs before 0 or past the end of the
+            input are zeros.
+        """
+        first_base = start_output * self.down // self.up
+        last_base = (start_output + num_outputs - 1) * self.down // self.up
+        return (first_base - self.half_width + 1,
+                max(first_base, last_base) + self.half_width + 1)
+
+    def process(self,
+                samples: np.ndarray,
+                first_input: int,
+                start_output: int,
+                num_outputs: int) -> np.ndarray:
+        """
+        Computes a range of output samples from the inputs around them.
+
+        Args:
+            samples: Float input samples, starting at input sample
+                     first_input. Must cover input_range().
+            first_input: The input sample which samples starts at.
+            start_output: The first output sample.
+            num_outputs: The number of output samples.
+
+        Returns:
+            A float32 numpy array of num_outputs samples.
+        """
+        samples = np.ascontiguousarray(samples, dtype=np.float32)
+        output = np.empty(num_outputs, dtype=np.float32)
+        if num_outputs == 0:
+            return output
+
+        # The windows below are views which aren't bounds checked.
+        needed_start, needed_end = self.input_range(start_output, num_outputs)
+        if needed_start < first_input or \
+                needed_end > first_input + len(samples):
+            raise ValueError(
+                f"Outputs [{start_output}, {start_output + num_outputs}) " +
+                f"need inputs [{needed_start}, {needed_end}), but got " +
+                f"[{first_input}, {first_input + len(samples)}).")
+        num_taps = self.bank.shape[1]
+
+        # Output samples with the same phase are every up samples apart, and
+        # their inputs are every down samples apart. So for each phase, the
+        # windows of its inputs are a strided view of the input, and the whole
+        # phase is a single matrix-vector product.
+        if num_outputs >= MIN_PHASE_RUN * self.up:
+            for phase_start in range(start_output, start_output + self.up):
+                position = phase_start * self.down
+                first = position // self.up - self.half_width + 1 - first_input
+                count = -(-(start_output + num_outputs - phase_start) //
+                          self.up)
+
+                windows = np.lib.stride_tricks.as_strided(
+                    samples[first:],
+                    shape=(count, num_taps),
+                    strides=(samples.strides[0] * self.down,
+                             samples.strides[0]),
+                    writeable=False)
+                output[phase_start - start_output::self.up] = \
+                    windows @ self.bank[position % self.up]
+            return output
+
+        # Otherwise there are too few outputs per phase for that to pay off,
+        # like in small blocks or between rates with a large up. Gather the
+        # window and the filter of every output instead, a block at a time.
+        taps = np.arange(num_taps)
+        for block_start in range(0, num_outputs, GATHER_BLOCK_SIZE):
+            block_end = min(num_outputs, block_start + GATHER_BLOCK_SIZE)
+            positions = np.arange(start_output + block_start,
+                                  start_output + block_end,
+                                  dtype=np.int64) * self.down
+            firsts = positions // self.up - self.half_width + 1 - first_input
+            windows = samples[firsts[:, np.newaxis] + taps]
+            output[block_start:block_end] = np.einsum(
+                "ij,ij->i", windows, self.bank[positions % self.up])
+        return output
+
+    def resample(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Converts a whole buffer of samples.
+
+        Args:
+            samples: Float input samples.
+
+        Returns:
+            A float32 numpy array of num_outputs(len(samples)) samples.
+        """
+        num_outputs = self.num_outputs(len(samples))
+        first_input, end_input = self.input_range(0, num_outputs)
+        padded = np.zeros(end_input - first_input, dtype=np.float32)
+        padded[-first_input:-first_input + len(samples)] = samples
+        return self.process(padded, first_input, 0, num_outputs)
+
+
+@lru_cache(maxsize=32)
+def get_resampler(from_rate: int, to_rate: int) -> Resampler:
+    """
+    Gets the shared Resampler between two sample rates.
+    """
+    return Resampler(from_rate, to_rate)
+
+
+def resample(samples: np.ndarray, from_rate: int, to_rate: int) -> np.ndarray:
+    """
+    Converts a whole buffer of float samples from one sample rate to another.
+
+    Args:
+        samples: Float input samples.
+        from_rate: The sample rate of the input.
+        to_rate: The sample rate to convert to.
+
+    Returns:
+        A float32 numpy array.
+    """
+    if from_rate == to_rate:
+        return np.asarray(samples, dtype=np.float32)
+    return get_resampler(from_rate, to_rate).resample(samples)
+
+
+def resample_range(waveform: Waveform,
+                   resampler: Resampler,
+                   start_sample: int,
+                   num_samples: int) -> np.ndarray:
+    """
+    Converts a range of samples of a waveform, reading only the source
+    samples around the range.
+
+    Args:
+        waveform: The waveform to convert. Must implement get_samples().
+        resampler: The Resampler to convert with.
+        start_sample: The first output sample.
+        num_samples: The number of output samples.
+
+    Returns:
+        A float32 numpy array of num_samples samples.
+    """
+    first_input, end_input = resampler.input_range(start_sample, num_samples)
+
+    # The source is silent before its start and after its end.
+    samples = np.zeros(end_input - first_input, dtype=np.float32)
+    source_start = max(0, first_input)
+    source_end = min(waveform.num_samples, end_input)
+    if source_end > source_start:
+        samples[source_start - first_input:source_end - first_input] = \
+            waveform.get_samples(source_start, source_end)
+
+    return resampler.process(samples, first_input, start_sample, num_samples)
+
+
+class ResampledWave(Waveform):
+    """
+    Plays a waveform at another sample rate.
+
+    The whole converted waveform is cached in RESAMPLE_CACHE per target rate,
+    so every use of a sample at that rate shares one conversion. Waveforms too
+    large for the cache are converted a range at a time instead, from just the
+    source samples around each range.
+    """
+
+    def __init__(self, waveform: Waveform, sample_rate: int):
+        """
+        Args:
+            waveform: The waveform to convert. Must implement get_samples().
+            sample_rate: The sample rate to play it at.
+        """
+        super().__init__(waveform.duration, sample_rate=sample_rate)
+        self.waveform = waveform
+        self._key = (waveform.fingerprint(), sample_rate)
+
+    def fingerprint(self) -> tuple:
+        return ("ResampledWave",) + self._key
+
+    @property
+    def resampler(self) -> Resampler:
+        return get_resampler(self.waveform.sample_rate, self.sample_rate)
+
+    def _validate_range(self, start_sample: int, end_sample: int):
+        """
+        Raises a ValueError if [start_sample, end_sample) is out of bounds.
+        """
+        if end_sample > self.num_samples:
+            raise ValueError(
+                f"end sample {end_sample} is beyond the last sample.")
+
+        if start_sample < 0:
+            raise ValueError(
+                f"start_sample must be non-negative, but was: {start_sample}")
+
+    def get_samples(self, start_sample: int, end_sample: int) -> np.ndarray:
+        """
+        Get the converted samples from [start_sample, end_sample).
+
+        Args:
+            start_sample: The first sample (inclusive).
+            end_sample: The end sample (exclusive).
+
+        Return:
+            Numpy array of float32 samples.
+        """
+        self._validate_range(start_sample, end_sample)
+
+        if self.num_samples * 4 > RESAMPLE_CACHE.max_bytes:
+            return resample_range(self.waveform,
+                                  self.resampler,
+                                  start_sample,
+                                  end_sample - start_sample)
+
+        samples = RESAMPLE_CACHE.get(self._key)
+        if samples is None:
+            samples = RESAMPLE_CACHE.put(
+                self._key,
+                resample_range(self.waveform,
+                               self.resampler,
+                               0,
+                               self.num_samples))
+        return samples[start_sample:end_sample]
+
+    def get_frames(self,
+                   start_sample: int,
+                   end_sample: int,
+                   bit_width: int,
+                   master_volume: float) -> np.ndarray:
+        """
+        Get the converted samples as frames of the provided bit width, the
+        same way as WavFile.get_frames() decodes a float .wav file.
+
+        Args:
+            start_sample: The first sample (inclusive).
+            end_sample: The end sample (exclusive).
+            bit_width: The bit width of each sample.
+            master_volume: The master volume to scale the wave by.
+
+        Return:
+            Numpy array of frames.
+        """
+        samples = floats_to_ints(self.get_samples(start_sample, end_sample),
+                                 bit_width)
+        return (samples * master_volume).astype(np.int64)
@@ -0,0 +1,166 @@
+"""
+RIFF chunk parsing. A RIFF file is a header followed by a series of chunks,
+each with an id and a size, in any order. The chunks are walked by reading
+only their headers, so chunks that aren't needed, such as LIST or fact, are
+skipped without being read.
+
+Works on non-seekable streams such as pipes too, where skipped chunks are read
+and discarded a block at a time.
+"""
+
+import struct
+
+RIFF_HEADER = struct.Struct("<4sI4s")
+"""
+The "RIFF" tag, the size of the rest of the file and the form type.
+"""
+
+CHUNK_HEADER = struct.Struct("<4sI")
+"""
+The id and the size of a chunk.
+"""
+
+UNKNOWN_SIZE = 0xFFFFFFFF
+"""
+Chunk size written by streaming encoders which don't know the size of the
+data up front. A chunk of unknown size runs to the end of the file.
+"""
+
+SKIP_BLOCK_SIZE = 1 << 16
+"""
+The block size for discarding skipped chunks of a non-seekable stream.
+"""
+
+
+class Chunk(object):
+    """
+    The header of a chunk within a RIFF file.
+    """
+
+    def __init__(self, chunk_id: bytes, offset: int, size: int):
+        """
+        Args:
+            chunk_id: The four byte id of the chunk, like b"fmt ".
+            offset: The offset of the chunk's data within the file.
+            size: The size of the chunk's data, or None if it runs to the end
+                  of the file.
+        """
+        self.chunk_id = chunk_id
+        self.offset = offset
+        self.size = size
+
+    @property
+    def end(self) -> int:
+        """
+        The offset of the next chunk. Chunks are padded to an even size.
+        """
+        return self.offset + self.size + (self.size & 1)
+
+    def __repr__(self):
+        return f"Chunk({self.chunk_id!r}, offset={self.offset}, " + \
+            f"size={self.size})"
+
+
+class RiffReader(object):
+    """
+    Walks the chunks of a RIFF file, from a seekable file or a stream.
+
+        >>> reader = RiffReader(f, b"WAVE")
+        >>> for chunk in reader.chunks():
+        ...     if chunk.chunk_id == b"fmt ":
+        ...         fmt = reader.read(chunk.size)
+
+    The reader only moves forward, so each chunk can only be read while it is
+    the current chunk.
+    """
+
+    def __init__(self, f, form_type: bytes):
+        """
+        Reads the RIFF header.
+
+        Args:
+            f: A binary file object, positioned at the start of the file.
+            form_type: The expected form type, like b"WAVE".
+        """
+        self.file = f
+        self.seekable = f.seekable() if hasattr(f, "seekable") else False
+
+        # Pipes can't tell() either, so keep track of the position ourselves.
+        self.position = 0
+
+        header = self.read(RIFF_HEADER.size)
+        if len(header) < RIFF_HEADER.size:
+            raise ValueError("File is too short to be a RIFF file.")
+
+        riff, size, actual_form_type = RIFF_HEADER.unpack(header)
+        if riff != b"RIFF" or actual_form_type != form_type:
+            raise ValueError(
+                f"Not a RIFF {form_type.decode('latin-1')} file.")
+
+        self.size = size
+        """
+        The size of the file after the first 8 bytes, per the header.
+        """
+
+    def read(self, size: int) -> bytes:
+        """
+        Reads up to size bytes, fewer only at the end of the file. Streams may
+        return short reads, so this keeps reading until it has them all.
+        """
+        data = self.file.read(size)
+        if len(data) < size and len(data) > 0:
+            parts = [data]
+            remaining = size - len(data)
+            while remaining > 0:
+                part = self.file.read(remaining)
+                if len(part) == 0:
+                    break
+                parts.append(part)
+                remaining -= len(part)
+            data = b"".join(parts)
+
+        self.position += len(data)
+        return data
+
+    def skip(self, size: int):
+        """
+        Skips size bytes, seeking if possible.
+        """
+        if size <= 0:
+            return
+
+        if self.seekable:
+            self.file.seek(size, 1)
+            self.position += size
+            return
+
+        while size > 0:
+            skipped = len(self.read(min(size, SKIP_BLOCK_SIZE)))
+            if skipped == 0:
+                break
+            size -= skipped
+
+    def chunks(self):
+        """
+        Iterates over the chunks of the file. The reader is positioned at the
+        start of each chunk's data when it is yielded, and skips whatever is
+        left of the chunk on the next iteration.
+
+        Returns:
+            An iterator of Chunks.
+        """
+        while True:
+            header = self.read(CHUNK_HEADER.size)
+            if len(header) < CHUNK_HEADER.size:
+                return
+
+            chunk_id, size = CHUNK_HEADER.unpack(header)
+            chunk = Chunk(chunk_id,
+                          self.position,
+                          None if size == UNKNOWN_SIZE else size)
+            yield chunk
+
+            # A chunk of unknown size is always the last.
+            if chunk.size is None:
+                return
+            self.skip(chunk.end - self.position)
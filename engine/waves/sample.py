@@ -1,5 +1,7 @@
 import types
 
+import numpy as np
+
 class Sampler(object):
     """
     Initialize a Sample which is capable of converting a (1.0, 1.0) wave
@@ -19,14 +21,33 @@ class Sampler(object):
                  sample_bits: int,
                  multiplier: float,
                  offset: int,
-                 cast_func=int):
+                 cast_func=int,
+                 dtype="<i2",
+                 signed=True):
         """
         Initialize a sample format.
+
+        Args:
+            sample_bits: The bit width of each sample.
+            multiplier: The value that full scale (1.0) is mapped to.
+            offset: The value that silence (0.0) is mapped to.
+            cast_func: The type of each sample, int or float.
+            dtype: The little-endian numpy dtype that samples are stored in.
+            signed: Whether samples are signed.
         """
         self.sample_bits = sample_bits
         self.multiplier = multiplier
         self.offset = offset
         self.cast_func = cast_func
+        self.dtype = np.dtype(dtype)
+
+        # The range that quantized samples are clipped to.
+        if signed:
+            self.min_value = -(1 << (sample_bits - 1))
+            self.max_value = (1 << (sample_bits - 1)) - 1
+        else:
+            self.min_value = 0
+            self.max_value = (1 << sample_bits) - 1
 
         # If we're dealing with an integer, we need to truncate the value.
         # TODO: How to handle floating point?
@@ -45,21 +66,71 @@ class Sampler(object):
         return min(self.cast_func(value * self.multiplier + self.offset),
                    self.truncate)
 
+    def scale_array(self, values: np.ndarray) -> np.ndarray:
+        """
+        Scales a whole array of samples to this bit width, centered on 0. The
+        offset is left to be added once the frames of every wave are summed.
+
+        Args:
+            values: A numpy array of samples to scale.
+
+        Returns:
+            A numpy array of int64 samples.
+        """
+        return (values * self.multiplier).astype(np.int64)
+
+    def convert_array(self, values: np.ndarray) -> np.ndarray:
+        """
+        Converts a whole array of samples at once. Equivalent to calling
+        convert() on each sample with an int cast function.
+
+        Args:
+            values: A numpy array of samples to convert.
+
+        Returns:
+            A numpy array of int64 samples.
+        """
+        return np.minimum(
+            (values * self.multiplier + self.offset).astype(np.int64),
+            self.truncate)
+
+    def quantize(self, values: np.ndarray) -> np.ndarray:
+        """
+        Converts a whole array of float samples to this format in one pass.
+        Unlike convert_array(), samples are rounded to the nearest value, and
+        samples beyond full scale are clipped instead of wrapping around.
+
+        Args:
+            values: A numpy array of samples, nominally in [-1.0, 1.0].
+
+        Returns:
+            A numpy array of samples in this format's dtype.
+        """
+        if self.cast_func is float:
+            return np.clip(values, -1.0, 1.0).astype(self.dtype)
+
+        scaled = np.rint(values * self.multiplier) + self.offset
+        return np.clip(scaled, self.min_value, self.max_value).astype(
+            self.dtype)
+
     def bytes_per_sample(self) -> int:
         """
         Returns the sample size expressed in the number of bytes or frames.
         """
         return int(self.sample_bits / 8)
 
-# Note that 8 bit audio is signed while 16/24 bit audio is unsigned.
-SAMPLE_8_BIT  = Sampler(8,  (1 << 7) - 1,  1 << 7)
-SAMPLE_16_BIT = Sampler(16, (1 << 15) - 1, 1 << 7)
-SAMPLE_24_BIT = Sampler(24, (1 << 23) - 1, 1 << 12)
+# Note that 8 bit audio is unsigned and centered on 128, while 16/24 bit audio
+# is signed and centered on 0.
+SAMPLE_8_BIT    = Sampler(8,  (1 << 7) - 1,  1 << 7,  dtype="<u1", signed=False)
+SAMPLE_16_BIT   = Sampler(16, (1 << 15) - 1, 0,       dtype="<i2")
+SAMPLE_24_BIT   = Sampler(24, (1 << 23) - 1, 0,       dtype="<i4")
+SAMPLE_32_FLOAT = Sampler(32, 1.0,           0,       cast_func=float,
+                          dtype="<f4")
 
 def get_sampler_from_width(width: int) -> Sampler:
     """
     Gets a sampler from the given bit width. Supported widths include 8-bit,
-    16-bit, 24-bit.
+    16-bit, 24-bit and 32-bit float.
 
     Args:
         width: The bit width to cast to.
@@ -70,5 +141,7 @@ def get_sampler_from_width(width: int) -> Sampler:
         return SAMPLE_16_BIT
     elif width == 24:
         return SAMPLE_24_BIT
+    elif width == 32:
+        return SAMPLE_32_FLOAT
     else:
         raise ValueError(f"Unsupported bit width: {width}")
\ No newline at end of file
@@ -5,78 +5,206 @@ https://en.wikipedia.org/wiki/WAV
 
 """
 
-from .audio_file import Header, InputAudioFile
+from .audio_file import InputAudioFile
+from .codecs import WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT, \
+    WAVE_FORMAT_EXTENSIBLE, check_format, decode_floats, decode_ints
+from .riff import RiffReader
 from .waveform import Waveform
 from engine import debug
 
-WAV_FORMAT = Header()
+import numpy as np
+import os
+import struct
+
+KSDATAFORMAT_SUFFIX = \
+    b"\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71"
 """
-Wav header format, per:
-http://www.topherlee.com/software/pcm-tut-wavformat.html
+The last 14 bytes of the sub-format GUID of a WAVE_FORMAT_EXTENSIBLE fmt
+chunk. The first 2 bytes are the real format tag.
 """
 
-WAV_FORMAT.add_spec("riff",          offset=0,  length=4, required_val="RIFF")
-WAV_FORMAT.add_spec("file_size",     offset=4,  length=4, typespec=int)
-WAV_FORMAT.add_spec("wave",          offset=8,  length=4, required_val="WAVE")
-WAV_FORMAT.add_spec("fmt",           offset=12, length=4, required_val="fmt ")
-
-WAV_FORMAT.add_spec("format_length", offset=16, length=4, typespec=int, required_val=16)
-WAV_FORMAT.add_spec("format_type",   offset=20, length=2, typespec=int, required_val=1) # 1 == PCM only, we don't support Dolby Digital.
-WAV_FORMAT.add_spec("num_channels",  offset=22, length=2, typespec=int)
-WAV_FORMAT.add_spec("sample_rate",   offset=24, length=4, typespec=int)
-WAV_FORMAT.add_spec("bytes_per_sec", offset=28, length=4, typespec=int) # (BytesPerSample * Channels * SampleRate)
-
-WAV_FORMAT.add_spec("sample_size",   offset=32, length=2, typespec=int) # (BytesPerSample * Channels)
-WAV_FORMAT.add_spec("bit_width",     offset=34, length=2, typespec=int)
-WAV_FORMAT.add_spec("data",          offset=36, length=4, required_val="data")
-WAV_FORMAT.add_spec("data_size",     offset=40, length=4, typespec=int)
+HEADER_SIZE = 44
+"""
+The size of the canonical header written by WavWriter.
+"""
 
-DATA_OFFSET = 46
+STREAM_BLOCK_SIZE = 65536
 """
-The start of wav data.
+The default number of frames per block streamed by WavReader.
 """
 
+
+class WavFormat(object):
+    """
+    The contents of the fmt chunk of a .wav file.
+    """
+
+    def __init__(self, data: bytes):
+        """
+        Parses a fmt chunk.
+
+        Args:
+            data: The data of the chunk.
+        """
+        if len(data) < 16:
+            raise ValueError(f"The fmt chunk is too short: {len(data)} bytes.")
+
+        (self.format_type,
+         self.num_channels,
+         self.sample_rate,
+         self.bytes_per_sec,
+         self.block_align,
+         self.bit_width) = struct.unpack_from("<HHIIHH", data)
+
+        if self.bit_width % 8 != 0:
+            raise ValueError(
+                "Corrupted file - bit width does not divide evenly into 8")
+
+        if self.block_align == 0:
+            raise ValueError("Corrupted file - the block align is 0.")
+
+        # The bits which hold a sample, which may be fewer than bit_width.
+        # Samples are left aligned, so they decode the same either way.
+        self.valid_bits = self.bit_width
+
+        if self.format_type == WAVE_FORMAT_EXTENSIBLE:
+            if len(data) < 40:
+                raise ValueError(
+                    f"The extensible fmt chunk is too short: {len(data)} " +
+                    "bytes.")
+
+            self.valid_bits, _, sub_format = struct.unpack_from(
+                "<HI16s", data, 18)
+            if sub_format[2:] != KSDATAFORMAT_SUFFIX:
+                raise ValueError(
+                    f"Unsupported sub-format: {sub_format.hex()}")
+            self.format_type = int.from_bytes(sub_format[:2], "little")
+
+        check_format(self.format_type, self.bit_width)
+
+
+def read_wav_header(reader: RiffReader) -> tuple:
+    """
+    Walks the chunks of a .wav file up to the data chunk, skipping any others
+    such as LIST or fact.
+
+    Args:
+        reader: A RiffReader for the file.
+
+    Returns:
+        (WavFormat, data Chunk). The reader is left at the start of the data.
+    """
+    wav_format = None
+    for chunk in reader.chunks():
+        if chunk.chunk_id == b"fmt ":
+            if chunk.size is None:
+                raise ValueError("The fmt chunk has no size.")
+            wav_format = WavFormat(reader.read(chunk.size))
+        elif chunk.chunk_id == b"data":
+            if wav_format is None:
+                raise ValueError("The data chunk comes before the fmt chunk.")
+            return wav_format, chunk
+        else:
+            debug("Skipping {}", chunk)
+
+    raise ValueError("No data chunk.")
+
+
 class WavFile(Waveform):
     """
     Implements the Waveform interface for a .wav file.
     """
 
-    def __init__(self, filename: str):
+    def __init__(self, filename: str, memory_map=True):
         """
         Load a .wav file with the given filename.
+
+        Args:
+            filename: The .wav file to load.
+            memory_map: Map the file instead of reading all of it up front.
+                        Samples are read straight out of the mapping.
         """
         self.filename = filename
-        self.wav_file = InputAudioFile(filename, WAV_FORMAT)
 
-        # Read in class level attributes from the wav file header.
-        self._read_metadata()
+        # Read in class level attributes from the wav file header. Only the
+        # chunk headers are read, not the samples.
+        with open(filename, "rb") as f:
+            self._read_metadata(f)
+
+        self.wav_file = InputAudioFile(filename, memory_map=memory_map)
+
+        # Recordings which were cut short, or whose size was never filled in,
+        # have less data than their header claims. Only whole frames count.
+        available = len(self.wav_file) - self.data_offset
+        if self.data_size is None or self.data_size > available:
+            self.data_size = max(0, available)
+        self.data_size -= self.data_size % self.block_align
 
         duration = float(self.data_size) / self.bytes_per_sec
 
         super().__init__(duration, self.sample_rate)
 
-    def _read_metadata(self):
+        # Every sample as float32, once decode() has been called.
+        self._decoded = None
+
+    def __getstate__(self):
+        # The decoded samples can be large, so other processes decode their
+        # own instead.
+        state = self.__dict__.copy()
+        state["_decoded"] = None
+        return state
+
+    @property
+    def decoded_size(self) -> int:
         """
-        Helper function to read in .wav metadata.
+        The size of every sample decoded as float32, in bytes.
         """
-        if not self.wav_file.validate_header():
-            raise ValueError(f"Could not parse wav file: {self.filename}")
+        return self.num_samples * 4
 
-        self.data_size = self.wav_file.get_header_value("data_size")
-        self.bytes_per_sec = self.wav_file.get_header_value("bytes_per_sec")
-        self.bit_width = self.wav_file.get_header_value("bit_width")
-        self.byte_width = int(self.bit_width / 8)
-        self.sample_rate = self.wav_file.get_header_value("sample_rate")
-        self.num_channels = self.wav_file.get_header_value("num_channels")
+    def decode(self) -> np.ndarray:
+        """
+        Decodes every sample into a read-only float32 buffer, which
+        get_samples() then slices instead of decoding each time.
 
-        if self.data_size % self.bytes_per_sec != 0:
-            raise ValueError(
-                "Corrupted file - sample width does not divide evenly into" +
-                "the file size.")
+        Returns:
+            The decoded samples.
+        """
+        if self._decoded is None:
+            samples = decode_floats(self.wav_file.data,
+                                    self.data_offset,
+                                    self.num_samples,
+                                    self.format_type,
+                                    self.bit_width)
+            samples.flags.writeable = False
+            self._decoded = samples
+        return self._decoded
 
-        if self.bit_width % 8 != 0:
+    def _read_metadata(self, f):
+        """
+        Helper function to read in .wav metadata.
+        """
+        try:
+            wav_format, data = read_wav_header(RiffReader(f, b"WAVE"))
+        except ValueError as e:
             raise ValueError(
-                "Corrupted file - bit width does not divide evenly into 8")
+                f"Could not parse wav file: {self.filename}. {e}") from e
+
+        self.format_type = wav_format.format_type
+        self.data_offset = data.offset
+        self.data_size = data.size
+        self.bytes_per_sec = wav_format.bytes_per_sec
+        self.block_align = wav_format.block_align
+        self.bit_width = wav_format.bit_width
+        self.byte_width = int(self.bit_width / 8)
+        self.sample_rate = wav_format.sample_rate
+        self.num_channels = wav_format.num_channels
+
+    def fingerprint(self) -> tuple:
+        stat = os.stat(self.filename)
+        return ("WavFile",
+                os.path.abspath(self.filename),
+                stat.st_size,
+                stat.st_mtime_ns)
 
     def get_frames(self,
                    start_sample: int,
@@ -85,7 +213,9 @@ class WavFile(Waveform):
                    master_volume: float) -> list:
         """
         Get samples as frames of the provided bit width. A frame is a sample
-        converted to the given bit width.
+        converted to the given bit width. Frames are scaled by the master
+        volume, so the integer mixers play the file as loud as the float
+        mixer does.
 
         Args:
             start_sample: The first sample (inclusive).
@@ -94,23 +224,273 @@ class WavFile(Waveform):
             master_volume: The master volume to scale the wave by.
 
         Return:
-            List of frames.
+            Numpy array of frames.
         """
+        self._validate_range(start_sample, end_sample)
 
-        # TODO: Make this more flexible.
-        assert bit_width == self.bit_width
+        # Signed integer PCM at the output width is used as is. Everything
+        # else, including unsigned 8 bit PCM, is decoded and converted to the
+        # output width, centered on 0.
+        if self.format_type == WAVE_FORMAT_PCM and \
+                bit_width == self.bit_width and bit_width != 8:
+            samples = self._read_ints(start_sample, end_sample)
+        else:
+            samples = decode_ints(self.wav_file.data,
+                                  self._offset(start_sample),
+                                  end_sample - start_sample,
+                                  self.format_type,
+                                  self.bit_width,
+                                  bit_width)
+        return (samples * master_volume).astype(np.int64)
 
+    def get_samples(self, start_sample: int, end_sample: int) -> np.ndarray:
+        """
+        Get samples as floats in the range [-1.0, 1.0), in any format.
+
+        Args:
+            start_sample: The first sample (inclusive).
+            end_sample: The end sample (exclusive).
+
+        Return:
+            Numpy array of float32 samples.
+        """
+        self._validate_range(start_sample, end_sample)
+        if self._decoded is not None:
+            return self._decoded[start_sample:end_sample]
+
+        return decode_floats(self.wav_file.data,
+                             self._offset(start_sample),
+                             end_sample - start_sample,
+                             self.format_type,
+                             self.bit_width)
+
+    def _validate_range(self, start_sample: int, end_sample: int):
+        """
+        Raises a ValueError if [start_sample, end_sample) is out of bounds.
+        """
         if end_sample > self.num_samples:
             raise ValueError(f"end sample {end_sample} is beyond the last sample.")
 
-        frames = [0] * (end_sample - start_sample)
-        for i in range(len(frames)):
-            frames[i] = int(
-                0.8 *
-                self.wav_file.read_signed_int(
-                    DATA_OFFSET + ((start_sample + i) * self.byte_width),
-                    self.byte_width
-                )
-            )
-
-        return frames
\ No newline at end of file
+        if start_sample < 0:
+            raise ValueError(
+                f"start_sample must be non-negative, but was: {start_sample}")
+
+    def _offset(self, sample: int) -> int:
+        """
+        The byte offset of a sample within the file.
+        """
+        return self.data_offset + sample * self.byte_width
+
+    def _read_ints(self, start_sample: int, end_sample: int) -> np.ndarray:
+        """
+        Reads the raw integer samples in [start_sample, end_sample).
+        """
+        self._validate_range(start_sample, end_sample)
+        return self.wav_file.read_signed_ints(self._offset(start_sample),
+                                              self.byte_width,
+                                              end_sample - start_sample)
+
+
+class WavReader(object):
+    """
+    Streams the samples of a .wav file a block at a time, from a file or from
+    a non-seekable stream such as a pipe. Only the headers and one block are
+    held in memory, so recordings of any length can be imported.
+
+    Can be used as a context manager:
+
+        >>> with WavReader(sys.stdin.buffer) as reader:
+        ...     for samples in reader.samples():
+        ...         ...
+    """
+
+    def __init__(self, source, block_size=STREAM_BLOCK_SIZE):
+        """
+        Read the headers of a .wav file.
+
+        Args:
+            source: The filename of the .wav file, or a binary file object
+                    positioned at its start.
+            block_size: The maximum number of frames per block.
+        """
+        if isinstance(source, str):
+            self.file = open(source, "rb")
+            self._owns_file = True
+        else:
+            self.file = source
+            self._owns_file = False
+
+        try:
+            self._reader = RiffReader(self.file, b"WAVE")
+            self.format, data = read_wav_header(self._reader)
+        except ValueError:
+            self.close()
+            raise
+
+        self.sample_rate = self.format.sample_rate
+        self.bit_width = self.format.bit_width
+        self.num_channels = self.format.num_channels
+        self.block_size = block_size
+
+        self.data_size = data.size
+        """
+        The size of the data per the header, or None if it runs to the end of
+        the file.
+        """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def blocks(self):
+        """
+        Iterates over the data in blocks of up to block_size whole frames,
+        until the end of the data chunk or the file.
+
+        Returns:
+            An iterator of bytes.
+        """
+        block_bytes = self.block_size * self.format.block_align
+        remaining = self.data_size
+        while remaining is None or remaining > 0:
+            size = block_bytes if remaining is None else \
+                min(block_bytes, remaining)
+            block = self._reader.read(size)
+
+            # A file which was cut short may end partway through a frame.
+            block = block[:len(block) - len(block) % self.format.block_align]
+            if len(block) == 0:
+                return
+
+            if remaining is not None:
+                remaining -= len(block)
+            yield block
+
+    def samples(self):
+        """
+        Iterates over the data in blocks of float samples, in the range
+        [-1.0, 1.0). Channels are interleaved.
+
+        Returns:
+            An iterator of float32 numpy arrays.
+        """
+        byte_width = self.bit_width // 8
+        for block in self.blocks():
+            yield decode_floats(block,
+                                0,
+                                len(block) // byte_width,
+                                self.format.format_type,
+                                self.bit_width)
+
+    def close(self):
+        """
+        Close the file, if it was opened by the reader.
+        """
+        if self._owns_file:
+            self.file.close()
+
+
+class WavWriter(object):
+    """
+    Streams PCM frames into a .wav file. The header is written up front with
+    placeholder sizes, which are patched once the writer is closed, so frames
+    can be written incrementally in constant memory.
+
+    Can be used as a context manager:
+
+        >>> with WavWriter("out.wav", 22050, 16) as writer:
+        ...     writer.write(frames)
+    """
+
+    def __init__(self,
+                 filename: str,
+                 sample_rate: int,
+                 bit_width: int,
+                 num_channels=1):
+        """
+        Open a .wav file for writing.
+
+        Args:
+            filename: The file to write.
+            sample_rate: The sample rate.
+            bit_width: The bit width of each sample. Supported widths include
+                       8-bit, 16-bit, 24-bit integer and 32-bit float.
+            num_channels: The number of interleaved channels.
+        """
+        if bit_width not in (8, 16, 24, 32):
+            raise ValueError(f"Unsupported bit width: {bit_width}")
+
+        self.filename = filename
+        self.sample_rate = sample_rate
+        self.bit_width = bit_width
+        self.num_channels = num_channels
+        self.data_size = 0
+
+        self.file = open(filename, "wb")
+        self.file.write(self._header())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def format_type(self) -> int:
+        """
+        The format tag of the fmt chunk. 32-bit samples are IEEE floats, and
+        everything else is integer PCM.
+        """
+        return WAVE_FORMAT_IEEE_FLOAT if self.bit_width == 32 else WAVE_FORMAT_PCM
+
+    def _header(self) -> bytes:
+        """
+        Packs a canonical 44 byte header for the frames written so far. The
+        RIFF size counts the pad byte of an odd sized data chunk.
+        """
+        sample_size = int(self.bit_width / 8) * self.num_channels
+        return struct.pack("<4sI4s4sIHHIIHH4sI",
+                           b"RIFF",
+                           HEADER_SIZE - 8 + self.data_size +
+                           (self.data_size & 1),
+                           b"WAVE",
+                           b"fmt ",
+                           16,
+                           self.format_type,
+                           self.num_channels,
+                           self.sample_rate,
+                           sample_size * self.sample_rate,
+                           sample_size,
+                           self.bit_width,
+                           b"data",
+                           self.data_size)
+
+    def write(self, frames: bytes):
+        """
+        Append frames to the file.
+
+        Args:
+            frames: Little-endian PCM frames, as produced by a WaveCollapser.
+        """
+        self.file.write(frames)
+        self.data_size += len(frames)
+
+    def close(self):
+        """
+        Pad the data chunk to an even size, patch the RIFF and data sizes and
+        close the file.
+        """
+        if self.file.closed:
+            return
+
+        # Chunks are word aligned, so an odd sized chunk is followed by a pad
+        # byte which isn't counted in its own size.
+        if self.data_size & 1:
+            self.file.write(b"\x00")
+
+        self.file.seek(0)
+        self.file.write(self._header())
+        self.file.close()
+        debug("Wrote {} bytes to {}", self.data_size, self.filename)
@@ -3,10 +3,25 @@ Series of classes which implement a waveform. A waveform can be created from
 many input sources and must be able to output a series of samples.
 """
 
+from .cache import NOTE_CACHE
 from .notes import NOTES
+from .oscillator import sine_bank
 from .sample import get_sampler_from_width
 
-import math
+import numpy as np
+
+VOLUME_BUCKETS = 10000
+"""
+Resolution of the volume used to key cached Note frames. Volumes are rounded
+to the nearest 1 / VOLUME_BUCKETS.
+"""
+
+MAX_NOTE_CACHE_SHARE = 1 / 16
+"""
+The largest share of NOTE_CACHE that a single note may take up. Longer notes
+are synthesized a chunk at a time instead, so that one sustained note can't
+evict every other note.
+"""
 
 class Waveform(object):
     """
@@ -31,13 +46,40 @@ class Waveform(object):
         """
         return int(self.duration * self.sample_rate)
 
+    def fingerprint(self) -> tuple:
+        """
+        Interface for identifying the sound of this waveform. Two waveforms
+        with equal fingerprints must produce the same frames. Used to cache
+        renders across runs.
+
+        Returns:
+            A tuple of strings and numbers.
+        """
+        raise NotImplementedError()
+
+    def get_samples(self, start_sample: int, end_sample: int) -> np.ndarray:
+        """
+        Interface for getting samples as floats at full volume, nominally in
+        the range [-1.0, 1.0]. Used by the float mix bus.
+
+        Args:
+            start_sample: The first sample (inclusive).
+            end_sample: The end sample (exclusive).
+
+        Return:
+            Numpy array of float samples.
+        """
+        raise NotImplementedError()
+
     def get_frames(self,
                    start_sample: int,
                    end_sample: int,
                    bit_width: int) -> list:
         """
         Interface for getting samples as frames of the provided bit width. A
-        frame is a sample converted to the given bit width.
+        frame is a sample converted to the given bit width, centered on 0 at
+        every width. The mixers add the offset of unsigned formats once,
+        after summing every wave.
 
         Args:
             start_sample: The first sample (inclusive).
@@ -56,24 +98,48 @@ class Note(Waveform):
     just a simple sine wave.
     """
 
-    def __init__(self, note: str, duration: float, sample_rate=22050):
+    def __init__(self, note, duration: float, sample_rate=22050):
+        """
+        Creates a new note.
+
+        Args:
+            note: The name of the note, like "A4", or its frequency in Hz.
+            duration: The duration of the note, in seconds.
+            sample_rate: The sample rate.
+        """
         super().__init__(duration, sample_rate=sample_rate)
 
-        if note not in NOTES:
-            raise ValueError(f"{note} is not a valid note.")
+        if isinstance(note, str):
+            if note not in NOTES:
+                raise ValueError(f"{note} is not a valid note.")
+            self.freq = NOTES[note]
+        else:
+            self.freq = float(note)
+            if self.freq < 0.0:
+                raise ValueError(
+                    f"Frequency must be non-negative, but was: {note}")
 
-        self.freq = NOTES[note]
+    def fingerprint(self) -> tuple:
+        return ("Note", self.freq, self.duration, self.sample_rate)
 
-    def get_samples(self, start_sample: int, end_sample: int) -> list:
+    @property
+    def cacheable(self) -> bool:
         """
-        Returns a sine wave for this sample from [start_sample, end_sample).
+        Whether the whole note is small enough to keep in NOTE_CACHE.
+        """
+        return self.num_samples * 4 <= \
+            NOTE_CACHE.max_bytes * MAX_NOTE_CACHE_SHARE
 
-        Args:
-            start_sample: The first sample (inclusive).
-            end_sample: The end sample (exclusive).
+    @property
+    def cached(self) -> bool:
+        """
+        Whether the float samples of this note are already in NOTE_CACHE.
+        """
+        return self.cacheable and self._cache_key() in NOTE_CACHE
 
-        Return:
-            List of samples.
+    def _validate_range(self, start_sample: int, end_sample: int):
+        """
+        Raises a ValueError if [start_sample, end_sample) is out of bounds.
         """
         if end_sample > self.num_samples:
             raise ValueError(
@@ -86,20 +152,79 @@ class Note(Waveform):
                 f"start_sample must be non-negative, but was: {start_sample}"
             )
 
-        return [
-            math.sin(2 * math.pi * self.freq * t / self.sample_rate)
-            for t in range(start_sample, end_sample)
-        ]
+    def _sine(self, start_sample: int, end_sample: int) -> np.ndarray:
+        """
+        Computes the sine wave of this note from [start_sample, end_sample), in
+        double precision.
+        """
+        t = np.arange(start_sample, end_sample)
+        return np.sin(2 * np.pi * self.freq * t / self.sample_rate)
+
+    def _cache_key(self) -> tuple:
+        """
+        Identifies the sound of this note within NOTE_CACHE. Subclasses which
+        sound different must return a different key.
+        """
+        return (self.freq, self.duration, self.sample_rate)
+
+    def _render(self, start_sample: int, end_sample: int) -> np.ndarray:
+        """
+        Synthesizes this note from [start_sample, end_sample), in double
+        precision. Overridden by subclasses with other tones.
+        """
+        return self._sine(start_sample, end_sample)
+
+    def _render_float(self, start_sample: int, end_sample: int) -> np.ndarray:
+        """
+        Synthesizes this note from [start_sample, end_sample) as float32, for
+        notes too long to cache.
+        """
+        return sine_bank([self.freq],
+                         [0],
+                         [start_sample],
+                         [end_sample],
+                         self.sample_rate,
+                         end_sample - start_sample)
+
+    def get_samples(self, start_sample: int, end_sample: int) -> np.ndarray:
+        """
+        Returns a sine wave for this sample from [start_sample, end_sample).
+
+        The samples of the whole note are rendered once and cached in
+        NOTE_CACHE as float32, the precision of the float mix bus.
+
+        Args:
+            start_sample: The first sample (inclusive).
+            end_sample: The end sample (exclusive).
+
+        Return:
+            Numpy array of samples.
+        """
+        self._validate_range(start_sample, end_sample)
+
+        if not self.cacheable:
+            return self._render_float(start_sample, end_sample)
+
+        key = self._cache_key()
+        samples = NOTE_CACHE.get(key)
+        if samples is None:
+            samples = NOTE_CACHE.put(
+                key, self._render(0, self.num_samples).astype(np.float32))
+
+        return samples[start_sample:end_sample]
 
     def get_frames(self,
                    start_sample: int,
                    end_sample: int,
                    bit_width: int,
-                   master_volume: float) -> list:
+                   master_volume: float) -> np.ndarray:
         """
         Get samples as frames of the provided bit width. A frame is a sample
         converted to the given bit width.
 
+        The frames of the whole note are rendered once and cached in
+        NOTE_CACHE, so repeated notes only cost a slice.
+
         Args:
             start_sample: The first sample (inclusive).
             end_sample: The end sample (exclusive).
@@ -107,15 +232,24 @@ class Note(Waveform):
             master_volume: The master volume to scale the wave by.
 
         Return:
-            List of frames.
+            Numpy array of frames.
         """
-        samples = self.get_samples(start_sample, end_sample)
-        sampler = get_sampler_from_width(bit_width)
+        self._validate_range(start_sample, end_sample)
 
-        # For each sample, convert it to the given bit_width and update the
-        # frames list. Let's just modify it in-place, since it will be the same
-        # size.
-        for i in range(len(samples)):
-            samples[i] = sampler.convert(samples[i] * master_volume)
-
-        return samples
\ No newline at end of file
+        sampler = get_sampler_from_width(bit_width)
+        volume_bucket = round(master_volume * VOLUME_BUCKETS)
+        volume = volume_bucket / VOLUME_BUCKETS
+
+        # Notes too large to be cached are rendered piecemeal.
+        if not self.cacheable:
+            samples = self._render(start_sample, end_sample)
+            return sampler.scale_array(samples * volume)
+
+        key = self._cache_key() + (bit_width, volume_bucket)
+        frames = NOTE_CACHE.get(key)
+        if frames is None:
+            samples = self._render(0, self.num_samples)
+            frames = NOTE_CACHE.put(
+                key, sampler.scale_array(samples * volume).astype(np.int32))
+
+        return frames[start_sample:end_sample]
@@ -0,0 +1,197 @@
+"""
+Wavetable synthesis. Square, saw and triangle tones are played back from
+single-cycle tables instead of being computed directly, which would alias.
+
+Each table is band-limited by additive synthesis: it only contains the
+harmonics which stay below the Nyquist frequency for every note in its
+octave. Tables are built once per (shape, octave) and shared by every note
+that uses them.
+"""
+
+from .waveform import Note
+
+from threading import Lock
+
+import math
+import numpy as np
+
+SHAPE_SQUARE = "square"
+SHAPE_SAW = "saw"
+SHAPE_TRIANGLE = "triangle"
+
+SHAPES = (SHAPE_SQUARE, SHAPE_SAW, SHAPE_TRIANGLE)
+"""
+All supported wavetable shapes.
+"""
+
+TABLE_SIZE = 2048
+"""
+The number of samples in one cycle of a wavetable. Also caps the number of
+harmonics a table can hold at TABLE_SIZE / 2 - 1.
+"""
+
+_tables = {}
+"""
+Every wavetable built so far, keyed by (shape, number of harmonics).
+"""
+
+_tables_lock = Lock()
+
+
+def _harmonic_amplitudes(shape: str, harmonics: np.ndarray) -> np.ndarray:
+    """
+    The Fourier series of each shape, as sine amplitudes per harmonic.
+    """
+    if shape == SHAPE_SAW:
+        return 2 / np.pi * (-1.0) ** (harmonics + 1) / harmonics
+    elif shape == SHAPE_SQUARE:
+        return np.where(harmonics % 2 == 1, 4 / np.pi / harmonics, 0.0)
+    elif shape == SHAPE_TRIANGLE:
+        signs = (-1.0) ** ((harmonics - 1) // 2)
+        return np.where(harmonics % 2 == 1,
+                        8 / np.pi ** 2 * signs / harmonics ** 2,
+                        0.0)
+    else:
+        raise ValueError(f"Unsupported wavetable shape: {shape}")
+
+
+def _build_table(shape: str, num_harmonics: int) -> np.ndarray:
+    """
+    Synthesizes one cycle of a shape from its first num_harmonics harmonics.
+
+    Returns:
+        A read-only float64 array of TABLE_SIZE + 1 samples. The last sample
+        repeats the first, so interpolation never needs to wrap.
+    """
+    harmonics = np.arange(1, num_harmonics + 1)
+
+    # Lanczos sigma factors taper the highest harmonics, which tames the
+    # ringing that truncating the series would cause.
+    amplitudes = _harmonic_amplitudes(shape, harmonics) * \
+        np.sinc(harmonics / (num_harmonics + 1))
+
+    # A sine of amplitude a at harmonic h is -a * N / 2 in the imaginary part
+    # of bin h.
+    spectrum = np.zeros(TABLE_SIZE // 2 + 1, dtype=np.complex128)
+    spectrum[1:num_harmonics + 1] = -0.5j * TABLE_SIZE * amplitudes
+    cycle = np.fft.irfft(spectrum, TABLE_SIZE)
+
+    peak = np.abs(cycle).max()
+    if peak > 0.0:
+        cycle /= peak
+
+    table = np.append(cycle, cycle[0])
+    table.flags.writeable = False
+    return table
+
+
+def get_table(shape: str, freq: float, sample_rate: int) -> np.ndarray:
+    """
+    Gets the shared wavetable for a note, building it if necessary.
+
+    Notes are grouped into octaves which end at a power of 2 Hz. The table of
+    an octave holds every harmonic of its highest frequency below the Nyquist
+    frequency, so no note in the octave aliases.
+
+    Args:
+        shape: The shape of the wave, one of SHAPES.
+        freq: The frequency of the note.
+        sample_rate: The sample rate.
+
+    Returns:
+        A read-only array of TABLE_SIZE + 1 samples.
+    """
+    if shape not in SHAPES:
+        raise ValueError(f"Unsupported wavetable shape: {shape}")
+
+    octave = max(0, math.ceil(math.log2(freq))) if freq > 0 else 0
+    num_harmonics = int(sample_rate / 2 // (2 ** octave))
+    num_harmonics = max(1, min(num_harmonics, TABLE_SIZE // 2 - 1))
+
+    # Octaves with the same number of harmonics share a table, even across
+    # sample rates.
+    key = (shape, num_harmonics)
+    with _tables_lock:
+        table = _tables.get(key)
+        if table is None:
+            table = _tables[key] = _build_table(shape, num_harmonics)
+
+    return table
+
+
+class WavetableNote(Note):
+    """
+    A note played from a band-limited wavetable. Use one of the subclasses,
+    or pass the shape explicitly.
+    """
+
+    shape = None
+    """
+    The shape of the wave, one of SHAPES.
+    """
+
+    def __init__(self,
+                 note,
+                 duration: float,
+                 sample_rate=22050,
+                 shape=None):
+        super().__init__(note, duration, sample_rate=sample_rate)
+
+        if shape is not None:
+            self.shape = shape
+
+        self.table = get_table(self.shape, self.freq, sample_rate)
+
+    def fingerprint(self) -> tuple:
+        return ("WavetableNote",
+                self.shape,
+                self.freq,
+                self.duration,
+                self.sample_rate)
+
+    def _cache_key(self) -> tuple:
+        return (self.shape, self.freq, self.duration, self.sample_rate)
+
+    def _render(self, start_sample: int, end_sample: int) -> np.ndarray:
+        """
+        Looks up the table with linear interpolation. The phase is wrapped to
+        a single cycle in double precision, the same as the oscillator bank.
+        """
+        cycles = self.freq / self.sample_rate
+        phases = np.arange(end_sample - start_sample) * cycles
+        phases += math.fmod(cycles * start_sample, 1.0)
+        phases -= np.floor(phases)
+
+        positions = phases * TABLE_SIZE
+        indices = positions.astype(np.int64)
+        fractions = positions - indices
+
+        left = self.table[indices]
+        return left + fractions * (self.table[indices + 1] - left)
+
+    def _render_float(self, start_sample: int, end_sample: int) -> np.ndarray:
+        return self._render(start_sample, end_sample).astype(np.float32)
+
+
+class SquareNote(WavetableNote):
+    """
+    A band-limited square wave.
+    """
+
+    shape = SHAPE_SQUARE
+
+
+class SawNote(WavetableNote):
+    """
+    A band-limited sawtooth wave.
+    """
+
+    shape = SHAPE_SAW
+
+
+class TriangleNote(WavetableNote):
+    """
+    A band-limited triangle wave.
+    """
+
+    shape = SHAPE_TRIANGLE
@@ -2,7 +2,7 @@ import importlib
 import os
 import sys
 
-from engine import info
+from engine import configure_from_args, info
 
 def test(*args):
     info("Running unit tests...")
@@ -12,6 +12,10 @@ def test(*args):
         path = args[0]
     os.system(f"python -m pytest {path}")
 
+def bench(*args):
+    info("Running benchmarks...")
+    os.system("python -m benchmarks " + " ".join(args))
+
 def run(*args):
     info("Starting up...")
 
@@ -24,6 +28,34 @@ def run(*args):
     module = importlib.import_module(module_name)
     module.play()
 
+def render(*args):
+    info("Starting up...")
+
+    # Options are given as --name=value, e.g. --workers=4. Anything else that
+    # starts with -- is a log level.
+    workers = 1
+    positional = []
+    for arg in args:
+        if arg.startswith("--workers="):
+            workers = int(arg[len("--workers="):])
+        elif not arg.startswith("--"):
+            positional.append(arg)
+
+    # Default to super mario.
+    module_name = "super_mario"
+    if len(positional) > 0:
+        module_name = positional[0]
+
+    # Default to <song>.wav in the current directory.
+    filename = module_name + ".wav"
+    if len(positional) > 1:
+        filename = positional[1]
+
+    module = importlib.import_module("songs." + module_name)
+    module.get_player().render(filename, workers=workers)
+
+configure_from_args(sys.argv)
+
 do = run
 args_to_skip = 1
 
@@ -31,5 +63,11 @@ if len(sys.argv) > 1:
     if sys.argv[1] == "test":
         do = test
         args_to_skip = 2
+    elif sys.argv[1] == "bench":
+        do = bench
+        args_to_skip = 2
+    elif sys.argv[1] == "render":
+        do = render
+        args_to_skip = 2
 
 do(*sys.argv[args_to_skip:])
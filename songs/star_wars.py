@@ -1,9 +1,11 @@
 from engine.tracks import ImportedAudioTrack
 from engine.player import Player
 
-def play():
+def get_player():
     track = ImportedAudioTrack("Star Wars")
     track.add_wav_file(0.0, "songs/audio/StarWars60.wav")
 
-    player = Player([track], sample_rate=track.sample_rate, volume=0.3, sample_width=16)
-    player.play()
\ No newline at end of file
+    return Player([track], sample_rate=track.sample_rate, volume=0.3, sample_width=16)
+
+def play():
+    get_player().play()
\ No newline at end of file
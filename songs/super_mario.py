@@ -207,12 +207,12 @@ def get_star_wars():
     track.add_wav_file(0.0, "songs/audio/StarWars60.wav")
     return track
 
-def play():
+def get_player():
     super_mario_melody = get_melody()
     super_mario_bass = get_bass()
     # star_wars = get_star_wars()
 
-    player = Player(
+    return Player(
         [
             super_mario_melody,
             super_mario_bass,
@@ -221,4 +221,6 @@ def play():
         sample_rate=super_mario_melody.sample_rate,
         volume=0.3,
         sample_width=16)
-    player.play()
\ No newline at end of file
+
+def play():
+    get_player().play()
\ No newline at end of file
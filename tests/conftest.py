@@ -0,0 +1,39 @@
+import numpy as np
+import os
+import pytest
+
+from engine.player.player import pack_frames
+from engine.waves import WavWriter
+
+@pytest.fixture
+def write_wav():
+    """
+    Writes integer samples into a .wav file, creating its directory if
+    necessary. Each sample is repeated on every channel.
+
+        >>> filename = write_wav(tmp_path / "a.wav", np.zeros(100))
+    """
+    def write(filename, samples, sample_rate=22050, bit_width=16, channels=1):
+        filename = str(filename)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        frames = np.repeat(np.asarray(samples), channels)
+        with WavWriter(filename, sample_rate, bit_width, channels) as writer:
+            writer.write(pack_frames(frames, bit_width))
+        return filename
+    return write
+
+@pytest.fixture
+def write_sine(write_wav):
+    """
+    Writes a 16 bit sine at half scale into a .wav file.
+
+        >>> filename = write_sine(tmp_path / "a4.wav", 440, 22050)
+    """
+    def write(filename, freq, num_samples, sample_rate=22050, channels=1):
+        t = np.arange(num_samples) / sample_rate
+        samples = np.rint(0.5 * np.sin(2 * np.pi * freq * t) * 32767)
+        return write_wav(filename,
+                         samples,
+                         sample_rate=sample_rate,
+                         channels=channels)
+    return write
@@ -0,0 +1,102 @@
+import gc
+import numpy as np
+import os
+import pickle
+import pytest
+
+from engine.tracks import ImportedAudioTrack
+from engine.waves import AssetRegistry, WavFile
+
+def test_shared_asset(tmp_path, write_wav):
+    registry = AssetRegistry(1024 * 1024)
+    filename = write_wav(tmp_path / "drum.wav", [1000] * 1000)
+
+    wav_file = registry.acquire(filename)
+    assert registry.acquire(filename) is wav_file
+    assert registry.acquire(os.path.join(str(tmp_path), ".",
+                                         "drum.wav")) is wav_file
+    assert registry.stats()["hits"] == 2
+    assert registry.num_bytes == 4000
+
+    # Samples are sliced from one read-only decoded buffer.
+    samples = wav_file.get_samples(10, 20)
+    assert not samples.flags.writeable
+    assert np.all(samples == 1000 / 32768)
+    assert np.array_equal(
+        wav_file.get_samples(0, 1000),
+        WavFile(filename).get_samples(0, 1000))
+
+    # Copies for other processes decode their own samples.
+    assert pickle.loads(pickle.dumps(wav_file))._decoded is None
+
+def test_reload_on_change(tmp_path, write_wav):
+    registry = AssetRegistry(1024 * 1024)
+    filename = write_wav(tmp_path / "drum.wav", [1000] * 1000)
+    old = registry.acquire(filename)
+
+    write_wav(filename, [2000] * 500)
+    os.utime(filename, ns=(0, os.stat(filename).st_mtime_ns + 1))
+    new = registry.acquire(filename)
+    assert new is not old
+    assert new.num_samples == 500
+    assert registry.reloads == 1
+    assert registry.num_bytes == 2000
+
+    # The old version keeps working, and releasing it is harmless.
+    assert old.get_samples(0, 1)[0] == 1000 / 32768
+    registry.release(old)
+    assert registry.stats()["held"] == 1
+
+def test_eviction(tmp_path, write_wav):
+    registry = AssetRegistry(10000)
+    filenames = [write_wav(tmp_path / f"{i}.wav", [i] * 1000)
+                 for i in range(3)]
+
+    held = registry.acquire(filenames[0])
+    for filename in filenames[1:]:
+        registry.release(registry.acquire(filename))
+
+    # Files which are held are never evicted, the rest go least recently
+    # used first.
+    assert registry.evictions == 1
+    assert registry.num_bytes == 8000
+    assert registry.acquire(filenames[2]) is not None
+    assert registry.stats()["misses"] == 3
+
+    # Files larger than the budget are read without being decoded.
+    big = registry.acquire(write_wav(tmp_path / "big.wav", [5] * 20000))
+    assert big._decoded is None
+    assert big.get_samples(0, 1)[0] == 5 / 32768
+    assert registry.acquire(filenames[0]) is held
+
+def test_preload(tmp_path, write_wav):
+    registry = AssetRegistry(1024 * 1024)
+    filenames = [write_wav(tmp_path / f"{i}.wav", [i] * 1000)
+                 for i in range(8)]
+    futures = registry.preload(filenames + [str(tmp_path / "missing.wav")],
+                               workers=3)
+
+    wav_files = [future.result() for future in futures[:-1]]
+    assert all(wav_file._decoded is not None for wav_file in wav_files)
+    with pytest.raises(FileNotFoundError):
+        futures[-1].result()
+
+    assert registry.acquire(filenames[3]) is wav_files[3]
+    assert registry.stats()["held"] == 1
+
+def test_imported_audio_track(tmp_path, write_wav):
+    registry = AssetRegistry(1024 * 1024)
+    filename = write_wav(tmp_path / "drum.wav", [1000] * 1000)
+
+    track = ImportedAudioTrack("drums", assets=registry)
+    for i in range(100):
+        track.add_wav_file(i * 0.5, filename)
+    assert len({id(wave.waveform) for wave in track.waveforms}) == 1
+    assert registry.stats()["held"] == 1
+
+    assert pickle.loads(pickle.dumps(track)).assets is None
+
+    # The files are released once the track is gone.
+    del track
+    gc.collect()
+    assert registry.stats()["held"] == 0
@@ -0,0 +1,37 @@
+from engine import LogLevel, debug, get_level, info, is_enabled, set_level
+
+def test_is_enabled():
+    level = get_level()
+    try:
+        set_level(LogLevel.WARN)
+        assert not is_enabled(LogLevel.DEBUG)
+        assert not is_enabled(LogLevel.INFO)
+        assert is_enabled(LogLevel.WARN)
+        assert is_enabled(LogLevel.ERROR)
+    finally:
+        set_level(level)
+
+def test_lazy_formatting(capsys):
+    level = get_level()
+    calls = []
+
+    def message():
+        calls.append(1)
+        return "expensive"
+
+    try:
+        set_level(LogLevel.INFO)
+
+        # Below the log level, the message is never built.
+        debug(message)
+        assert len(calls) == 0
+        assert capsys.readouterr().out == ""
+
+        info(message)
+        assert len(calls) == 1
+        assert "expensive" in capsys.readouterr().out
+
+        info("{} + {}", 1, 2)
+        assert "1 + 2" in capsys.readouterr().out
+    finally:
+        set_level(level)
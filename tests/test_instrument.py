@@ -0,0 +1,118 @@
+import numpy as np
+import os
+import pytest
+
+from engine.player.player import WaveCollapser
+from engine.tracks import CustomNotesTrack, EventTrack, MergedTimeline
+from engine.waves import ASSETS, NOTE_CACHE, SampledInstrument
+import engine.waves.instrument as instrument_module
+from engine.waves.instrument import get_roots
+from engine.waves.notes import NOTES
+
+def instrument(roots):
+    return type("Instrument", (SampledInstrument,), {"roots": roots})
+
+def test_pitch_shift(tmp_path, write_sine):
+    roots = {"A4": write_sine(tmp_path / "a4.wav", 440, 22050)}
+
+    # An octave up plays the recording twice as fast.
+    note = instrument(roots)("A5", 0.5)
+    samples = note.get_samples(0, note.num_samples)
+    t = np.arange(note.num_samples) / note.sample_rate
+    expected = 0.5 * np.sin(2 * np.pi * 880 * t)
+    assert np.abs(samples[1000:-1000] - expected[1000:-1000]).max() < 1e-3
+
+    # Shifting and converting the sample rate happen in one pass. The ratio
+    # is rounded to MAX_PITCH_PHASES, which drifts by a fraction of a cent.
+    note = instrument(roots)("E5", 0.5, sample_rate=44100)
+    samples = note.get_samples(0, note.num_samples)
+    t = np.arange(note.num_samples) / 44100
+    expected = 0.5 * np.sin(2 * np.pi * NOTES["E5"] * t)
+    assert np.abs(samples[1000:-1000] - expected[1000:-1000]).max() < 5e-3
+
+def test_nearest_root(tmp_path, write_sine):
+    roots = {
+        "A4": write_sine(tmp_path / "a4.wav", 440, 1000),
+        "A5": write_sine(tmp_path / "a5.wav", 880, 1000),
+    }
+    assert instrument(roots)("C5", 1.0).root.freq == 440.0
+    assert instrument(roots)("F5", 1.0).root.freq == 880.0
+    assert instrument(roots)("A6", 1.0).root.freq == 880.0
+
+def test_recording_runs_out(tmp_path, write_sine):
+    roots = {"A4": write_sine(tmp_path / "a4.wav", 440, 1000)}
+
+    # Two octaves down, the recording lasts four times as long.
+    note = instrument(roots)("A2", 1.0)
+    samples = note.get_samples(0, note.num_samples)
+    assert np.abs(samples[:3900]).max() > 0.4
+    assert np.all(samples[4100:] == 0.0)
+
+    rest = instrument(roots)("REST", 1.0)
+    assert np.all(rest.get_samples(0, 100) == 0.0)
+
+def test_shared_buffers(tmp_path, write_sine):
+    roots = {"A4": write_sine(tmp_path / "a4.wav", 440, 22050)}
+    NOTE_CACHE.clear()
+
+    # Notes of the same pitch share one shifted root, whatever their length.
+    short = instrument(roots)("C5", 0.25).get_samples(0, 100)
+    long = instrument(roots)("C5", 0.5).get_samples(0, 100)
+    assert np.shares_memory(short, long)
+    assert not long.flags.writeable
+    assert len(NOTE_CACHE) == 1
+
+def test_invalid_roots(tmp_path, write_sine):
+    with pytest.raises(ValueError, match="at least one"):
+        SampledInstrument("A4", 1.0)
+
+    with pytest.raises(ValueError, match="root note"):
+        instrument({"REST": "rest.wav"})("A4", 1.0)
+
+    # Roots which loaded before the invalid one are handed back.
+    mono = write_sine(tmp_path / "mono.wav", 440, 1000)
+    stereo = write_sine(tmp_path / "stereo.wav", 440, 1000, channels=2)
+    with pytest.raises(ValueError, match="mono"):
+        instrument({"A4": mono, "A5": stereo})("A4", 1.0)
+    assert ASSETS._entries[os.path.abspath(mono)].refs == 0
+
+def test_racing_roots(tmp_path, write_sine, monkeypatch):
+    class Misses(dict):
+        # Every lookup misses, like two threads loading the same roots.
+        def get(self, key):
+            return None
+
+    monkeypatch.setattr(instrument_module, "_roots", Misses())
+    roots = {"A4": write_sine(tmp_path / "a4.wav", 440, 1000)}
+    first = get_roots(roots)
+    assert get_roots(roots) is first
+
+    # The roots which lost the race are handed back.
+    assert ASSETS._entries[os.path.abspath(roots["A4"])].refs == 1
+
+def test_sampled_melody(tmp_path, write_sine):
+    class Sine(SampledInstrument):
+        roots = {"A4": write_sine(tmp_path / "a4.wav", 440, 22050)}
+
+    track = CustomNotesTrack("", 120, instrument=Sine)
+    track.append_note(1, "C5")
+    track.append_note(1, "REST")
+    track.append_note(1, "G4")
+
+    waves = list(track.waveforms)
+    assert [type(wave.waveform) for wave in waves] == [Sine] * 3
+
+    wave_collapser = WaveCollapser(MergedTimeline([track]), 22050, 16)
+    bus = wave_collapser.mix_samples(0, 3 * 11025, 1.0)
+    assert np.array_equal(bus[:11025], waves[0].waveform.get_samples(0, 11025))
+    assert np.all(bus[11025:22050] == 0.0)
+    assert np.array_equal(bus[22050:], waves[2].waveform.get_samples(0, 11025))
+
+    # Notes added one at a time are recreated from their class.
+    track = EventTrack("")
+    track.add_waveform(0.5, Sine("C5", 0.5))
+    waves = list(track.waveforms)
+    assert type(waves[0].waveform) is Sine
+    bus = WaveCollapser(MergedTimeline([track]), 22050, 16).mix_samples(
+        11025, 11025, 1.0)
+    assert np.array_equal(bus, waves[0].waveform.get_samples(0, 11025))
@@ -0,0 +1,91 @@
+import json
+import os
+import struct
+
+from engine.waves import SampleLibrary, WavFile
+from engine.waves.library import read_wav_info
+
+def test_read_wav_info(tmp_path, write_wav):
+    filename = str(tmp_path / "a.wav")
+    write_wav(filename, [0] * 11025, sample_rate=22050, bit_width=24)
+    wav_info = read_wav_info(filename, os.path.getsize(filename), 1)
+    wav = WavFile(filename)
+    assert (wav_info.sample_rate, wav_info.bit_width, wav_info.num_channels,
+            wav_info.duration, wav_info.format_type) == \
+        (wav.sample_rate, wav.bit_width, wav.num_channels, wav.duration, 1)
+    assert wav_info.error is None
+
+    # A LIST chunk before the fmt chunk needs the chunks walked.
+    fmt = struct.pack("<HHIIHH", 3, 2, 8000, 64000, 8, 32)
+    data = b"WAVELIST\x04\x00\x00\x00INFOfmt " + struct.pack("<I", 16) + \
+        fmt + b"data" + struct.pack("<I", 16000) + b"\x00" * 16000
+    filename = str(tmp_path / "b.wav")
+    with open(filename, "wb") as f:
+        f.write(b"RIFF" + struct.pack("<I", len(data)) + data)
+    wav_info = read_wav_info(filename, os.path.getsize(filename), 1)
+    assert (wav_info.format_type, wav_info.num_channels, wav_info.duration) == \
+        (3, 2, 0.25)
+
+    filename = str(tmp_path / "c.wav")
+    with open(filename, "wb") as f:
+        f.write(b"not a wav file")
+    wav_info = read_wav_info(filename, 14, 1)
+    assert wav_info.error is not None
+    assert wav_info.sample_rate is None
+
+    # Canonical headers are validated too.
+    fmt = struct.pack("<HHIIHH", 1, 1, 8000, 16000, 2, 12)
+    data = b"WAVEfmt " + struct.pack("<I", 16) + fmt + b"data" + \
+        struct.pack("<I", 0)
+    filename = str(tmp_path / "d.wav")
+    with open(filename, "wb") as f:
+        f.write(b"RIFF" + struct.pack("<I", len(data)) + data)
+    wav_info = read_wav_info(filename, os.path.getsize(filename), 1)
+    assert wav_info.error is not None
+    assert wav_info.sample_rate is None
+
+    # Recordings cut off mid frame only count the whole frames, like WavFile.
+    filename = write_wav(tmp_path / "e.wav", [0] * 1000, channels=2)
+    with open(filename, "r+b") as f:
+        f.truncate(os.path.getsize(filename) - 1)
+    wav_info = read_wav_info(filename, os.path.getsize(filename), 1)
+    assert wav_info.duration == WavFile(filename).duration == 999 / 22050
+
+def test_rescan(tmp_path, write_wav):
+    root = tmp_path / "samples"
+    for i in range(20):
+        write_wav(str(root / f"dir{i % 4}" / "sub" / f"{i}.WAV"),
+                  [0] * (100 * i))
+    (root / "notes.txt").write_text("not a sample")
+    (root / "broken.wav").write_bytes(b"RIFF")
+
+    index_file = str(tmp_path / "index.json")
+    library = SampleLibrary(index_file)
+    library.scan([str(root)], workers=4)
+    assert len(library.entries) == 21
+    assert len(library) == 20
+    assert library.read == 21
+    assert library.get(str(root / "dir1" / "sub" / "5.WAV")).duration == \
+        500 / 22050
+    assert library.get(str(root / "broken.wav")).error is not None
+
+    # A fresh library loads the index, and only reads files that changed.
+    write_wav(str(root / "dir0" / "sub" / "4.WAV"), [0] * 50)
+    os.utime(root / "dir0" / "sub" / "4.WAV", ns=(0, 1))
+    os.remove(root / "dir3" / "sub" / "3.WAV")
+    write_wav(str(root / "new.wav"), [0] * 10)
+
+    library = SampleLibrary(index_file)
+    library.scan([str(root)])
+    assert library.read == 2
+    assert library.reused == 19
+    assert len(library) == 20
+    assert library.get(str(root / "dir0" / "sub" / "4.WAV")).duration == \
+        50 / 22050
+    assert library.get(str(root / "dir3" / "sub" / "3.WAV")) is None
+
+    # An outdated index is ignored.
+    with open(index_file, "w") as f:
+        json.dump({"version": 0, "files": {}}, f)
+    library = SampleLibrary(index_file)
+    assert len(library.entries) == 0
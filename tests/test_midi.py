@@ -0,0 +1,104 @@
+import numpy as np
+import pytest
+import struct
+
+from engine.tracks import CustomNotesTrack, TempoMap, read_midi
+from engine.tracks.midi import midi_to_freq
+from engine.waves import SquareNote
+
+def varlen(value):
+    data = [value & 0x7F]
+    value >>= 7
+    while value > 0:
+        data.append(0x80 | (value & 0x7F))
+        value >>= 7
+    return bytes(reversed(data))
+
+def write_midi(filename, tracks, division=480):
+    # tracks is a list of lists of (delta, event bytes).
+    with open(filename, "wb") as f:
+        f.write(b"MThd" + struct.pack(">IHHH", 6, 1, len(tracks), division))
+        for events in tracks:
+            data = b"".join(varlen(delta) + event for delta, event in events)
+            data += b"\x00\xff\x2f\x00"
+            f.write(b"MTrk" + struct.pack(">I", len(data)) + data)
+
+def test_tempo_map():
+    tempo_map = TempoMap([(0.0, 120.0), (4.0, 60.0), (6.0, 240.0)])
+    assert np.allclose(tempo_map.seconds([0.0, 2.0, 4.0, 5.0, 6.0, 10.0]),
+                       [0.0, 1.0, 2.0, 3.0, 4.0, 5.0])
+    assert tempo_map.seconds(1.0) == 0.5
+
+    with pytest.raises(ValueError):
+        TempoMap([])
+    with pytest.raises(ValueError):
+        TempoMap([(0.0, 0.0)])
+
+def test_midi_to_freq():
+    assert midi_to_freq(69) == 440.0
+    assert np.allclose(midi_to_freq([57, 81]), [220.0, 880.0])
+
+def test_read_midi(tmp_path):
+    filename = str(tmp_path / "song.mid")
+    write_midi(filename, [
+        # A conductor track which halves the tempo after 2 beats.
+        [(0, b"\xff\x51\x03\x07\xa1\x20"),
+         (960, b"\xff\x51\x03\x0f\x42\x40")],
+        [(0, b"\xff\x03\x04Lead"),
+         # A4 for a beat, then C5 and E5 on another channel with running
+         # status and a zero velocity note off.
+         (0, b"\x90\x45\x64"),
+         (480, b"\x80\x45\x00"),
+         (0, b"\x91\x48\x64"),
+         (0, b"\x4c\x64"),
+         (960, b"\x48\x00"),
+         # A sysex message cancels the running status.
+         (0, b"\xf0\x02\x7e\xf7"),
+         (480, b"\x81\x4c\x00"),
+         # A note which is never released.
+         (0, b"\x90\x40\x64"),
+         (240, b"\xc0\x05")],
+    ])
+
+    tracks = read_midi(filename, sample_rate=1000, instrument=SquareNote)
+    assert [track.name for track in tracks] == \
+        ["Lead (channel 1)", "Lead (channel 2)"]
+    assert all(isinstance(track, CustomNotesTrack) for track in tracks)
+    assert tracks[0].tempo == 120.0
+
+    # The first two beats are at 120 BPM, and the rest at 60 BPM.
+    lead = [(wave.time, wave.waveform.num_samples, wave.waveform.freq)
+            for wave in tracks[0].waveforms]
+    assert lead == [(0.0, 500, 440.0),
+                    (3.0, 500, pytest.approx(329.63, abs=0.01))]
+    chords = [(wave.time, wave.waveform.num_samples)
+              for wave in tracks[1].waveforms]
+    assert chords == [(0.5, 1500), (0.5, 2500)]
+    assert all(isinstance(wave.waveform, SquareNote)
+               for wave in tracks[1].waveforms)
+
+    # Notes appended by hand go after the imported ones.
+    assert tracks[0].offset == 3.5
+
+def test_read_midi_invalid(tmp_path):
+    filename = tmp_path / "song.mid"
+    filename.write_bytes(b"RIFF\x00\x00\x00\x06" + b"\x00" * 6)
+    with pytest.raises(ValueError):
+        read_midi(str(filename))
+
+@pytest.mark.parametrize("data, offset", [
+    # A delta time cut off after its first byte.
+    (b"\x00\x90\x45\x40\x81", 27),
+    # A note on cut off before its velocity.
+    (b"\x00\x90\x45", 25),
+    # Running status before any status byte.
+    (b"\x00\x45\x40", 23),
+    # A delta time longer than 4 bytes.
+    (b"\x80\x80\x80\x80\x00", 22),
+])
+def test_read_midi_malformed_track(tmp_path, data, offset):
+    filename = tmp_path / "song.mid"
+    filename.write_bytes(b"MThd" + struct.pack(">IHHH", 6, 1, 1, 480) +
+                         b"MTrk" + struct.pack(">I", len(data)) + data)
+    with pytest.raises(ValueError, match=f"at offset {offset} of"):
+        read_midi(str(filename))
@@ -1,6 +1,19 @@
-from engine.player import Player
-from engine.tracks import Track
-from engine.waves import Note
+import json
+import numpy as np
+import pytest
+import struct
+import wave
+
+from engine.player import Limiter, MemorySink, NullSink, PipeSink, Player, \
+    TeeSink, TrackCache
+from engine.player.buffer import RingBuffer, RenderWorker
+from engine.player.metrics import percentile
+import engine.player.player as player_module
+from engine.player.player import MIXER_FLOAT, MIXER_NUMPY, MIXER_PYTHON, \
+    WaveCollapser
+from engine.tracks import EventTrack, MergedTimeline, Track
+from engine.waves import NOTE_CACHE, Note, WavFile
+from engine.waves.notes import NOTES
 
 def test_play_an_a_sharp():
     # Queue an A#3 for 0.5 seconds.
@@ -10,7 +23,7 @@ def test_play_an_a_sharp():
     track = Track("")
     track.add_waveform(0.0, a_sharp_3)
 
-    player = Player([track], track.sample_rate)
+    player = Player([track], track.sample_rate, sink=NullSink())
     player.play()
 
 def test_play_a_scale():
@@ -26,7 +39,7 @@ def test_play_a_scale():
     track.add_waveform(1.2, Note("B5", 0.2))
     track.add_waveform(1.4, Note("C6", 0.2))
 
-    player = Player([track], track.sample_rate)
+    player = Player([track], track.sample_rate, sink=NullSink())
     player.play()
 
 def test_play_chords():
@@ -49,11 +62,477 @@ def test_play_chords():
     track.add_waveform(1.5, Note("E5", 0.5))
     track.add_waveform(1.5, Note("G5", 0.5))
 
-    player = Player([track], track.sample_rate, volume=0.2)
+    player = Player([track], track.sample_rate, volume=0.2, sink=NullSink())
     player.play()
 
 def test_empty_track():
     track = Track("")
 
+    player = Player([track], track.sample_rate, sink=NullSink())
+    player.play()
+
+def test_mixers_match():
+    # The vectorized mixer must produce the same frames as the reference.
+    track = Track("")
+    track.add_waveform(0.0, Note("C4", 0.5))
+    track.add_waveform(0.25, Note("E4", 0.5))
+    track.add_waveform(0.25, Note("G4", 1.5))
+    track.add_waveform(1.2, Note("C5", 0.3))
+
+    for sample_width in (8, 16, 24):
+        reference = WaveCollapser(track.waveforms,
+                                  track.sample_rate,
+                                  sample_width,
+                                  mixer=MIXER_PYTHON)
+        vectorized = WaveCollapser(track.waveforms,
+                                   track.sample_rate,
+                                   sample_width,
+                                   mixer=MIXER_NUMPY)
+
+        t = 0.0
+        while True:
+            expected = reference.collapse(t, 0.5, 0.8)
+            assert vectorized.collapse(t, 0.5, 0.8) == expected
+            if len(expected) == 0:
+                break
+            t += 0.5
+
+def test_reference_frames():
+    # Each voice is scaled and truncated around 0, and 8 bit frames are
+    # offset by 128 once, however many voices are summed.
+    track = Track("")
+    track.add_waveform(0.0, Note("A4", 0.1))
+    track.add_waveform(0.0, Note("A4", 0.1))
+
+    sine = np.sin(2 * np.pi * 440.0 * np.arange(100) / track.sample_rate)
+    for sample_width, dtype, multiplier, offset in ((8, "<u1", 127, 128),
+                                                    (16, "<i2", 32767, 0)):
+        voice = (0.5 * sine * multiplier).astype(np.int64)
+        expected = (2 * voice + offset).astype(dtype)
+        for mixer in (MIXER_PYTHON, MIXER_NUMPY):
+            wave_collapser = WaveCollapser(track.waveforms,
+                                           track.sample_rate,
+                                           sample_width,
+                                           mixer=mixer)
+            frames = wave_collapser.collapse_samples(0, 100, 0.5)
+            assert bytes(frames) == expected.tobytes(), (sample_width, mixer)
+
+def test_mixers_match_wav_file():
+    # A .wav file plays equally loud, and at the master volume, on every mixer.
+    track = Track("")
+    track.add_waveform(0.0, WavFile("songs/audio/StarWars60.wav"))
+    track.add_waveform(0.5, Note("A4", 0.5))
+
+    for volume in (0.5, 0.25):
+        mixed = {}
+        for mixer in (MIXER_PYTHON, MIXER_NUMPY, MIXER_FLOAT):
+            wave_collapser = WaveCollapser(track.waveforms,
+                                           track.sample_rate,
+                                           16,
+                                           mixer=mixer)
+            mixed[mixer] = np.frombuffer(
+                bytes(wave_collapser.collapse(0.0, 2.0, volume)),
+                dtype="<i2").astype(np.int64)
+
+        assert np.array_equal(mixed[MIXER_NUMPY], mixed[MIXER_PYTHON])
+        assert np.abs(mixed[MIXER_FLOAT] - mixed[MIXER_NUMPY]).max() <= 2
+        assert mixed[MIXER_FLOAT].max() == mixed[MIXER_NUMPY].max()
+
+def test_ring_buffer():
+    ring_buffer = RingBuffer(2)
+    assert ring_buffer.put(1)
+    assert ring_buffer.put(2)
+    assert ring_buffer.get() == 1
+    assert ring_buffer.put(3)
+    assert ring_buffer.get() == 2
+    assert ring_buffer.get() == 3
+
+    # Empty after playback started.
+    assert ring_buffer.get(timeout=0.01) is None
+    assert ring_buffer.underruns == 1
+
+    ring_buffer.close()
+    assert not ring_buffer.put(4)
+
+def test_render_worker():
+    track = Track("")
+    track.add_waveform(0.0, Note("C4", 0.5))
+    track.add_waveform(1.2, Note("E4", 1.5))
+
+    wave_collapser = WaveCollapser(track.waveforms, track.sample_rate, 16)
+    ring_buffer = RingBuffer(1)
+    worker = RenderWorker(wave_collapser, ring_buffer, 0.5, lambda: 0.5)
+    worker.start()
+
+    t = 0.0
+    samples = ring_buffer.get()
+    while samples is not None:
+        assert samples == wave_collapser.collapse(t, 0.5, 0.5)
+        t += 0.5
+        samples = ring_buffer.get()
+
+    worker.stop()
+    assert worker.error is None
+    assert t == 3.0
+
+def test_collapse_samples():
+    track = Track("")
+    track.add_waveform(0.0, Note("C4", 0.5))
+
+    wave_collapser = WaveCollapser(track.waveforms, track.sample_rate, 16)
+
+    # Blocks are always exactly the requested number of samples.
+    start_sample = 0
+    frames = wave_collapser.collapse_samples(start_sample, 100, 0.5)
+    while len(frames) > 0:
+        assert len(frames) == 200
+        start_sample += 100
+        frames = wave_collapser.collapse_samples(start_sample, 100, 0.5)
+
+    assert start_sample >= track.sample_rate * 0.5
+
+def test_invalid_block_size():
+    with pytest.raises(ValueError, match="block_size"):
+        Player([Track("")], 22050, block_size=8)
+
+def test_render_to_wav(tmp_path):
+    track = Track("")
+    track.add_waveform(0.0, Note("C4", 0.5))
+    track.add_waveform(0.25, Note("E4", 1.5))
+
+    for sample_width in (8, 16, 24):
+        filename = str(tmp_path / f"render_{sample_width}.wav")
+        player = Player([track], track.sample_rate, sample_width=sample_width)
+        player.render(filename)
+
+        wave_collapser = WaveCollapser(track.waveforms,
+                                       track.sample_rate,
+                                       sample_width)
+        expected = wave_collapser.collapse(0.0, 1.0, player.volume) + \
+            wave_collapser.collapse(1.0, 1.0, player.volume)
+
+        with wave.open(filename, "rb") as f:
+            assert f.getnchannels() == 1
+            assert f.getsampwidth() == sample_width / 8
+            assert f.getframerate() == track.sample_rate
+            assert f.readframes(f.getnframes()) == expected
+
+def test_parallel_render(tmp_path):
+    track = Track("")
+    for i in range(20):
+        track.add_waveform(i * 0.7, Note("C4", 0.5))
+        track.add_waveform(i * 0.9, Note("E4", 1.5))
+
     player = Player([track], track.sample_rate)
+    player.render(str(tmp_path / "sequential.wav"))
+    player.render(str(tmp_path / "parallel.wav"), workers=3)
+
+    with open(tmp_path / "sequential.wav", "rb") as sequential:
+        with open(tmp_path / "parallel.wav", "rb") as parallel:
+            assert sequential.read() == parallel.read()
+
+def test_render_metrics(tmp_path):
+    track = Track("")
+    track.add_waveform(0.0, Note("C4", 0.5))
+    track.add_waveform(0.25, Note("E4", 1.5))
+    track.add_waveform(0.25, Note("G4", 1.5))
+
+    metrics_file = str(tmp_path / "metrics.json")
+    player = Player([track], track.sample_rate, metrics_file=metrics_file)
+    player.render(str(tmp_path / "render.wav"))
+
+    chunks = list(player.metrics.chunks)
+    assert len(chunks) == 2
+    assert [chunk.voices for chunk in chunks] == [3, 2]
+    assert chunks[0].samples_mixed == 11025 + 2 * (22050 - 5512)
+    assert chunks[0].bytes_emitted == 2 * track.sample_rate
+    assert all(chunk.write_time is not None for chunk in chunks)
+    assert player.metrics.real_time_factor > 0.0
+    assert player.metrics.p99_latency >= player.metrics.p50_latency
+
+    with open(metrics_file) as f:
+        dumped = json.load(f)
+    assert dumped["summary"]["chunks"] == 2
+    assert len(dumped["chunks"]) == 2
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 50) == 0.0
+
+def test_sinks(tmp_path):
+    track = Track("")
+    track.add_waveform(0.0, Note("C4", 0.5))
+    track.add_waveform(0.25, Note("E4", 1.5))
+
+    wave_collapser = WaveCollapser(track.waveforms, track.sample_rate, 16)
+    expected = wave_collapser.collapse(0.0, 1.0, 0.5) + \
+        wave_collapser.collapse(1.0, 1.0, 0.5)
+
+    memory = MemorySink()
+    null = NullSink()
+    with open(tmp_path / "pipe.pcm", "wb") as f:
+        pipe = PipeSink(f.fileno())
+        player = Player([track],
+                        track.sample_rate,
+                        sink=TeeSink(memory, null, pipe))
+        player.play()
+
+    assert memory.getvalue() == expected
+    assert null.num_bytes == len(expected)
+    with open(tmp_path / "pipe.pcm", "rb") as f:
+        assert f.read() == expected
+
+def test_callback_mode():
+    track = Track("")
+    track.add_waveform(0.0, Note("C4", 0.5))
+
+    memory = MemorySink()
+    player = Player([track], track.sample_rate, block_size=256, sink=memory)
     player.play()
+
+    wave_collapser = WaveCollapser(track.waveforms, track.sample_rate, 16)
+    expected = b""
+    for start_sample in range(0, len(memory.getvalue()) // 2, 256):
+        expected += wave_collapser.collapse_samples(start_sample, 256, 0.5)
+
+    assert len(memory.getvalue()) % (2 * 256) == 0
+    assert memory.getvalue() == expected
+    assert player.latency == 256 / track.sample_rate
+
+def test_play_twice():
+    melody = Track("melody")
+    melody.add_waveform(0.0, Note("C5", 0.5))
+    bass = Track("bass")
+    bass.add_waveform(0.0, Note("C3", 1.5))
+
+    first = MemorySink()
+    second = MemorySink()
+    Player([melody, bass], melody.sample_rate, sink=first).play()
+    Player([melody, bass], melody.sample_rate, sink=second).play()
+
+    assert first.getvalue() == second.getvalue()
+    assert len(melody.waveforms) == 1
+
+def _freeze_track():
+    track = Track("Freeze")
+    track.add_waveform(0.0, Note("C5", 0.7))
+    track.add_waveform(0.5, Note("E5", 0.9))
+    track.add_waveform(1.2, Note("G5", 0.4))
+    return track
+
+def test_freeze_matches_unfrozen(tmp_path):
+    track = _freeze_track()
+    cache = TrackCache(str(tmp_path))
+
+    expected = MemorySink()
+    Player([track], track.sample_rate, sink=expected, lookahead=0).play()
+
+    frozen = MemorySink()
+    Player([track], track.sample_rate, sink=frozen, lookahead=0,
+           freeze_cache=cache).play()
+    assert frozen.getvalue() == expected.getvalue()
+    assert cache.misses == 1
+
+    # The second run loads the render from disk.
+    again = MemorySink()
+    Player([track], track.sample_rate, sink=again, lookahead=0,
+           freeze_cache=cache).play()
+    assert again.getvalue() == expected.getvalue()
+    assert cache.hits == 1
+    assert len(list(tmp_path.glob("*.pcm"))) == 1
+
+    # Float renders are frozen at full volume, so they can be played at any
+    # volume. Integer renders fall back to the original waves.
+    for mixer in (MIXER_FLOAT, MIXER_NUMPY):
+        frozen_track = cache.freeze(track, 16, 0.5, mixer=mixer)
+        frozen_collapser = WaveCollapser(list(frozen_track.waveforms),
+                                         track.sample_rate, 16, mixer=mixer)
+        collapser = WaveCollapser(list(track.waveforms),
+                                  track.sample_rate, 16, mixer=mixer)
+        assert bytes(frozen_collapser.collapse(0.0, 1.0, 0.25)) == \
+            bytes(collapser.collapse(0.0, 1.0, 0.25))
+
+def test_freeze_event_track_key(tmp_path):
+    cache = TrackCache(str(tmp_path))
+
+    def events(freq):
+        track = EventTrack("", sample_rate=1000)
+        track.add_notes([0, 250, 500], [400, 400, 400], [440.0, freq, 440.0])
+        return track
+
+    # Events are hashed from their arrays, and still change the key.
+    assert cache.key(events(330.0), 16, 0.5) == \
+        cache.key(events(330.0), 16, 0.5)
+    assert cache.key(events(330.0), 16, 0.5) != \
+        cache.key(events(220.0), 16, 0.5)
+
+    frozen = cache.freeze(events(330.0), 16, 0.5)
+    assert frozen.waveforms[0].waveform.duration == 0.9
+
+def test_freeze_cache_eviction(tmp_path):
+    track = _freeze_track()
+    cache = TrackCache(str(tmp_path), max_bytes=1)
+
+    cache.freeze(track, 16, 0.5, mixer=MIXER_NUMPY)
+    cache.freeze(track, 16, 0.25, mixer=MIXER_NUMPY)
+
+    # Only the most recent render is kept.
+    files = list(tmp_path.glob("*.pcm"))
+    assert len(files) == 1
+    assert files[0].name == \
+        cache.key(track, 16, 0.25, mixer=MIXER_NUMPY) + ".pcm"
+
+    # Tracks played together never evict each other's renders.
+    other = Track("Other")
+    other.add_waveform(0.0, Note("A4", 0.5))
+    expected = MemorySink()
+    Player([track, other], track.sample_rate, sink=expected).play()
+
+    frozen = MemorySink()
+    player = Player([track, other], track.sample_rate, sink=frozen,
+                    freeze_cache=cache)
+    player.play()
+    assert frozen.getvalue() == expected.getvalue()
+    assert len(list(tmp_path.glob("*.pcm"))) == 2
+
+def _loud_track():
+    track = Track("Loud")
+    for _ in range(6):
+        track.add_waveform(0.0, Note("A4", 1.0))
+    return track
+
+def test_float_mixer_clips():
+    # Six voices at full volume are far beyond full scale. The float bus must
+    # clip them rather than wrap around.
+    track = _loud_track()
+    wave_collapser = WaveCollapser(track.waveforms, track.sample_rate, 16)
+    samples = np.frombuffer(
+        bytes(wave_collapser.collapse(0.0, 1.0, 1.0)), dtype="<i2")
+
+    expected = np.sin(2 * np.pi * 440.0 * np.arange(track.sample_rate) /
+                      track.sample_rate)
+    loud = np.abs(expected) > 0.5
+    assert np.all(np.sign(samples[loud]) == np.sign(expected[loud]))
+    assert samples.max() == 32767
+
+def test_limiter():
+    track = _loud_track()
+    limiter = Limiter(ceiling=0.5, lookahead=0.005)
+    wave_collapser = WaveCollapser(track.waveforms,
+                                   track.sample_rate,
+                                   16,
+                                   limiter=limiter)
+
+    whole = bytes(wave_collapser.collapse(0.0, 1.0, 1.0))
+    samples = np.frombuffer(whole, dtype="<i2")
+    assert np.abs(samples).max() <= 0.5 * 32767 + 1
+
+    # The limiter keeps no state, so the chunk size doesn't matter.
+    halves = bytes(wave_collapser.collapse(0.0, 0.5, 1.0)) + \
+        bytes(wave_collapser.collapse(0.5, 0.5, 1.0))
+    assert halves == whole
+
+    with pytest.raises(ValueError, match="limiter"):
+        WaveCollapser(track.waveforms, track.sample_rate, 16,
+                      mixer=MIXER_NUMPY, limiter=limiter)
+
+def test_render_float(tmp_path):
+    track = Track("")
+    track.add_waveform(0.0, Note("C4", 0.5))
+
+    filename = str(tmp_path / "float.wav")
+    player = Player([track], track.sample_rate, sample_width=32)
+    player.render(filename)
+
+    with open(filename, "rb") as f:
+        data = f.read()
+    format_type, _, _, _, _, bit_width = struct.unpack_from("<HHIIHH", data, 20)
+    assert (format_type, bit_width) == (3, 32)
+
+    samples = np.frombuffer(data[44:], dtype="<f4")
+    assert len(samples) == track.sample_rate
+    assert np.allclose(samples[:11025],
+                       0.5 * track.waveforms[0].waveform.get_samples(0, 11025),
+                       atol=1e-6)
+    assert np.all(samples[11025:] == 0.0)
+
+    with pytest.raises(ValueError, match="float"):
+        WaveCollapser(track.waveforms, track.sample_rate, 32, mixer=MIXER_NUMPY)
+
+def test_oscillator_bank_matches_cache():
+    track = Track("")
+    for note in ("C4", "E4", "G4", "C5"):
+        track.add_waveform(0.1, Note(note, 1.7))
+
+    def render():
+        wave_collapser = WaveCollapser(track.waveforms, track.sample_rate, 16)
+        return np.concatenate([
+            np.frombuffer(bytes(wave_collapser.collapse_samples(i, 700, 0.5)),
+                          dtype="<i2")
+            for i in range(0, 2 * track.sample_rate, 700)
+        ])
+
+    # Notes already in the note cache are sliced from it.
+    for wave in track.waveforms:
+        wave.waveform.get_samples(0, 1)
+        assert wave.waveform.cached
+    cached = render()
+
+    # With a tiny note cache, the notes are synthesized on the oscillator bank
+    # a block at a time.
+    max_bytes = NOTE_CACHE.max_bytes
+    NOTE_CACHE.resize(1024)
+    try:
+        assert not track.waveforms[0].waveform.cacheable
+        synthesized = render()
+    finally:
+        NOTE_CACHE.resize(max_bytes)
+
+    assert np.abs(cached.astype(int) - synthesized).max() <= 1
+
+def test_oscillator_bank_renders_chords(monkeypatch):
+    track = Track("")
+    for note in ("C4", "E4", "G4"):
+        track.add_waveform(0.0, Note(note, 0.5))
+    NOTE_CACHE.clear()
+
+    # Every voice of a chord that isn't cached goes through one bank call.
+    calls = []
+    def sine_bank(freqs, *args):
+        calls.append(len(freqs))
+        return original(freqs, *args)
+    original = player_module.sine_bank
+    monkeypatch.setattr(player_module, "sine_bank", sine_bank)
+
+    wave_collapser = WaveCollapser(track.waveforms, track.sample_rate, 16)
+    bus = wave_collapser.mix_samples(0, 1000, 1.0)
+    assert calls == [3]
+    assert len(NOTE_CACHE) == 0
+
+    expected = sum(wave.waveform.get_samples(0, 1000)
+                   for wave in track.waveforms)
+    assert np.allclose(bus, expected, atol=1e-5)
+
+def test_event_track_matches_track():
+    # Events are placed in integer samples, but land in the same place as the
+    # same notes on a plain track.
+    events = EventTrack("", sample_rate=1000)
+    track = Track("", sample_rate=1000)
+    for i, note in enumerate(("C4", "E4", "G4", "C5", "E5")):
+        events.add_note(i * 0.25, 0.4, NOTES[note])
+        track.add_waveform(i * 0.25, Note(note, 0.4, sample_rate=1000))
+
+    for mixer in (MIXER_NUMPY, MIXER_FLOAT):
+        expected = WaveCollapser(track.waveforms, 1000, 16, mixer=mixer)
+        actual = WaveCollapser(MergedTimeline([events]), 1000, 16,
+                               mixer=mixer)
+        assert actual.end_time == expected.end_time
+        assert len(actual.active_at(0.3, 0.6)) == 3
+
+        # Chunks that start on a wave's start, where the float math is exact.
+        for i in range(0, 1500, 250):
+            assert actual.collapse_samples(i, 250, 0.5) == \
+                expected.collapse_samples(i, 250, 0.5)
+        assert actual.collapse(1.5, 0.5, 0.5) == []
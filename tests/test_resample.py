@@ -0,0 +1,153 @@
+import numpy as np
+import pytest
+
+from engine.player import MemorySink, Player
+from engine.player.player import MIXER_NUMPY, WaveCollapser
+from engine.tracks import MergedTimeline, Track
+from engine.waves import RESAMPLE_CACHE, Note, ResampledWave, WavFile, \
+    resample
+from engine.waves.resample import get_resampler
+
+def sine(freq, sample_rate, num_samples):
+    t = np.arange(num_samples) / sample_rate
+    return np.sin(2 * np.pi * freq * t).astype(np.float32)
+
+@pytest.mark.parametrize("to_rate", [44100, 48000, 16000, 11025])
+def test_resample_sine(to_rate):
+    samples = resample(sine(1000, 22050, 22050), 22050, to_rate)
+    assert len(samples) == to_rate
+    assert samples.dtype == np.float32
+
+    # Away from the edges, the sine is reconstructed at the new rate.
+    expected = sine(1000, to_rate, to_rate)
+    middle = slice(to_rate // 4, 3 * to_rate // 4)
+    assert np.abs(samples[middle] - expected[middle]).max() < 1e-4
+
+def test_resample_removes_aliases():
+    # 10kHz can't be represented at 16kHz, so it's filtered out instead of
+    # folding down to 6kHz.
+    samples = resample(sine(10000, 44100, 44100), 44100, 16000)
+    assert np.abs(samples[1000:-1000]).max() < 1e-3
+
+def test_resample_in_chunks():
+    samples = np.random.default_rng(1).uniform(-1, 1, 5000)
+    resampler = get_resampler(22050, 48000)
+    expected = resampler.resample(samples)
+
+    # Any range of outputs can be computed from just the inputs around it.
+    padded = np.concatenate((np.zeros(100), samples, np.zeros(100)))
+    for start_output, num_outputs in ((0, 100), (777, 1000), (10000, 884)):
+        first_input, end_input = resampler.input_range(start_output,
+                                                       num_outputs)
+        chunk = resampler.process(padded[first_input + 100:end_input + 100],
+                                  first_input,
+                                  start_output,
+                                  num_outputs)
+        assert np.allclose(
+            chunk, expected[start_output:start_output + num_outputs],
+            atol=1e-6)
+
+    with pytest.raises(ValueError, match="need inputs"):
+        resampler.process(samples[:100], 0, 0, 100)
+
+    with pytest.raises(ValueError, match="positive"):
+        resample(samples, 0, 22050)
+
+def test_resampled_wave(tmp_path, write_sine):
+    RESAMPLE_CACHE.clear()
+    wav_file = WavFile(write_sine(tmp_path / "sine.wav", 440, 11025,
+                                  sample_rate=11025))
+    wave = ResampledWave(wav_file, 22050)
+    assert wave.num_samples == 22050
+
+    # The whole conversion is cached, and shared by every use of the file.
+    samples = wave.get_samples(0, 22050)
+    assert not samples.flags.writeable
+    assert ResampledWave(wav_file, 22050).get_samples(100, 200) is not None
+    assert RESAMPLE_CACHE.stats()["hits"] == 1
+
+    # Waves too large for the cache convert each range on its own.
+    max_bytes = RESAMPLE_CACHE.max_bytes
+    RESAMPLE_CACHE.resize(1000)
+    try:
+        assert np.allclose(wave.get_samples(5000, 6000),
+                           samples[5000:6000],
+                           atol=1e-6)
+    finally:
+        RESAMPLE_CACHE.resize(max_bytes)
+
+    # Frames follow WavFile.get_frames(): scaled by the volume, and centered
+    # on 0 at every width.
+    expected = np.rint(samples[:100].astype(np.float64) * 32768)
+    assert np.array_equal(wave.get_frames(0, 100, 16, 1.0), expected)
+    assert np.array_equal(wave.get_frames(0, 100, 16, 0.5),
+                          (0.5 * expected).astype(np.int64))
+    assert np.array_equal(wave.get_frames(0, 100, 8, 1.0),
+                          np.rint(samples[:100] * 128))
+
+def test_track_resamples_wav_file(tmp_path, write_sine):
+    wav_file = WavFile(write_sine(tmp_path / "sine.wav", 440, 11025,
+                                  sample_rate=11025))
+
+    track = Track("", sample_rate=22050)
+    track.add_waveform(0.0, wav_file)
+    wave = track.waveforms[0].waveform
+    assert isinstance(wave, ResampledWave)
+    assert wave.sample_rate == 22050
+
+    # A resampled wave is converted from the original, not resampled twice.
+    other = Track("", sample_rate=11025)
+    other.add_waveform(0.0, wave)
+    assert other.waveforms[0].waveform is wav_file
+
+    with pytest.raises(ValueError):
+        track.add_waveform(0.0, Note("A4", 1.0, sample_rate=11025))
+
+def test_player_output_rate():
+    track = Track("")
+    track.add_waveform(0.0, Note("A4", 1.5))
+
+    # Render at the track's rate, then resample all of it at once.
+    memory = MemorySink()
+    Player([track], 22050, sample_width=32, sink=memory).play()
+    mixed = np.frombuffer(memory.getvalue(), dtype="<f4")
+    expected = resample(mixed, 22050, 48000)
+
+    # Resampling a chunk at a time on the way to the sink sounds the same.
+    memory = MemorySink()
+    player = Player([track],
+                    22050,
+                    sample_width=32,
+                    sink=memory,
+                    output_rate=48000)
+    player.play()
+    assert memory.sample_rate == 48000
+
+    played = np.frombuffer(memory.getvalue(), dtype="<f4")
+    assert len(played) == 2 * 48000
+    assert np.allclose(played[:len(expected)], expected, atol=1e-5)
+
+    # Callback mode pulls blocks at the output rate.
+    memory = MemorySink()
+    player = Player([track],
+                    22050,
+                    sample_width=32,
+                    sink=memory,
+                    block_size=480,
+                    output_rate=48000)
+    player.play()
+    played = np.frombuffer(memory.getvalue(), dtype="<f4")
+    assert len(played) % 480 == 0
+    assert np.allclose(played, expected[:len(played)], atol=1e-5)
+    assert player.latency == 480 / 48000
+
+    with pytest.raises(ValueError, match="resampling"):
+        WaveCollapser(track.waveforms, 22050, 16, mixer=MIXER_NUMPY,
+                      output_rate=48000)
+
+    # The tracks' rate can't be changed with sample_rate, which would only
+    # play them at the wrong speed.
+    with pytest.raises(ValueError, match="output_rate"):
+        Player([track], 48000, sink=MemorySink())
+    with pytest.raises(ValueError, match="output_rate"):
+        WaveCollapser(MergedTimeline([track]), 48000, 16)
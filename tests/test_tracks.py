@@ -1,11 +1,14 @@
 import pytest
+import random
 
-from engine.tracks import Track
-from engine.waves import Waveform
+from engine.tracks import CustomNotesTrack, EventStore, EventTrack, \
+    MergedTimeline, Track, WaveIndex
+from engine.waves import Note, SawNote, Waveform, WavetableNote
+from engine.waves.notes import NOTES
 
 class NoopWaveform(Waveform):
-    def __init__(self, index, sample_rate=22050):
-        super().__init__(1.0, sample_rate=sample_rate)
+    def __init__(self, index, sample_rate=22050, duration=1.0):
+        super().__init__(duration, sample_rate=sample_rate)
         self.index = index
 
     def __eq__(self, other):
@@ -53,3 +56,206 @@ def test_simultaneous_waveforms():
     track.add_waveform(0.0, wave_b)
 
     assert len(track.waveforms) == 2
+
+def test_wave_index_active_at():
+    rng = random.Random(1234)
+    track = Track("")
+    for i in range(500):
+        track.add_waveform(rng.uniform(0.0, 100.0),
+                           NoopWaveform(i, duration=rng.uniform(0.0, 10.0)))
+
+    index = WaveIndex(track.waveforms)
+    assert index.end_time == max(
+        wave.time + wave.waveform.duration for wave in track.waveforms)
+
+    for i in range(200):
+        t0 = rng.uniform(-5.0, 115.0)
+        t1 = t0 + rng.uniform(0.0, 5.0)
+        expected = [
+            wave for wave in track.waveforms
+            if wave.time < t1 and wave.time + wave.waveform.duration >= t0
+        ]
+        assert index.active_at(t0, t1) == expected
+
+def test_wave_index_empty():
+    index = WaveIndex([])
+    assert index.active_at(0.0, 1.0) == []
+    assert index.end_time < 0.0
+
+def test_merged_timeline():
+    track_a = Track("a")
+    track_b = Track("b")
+    track_a.add_waveform(0.0, NoopWaveform('a0'))
+    track_a.add_waveform(2.0, NoopWaveform('a2'))
+    track_b.add_waveform(1.0, NoopWaveform('b1'))
+    track_b.add_waveform(2.0, NoopWaveform('b2'))
+
+    timeline = MergedTimeline([track_a, track_b])
+    assert len(timeline) == 4
+    assert [wave.waveform.index for wave in timeline] == \
+        ['a0', 'b1', 'a2', 'b2']
+    assert [(track.name, wave.waveform.index)
+            for track, wave in timeline.items()] == \
+        [('a', 'a0'), ('b', 'b1'), ('a', 'a2'), ('b', 'b2')]
+
+    # Merging doesn't touch the tracks, so it can be repeated.
+    assert len(track_a.waveforms) == 2
+    assert len(MergedTimeline([track_a, track_b])) == 4
+
+def test_merged_timeline_mismatched_sample_rate():
+    with pytest.raises(ValueError):
+        MergedTimeline([Track("a", sample_rate=20000),
+                        Track("b", sample_rate=10000)])
+
+def test_event_store_sorts_on_read():
+    store = EventStore(1000)
+    store.extend([300, 100, 200], [10, 20, 30], [440.0, 220.0, 330.0])
+    store.append(100, 5, 110.0, instrument=SawNote)
+
+    assert len(store) == 4
+    waves = list(store)
+    # Events which start together keep the order they were added in.
+    assert [wave.time for wave in waves] == [0.1, 0.1, 0.2, 0.3]
+    assert [wave.waveform.freq for wave in waves] == \
+        [220.0, 110.0, 330.0, 440.0]
+    assert [type(wave.waveform) for wave in waves] == \
+        [Note, SawNote, Note, Note]
+    assert [wave.waveform.num_samples for wave in waves] == [20, 5, 30, 10]
+    assert store.end_sample == 310
+    assert store.end_time == 0.31
+
+def test_event_store_validation():
+    store = EventStore(1000)
+    with pytest.raises(ValueError):
+        store.append(-1, 10, 440.0)
+    with pytest.raises(ValueError):
+        store.extend([0, 1], [10], [440.0])
+    with pytest.raises(ValueError):
+        store.append(0, 10, 440.0, instrument=NoopWaveform)
+    assert len(store) == 0
+    assert store.end_time < 0.0
+
+def test_event_store_place():
+    rng = random.Random(1234)
+    store = EventStore(1000)
+    events = [(rng.randrange(0, 100000), rng.randrange(0, 5000))
+              for i in range(2000)]
+    for start, length in events:
+        store.append(start, length, 440.0)
+
+    for i in range(200):
+        s0 = rng.randrange(-1000, 110000)
+        n = rng.randrange(1, 3000)
+        expected = sorted(
+            (max(0, start - s0),
+             max(0, s0 - start),
+             min(length, max(0, s0 - start) + n - max(0, start - s0)))
+            for start, length in events
+            if start < s0 + n and start + length > s0)
+        placements = store.place(s0, n)
+        assert sorted(p[1:] for p in placements) == expected
+
+def test_event_store_long_events():
+    # A few events outlast the rest by far, and are found through the index
+    # rather than by scanning back to where they start.
+    rng = random.Random(4321)
+    store = EventStore(1000)
+    events = [(rng.randrange(0, 100000), rng.randrange(0, 50))
+              for i in range(5000)]
+    events += [(rng.randrange(0, 100000), rng.randrange(20000, 80000))
+               for i in range(5)]
+    for start, length in events:
+        store.append(start, length, 440.0)
+
+    for i in range(200):
+        s0 = rng.randrange(0, 180000)
+        n = rng.randrange(1, 500)
+        expected = sorted(
+            (start, length) for start, length in events
+            if start < s0 + n and start + length > s0)
+        indices = store.active(s0, s0 + n)
+        assert (indices[1:] > indices[:-1]).all()
+        assert sorted(zip(store._starts[indices].tolist(),
+                          store._lengths[indices].tolist())) == expected
+
+def test_event_store_indexing():
+    store = EventStore(1000)
+    store.extend([300, 100, 200], [10, 20, 30], [440.0, 220.0, 330.0])
+
+    assert store[0].time == 0.1
+    assert store[-1].waveform.freq == 440.0
+    assert [wave.time for wave in store[1:]] == [0.2, 0.3]
+    with pytest.raises(IndexError):
+        store[3]
+
+def test_concatenate_event_tracks():
+    a = EventTrack("a", sample_rate=1000)
+    a.add_note(0.5, 0.25, 440.0, instrument=SawNote)
+    b = EventTrack("b", sample_rate=1000)
+    b.add_note(0.0, 0.5, 220.0)
+    b.add_note(1.0, 0.5, 330.0, instrument=SawNote)
+
+    # The events are copied over, with their instruments.
+    a += b
+    assert [(wave.time, type(wave.waveform), wave.waveform.freq)
+            for wave in a.waveforms] == [(0.0, Note, 220.0),
+                                         (0.5, SawNote, 440.0),
+                                         (1.0, SawNote, 330.0)]
+    assert len(b.waveforms) == 2
+
+    with pytest.raises(ValueError):
+        a + EventTrack("", sample_rate=2000)
+
+def test_custom_notes_track():
+    track = CustomNotesTrack("", 120, sample_rate=1000)
+    track.append_note(1/3, "A4")
+    track.append_rest(1/3)
+    track.append_note(1/3, "C4")
+    track.append_note(1/3, "REST")
+
+    with pytest.raises(ValueError):
+        track.append_note(1, "H2")
+
+    assert isinstance(track.waveforms, EventStore)
+    waves = list(track.waveforms)
+    assert [round(wave.time * 1000) for wave in waves] == [0, 333, 500]
+    assert [wave.waveform.num_samples for wave in waves] == [167, 167, 167]
+    assert waves[0].waveform.freq == NOTES["A4"]
+
+    # Only notes can be added to an event track.
+    with pytest.raises(ValueError):
+        track.add_waveform(0.0, NoopWaveform('a', sample_rate=1000))
+
+    # Concatenating copies the events.
+    other = Track("", sample_rate=1000)
+    other.add_waveform(2.0, Note("E4", 0.5, sample_rate=1000))
+    track += other
+    assert len(track.waveforms) == 4
+    assert track.waveforms.end_sample == 2500
+
+    # Notes that can't be recreated from their class are rejected up front.
+    with pytest.raises(ValueError, match="Subclass WavetableNote"):
+        track.add_waveform(0.0, WavetableNote("A4", 0.5, sample_rate=1000,
+                                              shape="square"))
+    track.add_waveform(0.0, SawNote("A4", 0.5, sample_rate=1000))
+    assert len(track.waveforms) == 5
+
+    # Notes land on the nearest samples at both ends.
+    events = EventTrack("", sample_rate=1000)
+    events.add_note(0.0004, 0.0017, NOTES["A4"])
+    assert events.waveforms.end_sample == 2
+
+def test_concatenate_mixed_tracks():
+    notes = CustomNotesTrack("Notes", 120, sample_rate=1000)
+    notes.append_note(1, "A4")
+    audio = Track("Audio", sample_rate=1000)
+    audio.add_waveform(0.25, NoopWaveform('a', sample_rate=1000))
+
+    # Events can't hold other waves, so both go into a plain Track.
+    for mixed in (notes + audio, sum([notes, audio])):
+        assert type(mixed) is Track
+        assert [wave.time for wave in mixed.waveforms] == [0.0, 0.25]
+    assert len(notes.waveforms) == 1
+
+    with pytest.raises(ValueError):
+        notes + Track("", sample_rate=2000)
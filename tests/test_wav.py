@@ -1,8 +1,250 @@
-from engine.waves import WavFile
+import io
+import numpy as np
+import pickle
+import pytest
+import struct
+
+from engine.player.player import MIXER_FLOAT, MIXER_NUMPY, MIXER_PYTHON, \
+    WaveCollapser
+from engine.tracks import Track
+from engine.waves import WavFile, WavReader, WavWriter
+from engine.waves.codecs import G711_TABLES, WAVE_FORMAT_ALAW, \
+    WAVE_FORMAT_MULAW, convert_bit_depth
+from engine.waves.riff import RiffReader
 
 def test_parse_star_wars():
     star_wars_file = "songs/audio/StarWars60.wav"
     wav = WavFile(star_wars_file)
 
     # Let's just assert that it doesn't crash for now.
-    wav.get_frames(0, 22050, 16, 0.2)
\ No newline at end of file
+    wav.get_frames(0, 22050, 16, 0.2)
+
+def test_memory_mapped_frames():
+    star_wars_file = "songs/audio/StarWars60.wav"
+    mapped = WavFile(star_wars_file, memory_map=True)
+    loaded = WavFile(star_wars_file, memory_map=False)
+
+    mapped_frames = mapped.get_frames(1000, 23050, 16, 0.2)
+    loaded_frames = loaded.get_frames(1000, 23050, 16, 0.2)
+    assert list(mapped_frames) == list(loaded_frames)
+
+    # Spot check against decoding each sample individually.
+    for i in (0, 1, 5000, 22049):
+        raw = loaded.wav_file.read_signed_int(
+            loaded.data_offset + (1000 + i) * 2, 2)
+        assert mapped_frames[i] == int(0.2 * raw)
+
+def test_read_signed_ints():
+    star_wars_file = "songs/audio/StarWars60.wav"
+    wav = WavFile(star_wars_file)
+
+    # 24-bit ints are assembled from their bytes.
+    ints = wav.wav_file.read_signed_ints(5000, 3, 100)
+    for i in range(len(ints)):
+        assert ints[i] == wav.wav_file.read_signed_int(5000 + 3 * i, 3)
+
+def test_pickle():
+    star_wars_file = "songs/audio/StarWars60.wav"
+    wav = WavFile(star_wars_file)
+    copy = pickle.loads(pickle.dumps(wav))
+
+    assert list(copy.get_frames(0, 1000, 16, 0.2)) == \
+        list(wav.get_frames(0, 1000, 16, 0.2))
+
+class Pipe(object):
+    """
+    A non-seekable stream which returns short reads, like a pipe.
+    """
+
+    def __init__(self, data, max_read=1000):
+        self.data = io.BytesIO(data)
+        self.max_read = max_read
+
+    def read(self, size=-1):
+        return self.data.read(min(size, self.max_read))
+
+    def seekable(self):
+        return False
+
+def make_wav(chunks):
+    data = b"WAVE" + b"".join(
+        chunk_id + struct.pack("<I", len(body)) + body +
+        b"\x00" * (len(body) & 1)
+        for chunk_id, body in chunks)
+    return b"RIFF" + struct.pack("<I", len(data)) + data
+
+def test_extra_chunks(tmp_path):
+    samples = np.arange(-500, 500, dtype="<i2")
+    fmt = struct.pack("<HHIIHH", 1, 1, 8000, 16000, 2, 16)
+    filename = tmp_path / "chunks.wav"
+    filename.write_bytes(make_wav([
+        (b"LIST", b"INFOISFT\x03\x00\x00\x00abc\x00"),
+        (b"fmt ", fmt),
+        (b"fact", b"\x00\x00\x00"),
+        (b"data", samples.tobytes()),
+    ]))
+
+    for memory_map in (False, True):
+        wav = WavFile(str(filename), memory_map=memory_map)
+        assert wav.sample_rate == 8000
+        assert wav.num_samples == 1000
+
+        # The whole file can be read, up to the last sample.
+        assert list(wav._read_ints(0, 1000)) == list(samples)
+        assert wav.get_samples(999, 1000)[0] == 499 / 32768
+
+    # The fmt chunk has to come first.
+    filename.write_bytes(make_wav([(b"data", b""), (b"fmt ", fmt)]))
+    with pytest.raises(ValueError):
+        WavFile(str(filename))
+
+def test_stream_from_pipe(tmp_path):
+    filename = str(tmp_path / "out.wav")
+    samples = np.arange(-3000, 3000, 3, dtype="<i2")
+    with WavWriter(filename, 8000, 16) as writer:
+        writer.write(samples.tobytes())
+
+    with open(filename, "rb") as f:
+        data = f.read()
+
+    # The data size is unknown, and the recording was cut off partway through
+    # a frame.
+    data = data[:40] + struct.pack("<I", 0xFFFFFFFF) + data[44:-1]
+    for source in (Pipe(data), io.BytesIO(data)):
+        with WavReader(source, block_size=300) as reader:
+            assert reader.data_size is None
+            blocks = list(reader.samples())
+        assert [len(block) for block in blocks] == [300] * 6 + [199]
+        assert np.array_equal(np.concatenate(blocks) * 32768, samples[:-1])
+
+    with WavReader(filename, block_size=512) as reader:
+        assert reader.data_size == len(samples) * 2
+        assert b"".join(reader.blocks()) == samples.tobytes()
+
+def test_writer_pads_odd_chunks(tmp_path):
+    filename = str(tmp_path / "odd.wav")
+    with WavWriter(filename, 8000, 8) as writer:
+        writer.write(b"\x80\x81\x82")
+
+    # The pad byte is counted in the RIFF size, but not in the data size.
+    with open(filename, "rb") as f:
+        data = f.read()
+    assert len(data) == 44 + 4
+    assert struct.unpack_from("<I", data, 4)[0] == len(data) - 8
+    assert struct.unpack_from("<I", data, 40)[0] == 3
+    assert list(WavFile(filename).get_frames(0, 3, 8, 1.0)) == [0, 1, 2]
+
+def test_riff_reader():
+    data = make_wav([(b"odd ", b"abc"), (b"next", b"de")])
+    for source in (Pipe(data, max_read=3), io.BytesIO(data)):
+        reader = RiffReader(source, b"WAVE")
+        chunks = [(chunk.chunk_id, chunk.offset, chunk.size)
+                  for chunk in reader.chunks()]
+        # Odd chunks are padded to an even size.
+        assert chunks == [(b"odd ", 20, 3), (b"next", 32, 2)]
+
+    with pytest.raises(ValueError):
+        RiffReader(io.BytesIO(data), b"AVI ")
+
+def test_g711_tables():
+    mulaw = G711_TABLES[WAVE_FORMAT_MULAW]
+    assert [mulaw[code] for code in (0xFF, 0x7F, 0x80, 0x00, 0xEF)] == \
+        [0, 0, 32124, -32124, 132]
+
+    alaw = G711_TABLES[WAVE_FORMAT_ALAW]
+    assert [alaw[code] for code in (0xD5, 0x55, 0xAA, 0x2A)] == \
+        [8, -8, 32256, -32256]
+
+def test_convert_bit_depth():
+    samples = np.array([-32768, -3, 0, 127, 32767])
+    assert list(convert_bit_depth(samples, 16, 24)) == \
+        [-8388608, -768, 0, 32512, 8388352]
+    # Narrowing rounds, and clips at full scale.
+    assert list(convert_bit_depth(samples, 16, 8)) == [-128, 0, 0, 0, 127]
+
+def test_formats(tmp_path):
+    floats = np.linspace(-1.0, 0.75, 8).astype("<f4")
+    ints = np.rint(floats.astype(np.float64) * 32768).astype(np.int64)
+    fmt = struct.pack("<HHIIHH", 3, 1, 8000, 32000, 4, 32)
+    codes = np.array([0xFF, 0x80, 0x00, 0xEF], dtype=np.uint8)
+
+    # A 24-bit sample in a 32-bit container, as WAVE_FORMAT_EXTENSIBLE.
+    extensible = struct.pack("<HHIIHHHHI", 0xFFFE, 1, 8000, 32000, 4, 32,
+                             22, 24, 4) + b"\x01\x00" + \
+        b"\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71"
+    extensible_data = (ints << 16).astype("<i4")
+
+    files = {
+        "float": ([(b"fmt ", fmt), (b"data", floats.tobytes())],
+                  floats),
+        "double": ([(b"fmt ", struct.pack("<HHIIHH", 3, 1, 8000, 64000, 8,
+                                          64)),
+                    (b"data", floats.astype("<f8").tobytes())],
+                   floats),
+        "mulaw": ([(b"fmt ", struct.pack("<HHIIHH", 7, 1, 8000, 8000, 1, 8)),
+                   (b"data", codes.tobytes())],
+                  np.array([0, 32124, -32124, 132]) / 32768),
+        "extensible": ([(b"fmt ", extensible),
+                        (b"data", extensible_data.tobytes())],
+                       ints / 32768),
+    }
+
+    for name, (chunks, expected) in files.items():
+        filename = tmp_path / f"{name}.wav"
+        filename.write_bytes(make_wav(chunks))
+        wav = WavFile(str(filename))
+
+        samples = wav.get_samples(0, wav.num_samples)
+        assert samples.dtype == np.float32
+        assert np.allclose(samples, expected), name
+
+        # Frames are converted to any integer bit width.
+        expected_16 = np.rint(np.asarray(expected, dtype=np.float64) * 32768)
+        assert list(wav.get_frames(0, wav.num_samples, 16, 1.0)) == \
+            list(expected_16.astype(np.int64)), name
+        with WavReader(str(filename)) as reader:
+            assert np.array_equal(np.concatenate(list(reader.samples())),
+                                  samples)
+
+    # The float mixer output of WavWriter can be read back.
+    filename = str(tmp_path / "writer.wav")
+    with WavWriter(filename, 8000, 32) as writer:
+        writer.write(floats.tobytes())
+    assert np.array_equal(WavFile(filename).get_samples(0, 8), floats)
+
+    filename = tmp_path / "adpcm.wav"
+    filename.write_bytes(make_wav([
+        (b"fmt ", struct.pack("<HHIIHH", 2, 1, 8000, 4000, 256, 4)),
+        (b"data", b"")]))
+    with pytest.raises(ValueError):
+        WavFile(str(filename))
+
+def test_bit_depth_conversion():
+    star_wars_file = "songs/audio/StarWars60.wav"
+    wav = WavFile(star_wars_file)
+    raw = wav._read_ints(0, 1000).astype(np.int64)
+
+    frames = wav.get_frames(0, 1000, 24, 1.0)
+    assert list(frames) == list(raw << 8)
+
+def test_8_bit_frames(tmp_path):
+    # Silence is 0x80 at 8 bits, whatever the width of the file.
+    for bit_width, dtype, silence in ((16, "<i2", 0), (8, "<u1", 128)):
+        filename = str(tmp_path / f"silence_{bit_width}.wav")
+        with WavWriter(filename, 22050, bit_width) as writer:
+            writer.write(np.full(100, silence, dtype=dtype).tobytes())
+
+        track = Track("")
+        track.add_waveform(0.0, WavFile(filename))
+        for mixer in (MIXER_PYTHON, MIXER_NUMPY, MIXER_FLOAT):
+            wave_collapser = WaveCollapser(track.waveforms, 22050, 8,
+                                           mixer=mixer)
+            assert bytes(wave_collapser.collapse_samples(0, 100, 0.5)) == \
+                b"\x80" * 100, (bit_width, mixer)
+
+    # Frames are centered on 0, and the mixers add 0x80 once. Full scale 16
+    # bit samples are scaled down to 8 bits.
+    filename = str(tmp_path / "full_scale.wav")
+    with WavWriter(filename, 22050, 16) as writer:
+        writer.write(np.array([32767, -32768], dtype="<i2").tobytes())
+    assert list(WavFile(filename).get_frames(0, 2, 8, 1.0)) == [127, -128]
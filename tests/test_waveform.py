@@ -1,6 +1,9 @@
+import math
+import numpy as np
 import pytest
 
-from engine.waves import Note
+from engine.waves import LRUCache, NOTE_CACHE, Note, sine_bank
+from engine.waves.sample import get_sampler_from_width
 
 def test_invalid_note():
     with pytest.raises(ValueError, match="is not a valid note."):
@@ -42,3 +45,87 @@ def test_get_samples():
         match="greater than the total number of samples"
     ):
         note.get_samples(0, note.num_samples + 1)
+
+def test_frames_match_per_sample_conversion():
+    sampler = get_sampler_from_width(16)
+    note = Note("A4", 0.1, sample_rate=8000)
+
+    frames = note.get_frames(10, 700, 16, 0.3)
+    for i in range(len(frames)):
+        t = 10 + i
+        sample = math.sin(2 * math.pi * note.freq * t / note.sample_rate)
+        assert frames[i] == sampler.convert(sample * 0.3)
+
+def test_note_cache_hits():
+    NOTE_CACHE.clear()
+
+    Note("C4", 0.5).get_frames(0, 100, 16, 0.5)
+    Note("C4", 0.5).get_frames(100, 200, 16, 0.5)
+    assert NOTE_CACHE.misses == 1
+    assert NOTE_CACHE.hits == 1
+
+    # A different pitch, width or volume is a different buffer.
+    Note("D4", 0.5).get_frames(0, 100, 16, 0.5)
+    Note("C4", 0.5).get_frames(0, 100, 8, 0.5)
+    Note("C4", 0.5).get_frames(0, 100, 16, 0.6)
+    assert NOTE_CACHE.misses == 4
+    assert len(NOTE_CACHE) == 4
+
+def test_lru_cache_eviction():
+    cache = LRUCache(300)
+    cache.put("a", np.zeros(100, dtype=np.uint8))
+    cache.put("b", np.zeros(100, dtype=np.uint8))
+    cache.put("c", np.zeros(100, dtype=np.uint8))
+
+    # Touch "a" so that "b" is the least recently used.
+    assert cache.get("a") is not None
+    cache.put("d", np.zeros(100, dtype=np.uint8))
+
+    assert "b" not in cache
+    assert "a" in cache
+    assert cache.evictions == 1
+    assert cache.num_bytes == 300
+
+    # Buffers larger than the ceiling are never cached.
+    cache.put("e", np.zeros(301, dtype=np.uint8))
+    assert "e" not in cache
+
+    cache.resize(100)
+    assert len(cache) == 1
+    assert cache.get("d") is not None
+
+def test_quantize():
+    values = np.array([-2.0, -1.0, 0.0, 0.5, 1.0, 2.0])
+
+    assert list(get_sampler_from_width(8).quantize(values)) == \
+        [0, 1, 128, 192, 255, 255]
+    assert list(get_sampler_from_width(16).quantize(values)) == \
+        [-32768, -32767, 0, 16384, 32767, 32767]
+    assert list(get_sampler_from_width(24).quantize(values))[-1] == \
+        (1 << 23) - 1
+    assert list(get_sampler_from_width(32).quantize(values)) == \
+        [-1.0, -1.0, 0.0, 0.5, 1.0, 1.0]
+
+def test_sine_bank():
+    notes = [Note("C4", 1.0), Note("E4", 1.0), Note("G4", 1.0)]
+    freqs = [note.freq for note in notes]
+
+    # Voices land at different offsets and start partway into their notes.
+    bus = sine_bank(freqs, [0, 100, 250], [0, 5000, 17], [1000, 5900, 767],
+                    22050, 1000)
+    expected = np.zeros(1000)
+    for note, offset, start, end in zip(notes,
+                                        [0, 100, 250],
+                                        [0, 5000, 17],
+                                        [1000, 5900, 767]):
+        expected[offset:offset + end - start] += note._sine(start, end)
+    assert np.allclose(bus, expected, atol=1e-5)
+
+    # Phase carries across chunk boundaries without any state.
+    whole = sine_bank(freqs, [0, 0, 0], [0, 0, 0], [800, 800, 800], 22050, 800)
+    first = sine_bank(freqs, [0, 0, 0], [0, 0, 0], [300, 300, 300], 22050, 300)
+    second = sine_bank(freqs, [0, 0, 0], [300, 300, 300], [800, 800, 800],
+                       22050, 500)
+    assert np.allclose(np.concatenate([first, second]), whole, atol=1e-5)
+
+    assert np.all(sine_bank([], [], [], [], 22050, 10) == 0.0)
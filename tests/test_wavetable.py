@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+from engine.player.player import WaveCollapser
+from engine.tracks import Track
+from engine.waves import Note, SawNote, SquareNote, TriangleNote, WavetableNote
+from engine.waves.wavetable import TABLE_SIZE, get_table
+
+def test_tables_are_shared():
+    # A4 and B4 are in the same octave, A5 is not.
+    assert SawNote("A4", 0.1).table is SawNote("B4", 0.1).table
+    assert SawNote("A4", 0.1).table is not SawNote("A5", 0.1).table
+    assert SawNote("A4", 0.1).table is not SquareNote("A4", 0.1).table
+
+def test_tables_are_band_limited():
+    sample_rate = 22050
+    for shape in ("square", "saw", "triangle"):
+        for freq in (30.0, 440.0, 3000.0):
+            table = get_table(shape, freq, sample_rate)
+            assert len(table) == TABLE_SIZE + 1
+            assert table[-1] == table[0]
+            assert np.abs(table).max() == pytest.approx(1.0)
+
+            # No harmonic of a note in this octave may reach Nyquist.
+            spectrum = np.abs(np.fft.rfft(table[:-1]))
+            highest = np.nonzero(spectrum > 1e-6 * spectrum.max())[0].max()
+            assert highest * freq < sample_rate / 2
+
+def test_shapes():
+    # A cycle of exactly 100 samples lands on every table entry it uses.
+    sample_rate = 22050
+    note = TriangleNote("A4", 1.0, sample_rate=sample_rate)
+    note.freq = sample_rate / 100
+
+    samples = note.get_samples(0, 300)
+    assert np.allclose(samples[:100], samples[100:200], atol=1e-6)
+    assert samples[25] == pytest.approx(1.0, abs=0.01)
+    assert samples[75] == pytest.approx(-1.0, abs=0.01)
+
+    # Square waves spend most of the cycle near full scale.
+    square = SquareNote("A2", 1.0).get_samples(0, 22050)
+    assert np.mean(np.abs(square) > 0.9) > 0.8
+
+    with pytest.raises(ValueError, match="shape"):
+        WavetableNote("A4", 1.0, shape="noise")
+
+def test_wavetable_notes_mix():
+    track = Track("")
+    track.add_waveform(0.0, Note("A4", 0.5))
+    track.add_waveform(0.0, SawNote("A4", 0.5))
+
+    # Notes of the same pitch with different shapes must not share cached
+    # samples or frames.
+    note, saw = [wave.waveform for wave in track.waveforms]
+    assert not np.allclose(note.get_samples(0, 100), saw.get_samples(0, 100))
+    assert not np.array_equal(note.get_frames(0, 100, 16, 0.5),
+                              saw.get_frames(0, 100, 16, 0.5))
+
+    wave_collapser = WaveCollapser(track.waveforms, track.sample_rate, 16)
+    samples = np.frombuffer(bytes(wave_collapser.collapse(0.0, 0.5, 0.5)),
+                            dtype="<i2")
+    expected = 0.5 * (note.get_samples(0, 11025) + saw.get_samples(0, 11025))
+    assert np.abs(samples / 32767 - expected).max() < 1e-3